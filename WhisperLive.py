@@ -1,13 +1,3086 @@
+import io
 import os
+import abc
+import re
+import json
+import sys
+import stat
 import time
+import random
 import wave
 import pyaudio
 import requests
 import threading
-import tempfile
+import bisect
+import math
+import subprocess
+import collections
+import contextlib
 import argparse
+import http.server
+import email.utils
 import numpy as np
 from pydub import AudioSegment
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # HTTP/2 を使用する場合のみ必要（任意）
+except ImportError:
+    httpx = None
+
+try:
+    import fcntl  # プロセス間でレート制限を共有する場合のみ使用（Windows には無い）
+except ImportError:
+    fcntl = None
+
+# Whisper API のベースURLとエンドポイント
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+TRANSCRIPTIONS_PATH = "/audio/transcriptions"
+DEFAULT_API_URL = DEFAULT_API_BASE + TRANSCRIPTIONS_PATH
+
+
+def transcriptions_url(api_base=None):
+    """
+    APIのベースURLから transcriptions エンドポイントのURLを作成します
+    
+    引数:
+        api_base (str, optional): ベースURL（例: http://127.0.0.1:8000/v1）.
+            未指定時は環境変数 OPENAI_BASE_URL、それもなければ OpenAI のURL
+    
+    返値:
+        str: transcriptions エンドポイントのURL
+    """
+    api_base = api_base or os.environ.get('OPENAI_BASE_URL') or DEFAULT_API_BASE
+    return api_base.rstrip('/') + TRANSCRIPTIONS_PATH
+
+########################################################################
+# アップロード用コーデック
+########################################################################
+class AudioCodec(abc.ABC):
+    """
+    アップロード用音声コーデックの基底クラス
+    
+    PCMデータ（16bit リトルエンディアン）をメモリ上でエンコードし、
+    Whisper APIに送信できる形式のバイト列を返します。
+    
+    Attributes:
+        name (str): コーデック名（--upload_codec で指定する値）
+        extension (str): ファイル拡張子（APIはこの拡張子で形式を判別します）
+        mime_type (str): MIMEタイプ
+    """
+    name = None
+    extension = None
+    mime_type = None
+    
+    @property
+    def filename(self):
+        """multipartに記載するファイル名"""
+        return f"segment.{self.extension}"
+    
+    @abc.abstractmethod
+    def encode(self, pcm_data, sample_rate, channels=1, sample_width=2):
+        """
+        PCMデータをエンコードします
+        
+        引数:
+            pcm_data (bytes-like): PCMデータ
+            sample_rate (int): サンプリングレート
+            channels (int, optional): チャンネル数
+            sample_width (int, optional): サンプルあたりのバイト数
+        
+        返値:
+            bytes: エンコード済みの音声データ
+        """
+
+
+class WavCodec(AudioCodec):
+    """非圧縮WAVコーデック（外部プロセス不要でエンコードコストがほぼゼロ）"""
+    name = 'wav'
+    extension = 'wav'
+    mime_type = 'audio/wav'
+    
+    def encode(self, pcm_data, sample_rate, channels=1, sample_width=2):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(sample_width)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm_data)
+        return buffer.getvalue()
+
+
+class FfmpegCodec(AudioCodec):
+    """
+    ffmpegを標準入出力のパイプで起動してエンコードするコーデック
+    
+    ディスクへの書き込みは発生しませんが、セグメントごとにffmpegプロセスを起動します。
+    """
+    output_args = []
+    
+    def encode(self, pcm_data, sample_rate, channels=1, sample_width=2):
+        command = [
+            AudioSegment.converter, '-hide_banner', '-loglevel', 'error',
+            '-f', f's{sample_width * 8}le', '-ar', str(sample_rate), '-ac', str(channels),
+            '-i', 'pipe:0'
+        ] + self.output_args + ['pipe:1']
+        result = subprocess.run(command, input=pcm_data,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"{self.name}エンコードに失敗しました: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+
+class FlacCodec(FfmpegCodec):
+    """可逆圧縮FLACコーデック（WAVのおよそ半分のサイズ）"""
+    name = 'flac'
+    extension = 'flac'
+    mime_type = 'audio/flac'
+    output_args = ['-c:a', 'flac', '-f', 'flac']
+
+
+class OpusCodec(FfmpegCodec):
+    """Opus (Ogg) コーデック（最小サイズ。低速回線での長いセグメント向け）"""
+    name = 'opus'
+    extension = 'ogg'
+    mime_type = 'audio/ogg'
+    output_args = ['-c:a', 'libopus', '-b:a', '24k', '-application', 'voip', '-f', 'ogg']
+
+
+class Mp3Codec(FfmpegCodec):
+    """MP3コーデック（従来の既定）"""
+    name = 'mp3'
+    extension = 'mp3'
+    mime_type = 'audio/mpeg'
+    output_args = ['-f', 'mp3']
+
+
+# --upload_codec で指定できるコーデック
+UPLOAD_CODECS = {codec.name: codec for codec in (WavCodec, FlacCodec, OpusCodec, Mp3Codec)}
+
+
+class _LinearEstimate:
+    """
+    y = intercept + slope * x を指数的に忘却しながらオンラインで推定します
+    
+    エンコード時間（プロセス起動の固定コスト + 音声長に比例するコスト）や、
+    APIの応答時間（サーバー側の処理時間 + ペイロードサイズに比例するアップロード時間）の推定に使用します。
+    """
+    def __init__(self, intercept, slope, decay=0.9):
+        self.intercept = intercept
+        self.slope = slope
+        self.decay = decay
+        self._sw = self._sx = self._sy = self._sxx = self._sxy = 0.0
+    
+    def update(self, x, y):
+        d = self.decay
+        self._sw = self._sw * d + 1.0
+        self._sx = self._sx * d + x
+        self._sy = self._sy * d + y
+        self._sxx = self._sxx * d + x * x
+        self._sxy = self._sxy * d + x * y
+        
+        mean_x = self._sx / self._sw
+        mean_y = self._sy / self._sw
+        var_x = self._sxx / self._sw - mean_x * mean_x
+        if var_x > 1e-6:
+            self.slope = max(0.0, (self._sxy / self._sw - mean_x * mean_y) / var_x)
+            self.intercept = max(0.0, mean_y - self.slope * mean_x)
+        else:
+            # 音声長がほぼ一定の場合は傾きを維持して切片のみ合わせる
+            self.intercept = max(0.0, mean_y - self.slope * mean_x)
+    
+    def predict(self, x):
+        return self.intercept + self.slope * x
+
+
+class AutoCodecSelector:
+    """
+    セグメントごとにエンド・ツー・エンドの遅延が最小になるコーデックを選択します
+    
+    各コーデックについて「エンコード時間」と「音声1秒あたりのサイズ」を実測値から推定し、
+    エンコード時間 + サイズ / アップロード帯域 が最小のものを選びます。
+    短いセグメントではWAV、低速回線での長いセグメントではOpusが選ばれやすくなります。
+    
+    Attributes:
+        upload_bandwidth (float): アップロード帯域の推定値（バイト/秒）
+    """
+    # 初期推定値: (固定コスト秒, 音声1秒あたりのエンコード秒, 音声1秒あたりのバイト数)
+    PRIORS = {
+        'wav': (0.0, 0.0005, 32000),
+        'flac': (0.03, 0.004, 18000),
+        'opus': (0.04, 0.01, 3200),
+        'mp3': (0.04, 0.008, 4000),
+    }
+    
+    def __init__(self, codec_names=None, upload_bandwidth=None, sample_rate=16000):
+        """
+        引数:
+            codec_names (list, optional): 選択対象のコーデック名. 既定は全コーデック
+            upload_bandwidth (float, optional): アップロード帯域（バイト/秒）. 未指定時は実測から推定
+            sample_rate (int, optional): サンプリングレート（WAVのサイズ推定に使用）
+        """
+        self.codecs = {name: UPLOAD_CODECS[name]() for name in (codec_names or UPLOAD_CODECS)}
+        self.fixed_bandwidth = upload_bandwidth is not None
+        # 既定は 10Mbps 相当から開始（低く見積もるとOpusばかりが選ばれ、大きなペイロードの実測が得られないため）
+        self.upload_bandwidth = upload_bandwidth or 1250000.0
+        # 応答時間 = サーバー側の処理時間（切片） + サイズ / 帯域（傾き）
+        self._response_estimate = _LinearEstimate(0.0, 1.0 / self.upload_bandwidth)
+        self._encode_estimates = {}
+        self._bytes_per_second = {}
+        for name in self.codecs:
+            intercept, slope, bytes_per_second = self.PRIORS.get(name, (0.05, 0.01, 8000))
+            if name == 'wav':
+                bytes_per_second = sample_rate * 2
+            self._encode_estimates[name] = _LinearEstimate(intercept, slope)
+            self._bytes_per_second[name] = float(bytes_per_second)
+        self._lock = threading.Lock()
+    
+    def estimate(self, name, duration):
+        """指定コーデックでの推定遅延（エンコード + アップロード, 秒）を返します"""
+        encode_time = self._encode_estimates[name].predict(duration)
+        upload_time = self._bytes_per_second[name] * duration * self._response_estimate.slope
+        return encode_time + upload_time
+    
+    def select(self, duration):
+        """
+        セグメント長に対して推定遅延が最小のコーデックを返します
+        
+        引数:
+            duration (float): セグメントの長さ（秒）
+        
+        返値:
+            AudioCodec: 選択されたコーデック
+        """
+        with self._lock:
+            name = min(self.codecs, key=lambda n: self.estimate(n, duration))
+            return self.codecs[name]
+    
+    def record_encode(self, name, duration, encode_time, size):
+        """エンコードの実測値を推定に反映します"""
+        if name not in self.codecs or duration <= 0:
+            return
+        with self._lock:
+            self._encode_estimates[name].update(duration, encode_time)
+            self._bytes_per_second[name] = self._bytes_per_second[name] * 0.8 + (size / duration) * 0.2
+    
+    def record_upload(self, size, elapsed):
+        """
+        APIリクエストの実測値からアップロード帯域を推定します
+        
+        応答時間をペイロードサイズに対して直線で近似し、傾きをアップロード帯域の逆数、
+        切片をサーバー側の処理時間とみなします。
+        """
+        if self.fixed_bandwidth or elapsed <= 0 or size <= 0:
+            return
+        with self._lock:
+            self._response_estimate.update(size, elapsed)
+            slope = self._response_estimate.slope
+            self.upload_bandwidth = 1.0 / slope if slope > 0 else float('inf')
+    
+    def disable(self, name):
+        """エンコードに失敗したコーデックを選択対象から外します（WAVは常に残します）"""
+        with self._lock:
+            if name != 'wav' and name in self.codecs and len(self.codecs) > 1:
+                del self.codecs[name]
+
+
+########################################################################
+# Whisper API 用 HTTP クライアント
+########################################################################
+# 再試行する HTTP ステータス（タイムアウト、競合、レート制限、サーバー側の一時的なエラー）
+RETRYABLE_STATUS_CODES = frozenset((408, 409, 429, 500, 502, 503, 504))
+
+# 再試行する通信エラー（接続失敗・タイムアウトなど）
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+if httpx is not None:
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+
+# 通信エラーのうちタイムアウト（同時実行数を減らす対象）
+TIMEOUT_ERRORS = (requests.exceptions.Timeout,)
+if httpx is not None:
+    TIMEOUT_ERRORS += (httpx.TimeoutException,)
+
+
+def parse_retry_after(value):
+    """
+    Retry-After ヘッダの値を待ち時間（秒）に変換します
+    
+    引数:
+        value (str): 秒数または HTTP-date
+    
+    返値:
+        float or None: 待ち時間（秒）. 解釈できない場合はNone
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class WhisperAPIError(Exception):
+    """
+    Whisper API がエラーを返したことを表す例外
+    
+    Attributes:
+        status_code (int): HTTPステータスコード
+        body (str): レスポンス本文
+        retry_after (float): Retry-After ヘッダで指定された待ち時間（秒, 無い場合はNone）
+    """
+    def __init__(self, status_code, body='', retry_after=None):
+        super().__init__(f"Whisper API エラー: {status_code}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """
+    一時的なAPIエラーの再試行方針
+    
+    指数バックオフ（full jitter）で待ち時間を決め、Retry-After が指定された場合は
+    それより短くは待ちません。1セグメントの転写全体にかける時間は deadline で制限します。
+    
+    Attributes:
+        max_attempts (int): 最大試行回数（初回を含む）
+        base_delay (float): 1回目の再試行の待ち時間の上限（秒）
+        max_delay (float): 待ち時間の上限（秒）
+        deadline (float): 1セグメントの転写にかける最大時間（秒, None で無制限）
+    """
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0, deadline=60.0):
+        """
+        引数:
+            max_attempts (int, optional): 最大試行回数（初回を含む, 1 で再試行しない）
+            base_delay (float, optional): 1回目の再試行の待ち時間の上限（秒）
+            max_delay (float, optional): 待ち時間の上限（秒）
+            deadline (float, optional): 1セグメントの転写にかける最大時間（秒, None で無制限）
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts は 1 以上を指定してください")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+    
+    def is_retryable(self, error):
+        """
+        再試行すれば成功する可能性のあるエラーかどうかを返します
+        
+        引数:
+            error (Exception): 発生した例外
+        
+        返値:
+            bool: 429・5xx・タイムアウト・接続エラーの場合はTrue
+        """
+        if isinstance(error, WhisperAPIError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, TRANSIENT_ERRORS)
+    
+    def backoff(self, attempt, retry_after=None):
+        """
+        再試行までの待ち時間を返します
+        
+        引数:
+            attempt (int): 失敗した回数（1 以上）
+            retry_after (float, optional): サーバーが指定した待ち時間（秒）
+        
+        返値:
+            float: 待ち時間（秒）
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class CircuitOpenError(Exception):
+    """
+    サーキットブレーカーが開いているためAPIを呼び出さなかったことを表す例外
+    
+    Attributes:
+        retry_in (float): 次に呼び出しを試せるまでの時間（秒）
+    """
+    def __init__(self, retry_in):
+        super().__init__(f"APIの呼び出しを停止中です（{retry_in:.1f}秒後に再開）")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    APIの障害中に呼び出しを止めるサーキットブレーカー
+    
+    一時的なエラーが failure_threshold 回続くと開き（open）、recovery_time 秒のあいだ
+    呼び出しを止めます。その後は1件だけ試し（half_open）、成功すれば閉じ（closed）、
+    失敗すれば再び開きます。
+    
+    Attributes:
+        failure_threshold (int): 開くまでの連続失敗回数
+        recovery_time (float): 開いてから試行を再開するまでの時間（秒）
+        trips (int): 開いた回数
+    """
+    def __init__(self, failure_threshold=5, recovery_time=30.0):
+        """
+        引数:
+            failure_threshold (int, optional): 開くまでの連続失敗回数
+            recovery_time (float, optional): 開いてから試行を再開するまでの時間（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.trips = 0
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        """'closed', 'open', 'half_open' のいずれか（開いてから recovery_time 経過後は half_open）"""
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.recovery_time:
+                return 'half_open'
+            return self._state
+    
+    def retry_in(self):
+        """次に呼び出しを試せるまでの時間（秒）"""
+        with self._lock:
+            if self._state != 'open':
+                return 0.0
+            return max(0.0, self._opened_at + self.recovery_time - time.monotonic())
+    
+    def allow_request(self):
+        """
+        APIを呼び出してよいかどうかを返します
+        
+        返値:
+            bool: 閉じている場合、または half_open で試行中の呼び出しが無い場合はTrue
+        """
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.recovery_time:
+                    return False
+                self._state = 'half_open'
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+    
+    def record_success(self):
+        """呼び出しの成功を記録し、閉じます"""
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._probing = False
+    
+    def record_failure(self):
+        """一時的なエラーを記録し、連続失敗回数が閾値に達するか試行中に失敗した場合は開きます"""
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.trips += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+def call_with_retry(request, policy, breaker=None, read_timeout=60.0, on_retry=None):
+    """
+    一時的なエラーを再試行方針に従って再試行しながら Whisper API を呼び出します
+    
+    429・5xx・タイムアウト・接続エラーは policy の待ち時間（Retry-After 以上）を空けて再試行します。
+    各試行の読み取りタイムアウトは read_timeout と残りの deadline の短い方です。
+    breaker を指定した場合は、開いている間は呼び出さず、各試行の結果を記録します。
+    
+    引数:
+        request (callable): 読み取りタイムアウト（秒）を受け取り、APIを1回呼び出して結果を返す関数
+        policy (RetryPolicy): 再試行方針
+        breaker (CircuitBreaker, optional): サーキットブレーカー
+        read_timeout (float, optional): 1回の呼び出しの読み取りタイムアウト（秒）
+        on_retry (callable, optional): 再試行の前に (失敗回数, 待ち時間, 例外) を受け取る関数
+    
+    返値:
+        request の返値
+    
+    例外:
+        CircuitOpenError: サーキットブレーカーが開いているため呼び出さなかった場合
+        WhisperAPIError, 通信エラー: 再試行しないエラー、または再試行しても解消しなかった場合
+    """
+    deadline = time.monotonic() + policy.deadline if policy.deadline else None
+    attempt = 0
+    
+    while True:
+        if breaker and not breaker.allow_request():
+            raise CircuitOpenError(breaker.retry_in())
+        
+        timeout = read_timeout
+        if deadline is not None:
+            timeout = max(0.1, min(timeout, deadline - time.monotonic()))
+        try:
+            result = request(timeout)
+        except Exception as e:
+            retryable = policy.is_retryable(e)
+            if breaker:
+                # 400 などの応答はAPI自体には到達できているため失敗として数えない
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not retryable:
+                raise
+            
+            attempt += 1
+            delay = policy.backoff(attempt, getattr(e, 'retry_after', None))
+            if (attempt >= policy.max_attempts or (breaker and breaker.state == 'open')
+                    or (deadline is not None and time.monotonic() + delay >= deadline)):
+                raise
+            if on_retry:
+                on_retry(attempt, delay, e)
+            time.sleep(delay)
+            continue
+        
+        if breaker:
+            breaker.record_success()
+        return result
+
+
+class WhisperHTTPClient:
+    """
+    Whisper API への接続を再利用する HTTP クライアント
+    
+    セグメントごとにTCP/TLSのハンドシェイクが発生しないよう、keep-alive の
+    コネクションプールを保持します。httpx と h2 がインストールされている場合は
+    HTTP/2 を使用し、1本の接続上で複数のリクエストを多重化します。
+    
+    Attributes:
+        pool_size (int): プールに保持する最大接続数
+        timeout (tuple): (接続タイムアウト秒, 読み取りタイムアウト秒)
+        http2 (bool): HTTP/2 を使用しているかどうか
+    """
+    def __init__(self, pool_size=4, connect_timeout=5.0, read_timeout=60.0, http2=True):
+        """
+        引数:
+            pool_size (int, optional): 同時に保持する最大接続数（同時リクエスト数に合わせます）
+            connect_timeout (float, optional): 接続タイムアウト（秒）
+            read_timeout (float, optional): 応答の読み取りタイムアウト（秒）
+            http2 (bool, optional): 利用可能であれば HTTP/2 を使用する
+        """
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.http2 = False
+        self._httpx_client = None
+        self._session = None
+        
+        if http2 and httpx is not None:
+            try:
+                self._httpx_client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=pool_size,
+                                        max_keepalive_connections=pool_size),
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+                )
+                self.http2 = True
+            except ImportError:
+                # h2 パッケージが無い場合は HTTP/1.1 の requests セッションを使用
+                self._httpx_client = None
+        
+        if self._httpx_client is None:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+    
+    def post(self, url, headers=None, files=None, data=None, read_timeout=None):
+        """
+        multipart リクエストを送信します
+        
+        引数:
+            url (str): 送信先URL
+            headers (dict, optional): リクエストヘッダー
+            files (dict, optional): multipart のファイル/フィールド
+            data (dict, optional): フォームフィールド
+            read_timeout (float, optional): このリクエストの読み取りタイムアウト（秒, 未指定時は既定値）
+        
+        返値:
+            レスポンスオブジェクト（status_code, text, headers, json() を持ちます）
+        """
+        connect_timeout, default_read_timeout = self.timeout
+        if read_timeout is None:
+            read_timeout = default_read_timeout
+        if self._httpx_client is not None:
+            return self._httpx_client.post(url, headers=headers, files=files, data=data,
+                                           timeout=httpx.Timeout(read_timeout, connect=min(connect_timeout, read_timeout)))
+        return self._session.post(url, headers=headers, files=files, data=data,
+                                  timeout=(min(connect_timeout, read_timeout), read_timeout))
+    
+    def transcribe(self, api_url, api_key, audio_data, filename='segment.mp3',
+                   mime_type='audio/mpeg', language=None, model='whisper-1', read_timeout=None):
+        """
+        音声データをWhisper APIに送信し、転写テキストを返します
+        
+        引数:
+            api_url (str): transcriptions エンドポイントのURL
+            api_key (str): OpenAI APIキー
+            audio_data (bytes-like or file-like): 転写する音声データ
+            filename (str, optional): multipartに記載するファイル名（拡張子で形式が判別されます）
+            mime_type (str, optional): 音声データのMIMEタイプ
+            language (str, optional): 言語コード
+            model (str, optional): モデル名
+            read_timeout (float, optional): 読み取りタイムアウト（秒, 未指定時は既定値）
+        
+        返値:
+            str: 転写されたテキスト
+        
+        例外:
+            WhisperAPIError: APIが200以外のステータスを返した場合
+        """
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            audio_data = io.BytesIO(audio_data)
+        elif hasattr(audio_data, 'seek'):
+            audio_data.seek(0)  # 再試行時は先頭から送り直す
+        
+        files = {
+            'file': (filename, audio_data, mime_type),
+            'model': (None, model),
+        }
+        if language:
+            files['language'] = (None, language)
+        
+        response = self.post(api_url, headers={"Authorization": f"Bearer {api_key}"}, files=files,
+                             read_timeout=read_timeout)
+        if response.status_code != 200:
+            raise WhisperAPIError(response.status_code, response.text,
+                                  parse_retry_after(response.headers.get('Retry-After')))
+        return response.json().get('text', '')
+    
+    def close(self):
+        """プール内の接続をすべて閉じます"""
+        if self._httpx_client is not None:
+            self._httpx_client.close()
+        if self._session is not None:
+            self._session.close()
+
+
+########################################################################
+# API利用枠の管理（レート制限と同時実行数）
+########################################################################
+class TokenBucket:
+    """
+    トークンバケット（プロセス内で共有）
+    
+    毎秒 rate 個のトークンが capacity 個まで溜まり、取得した分だけ減ります。
+    
+    Attributes:
+        rate (float): 1秒あたりに補充するトークン数
+        capacity (float): 溜められるトークン数の上限
+    """
+    def __init__(self, rate, capacity):
+        """
+        引数:
+            rate (float): 1秒あたりに補充するトークン数
+            capacity (float): 溜められるトークン数の上限
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self, amount):
+        """
+        トークンを取得するまでの待ち時間を返します
+        
+        待ち時間が0の場合はトークンを取得済みです。capacity を超える量は capacity として扱います。
+        
+        引数:
+            amount (float): 取得するトークン数
+        
+        返値:
+            float: 待ち時間（秒）
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    ファイルに状態を保存し、同じファイルを指定したプロセス間で共有するトークンバケット
+    
+    状態ファイルは fcntl のロックで排他します（fcntl の無い環境では使用できません）。
+    
+    Attributes:
+        path (str): 状態ファイルのパス
+        key (str): 状態ファイル内でこのバケットを識別する名前
+    """
+    def __init__(self, path, key, rate, capacity):
+        """
+        引数:
+            path (str): 状態ファイルのパス
+            key (str): 状態ファイル内でこのバケットを識別する名前
+            rate (float): 1秒あたりに補充するトークン数
+            capacity (float): 溜められるトークン数の上限
+        
+        例外:
+            RuntimeError: fcntl を使用できない場合
+        """
+        if fcntl is None:
+            raise RuntimeError("この環境ではプロセス間のレート制限（状態ファイル）を使用できません")
+        super().__init__(rate, capacity)
+        self.path = path
+        self.key = key
+    
+    def reserve(self, amount):
+        amount = min(amount, self.capacity)
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except ValueError:
+                    state = {}
+                # プロセス間で比較できるよう壁時計の時刻で記録する
+                now = time.time()
+                tokens, updated = state.get(self.key, (self.capacity, now))
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+                wait = 0.0
+                if tokens >= amount:
+                    tokens -= amount
+                else:
+                    wait = (amount - tokens) / self.rate
+                state[self.key] = (tokens, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+
+class APIRateGovernor:
+    """
+    Whisper API の利用枠に合わせてリクエストを調整します
+    
+    リクエスト数と音声の長さ（秒）をそれぞれトークンバケットで1分あたりの上限以下に抑え、
+    同時実行数を AIMD（429 や応答の遅れで半減・成功で少しずつ増加）で調整します。
+    同じ設定のインスタンスは shared() でプロセス内の全転写器から共有でき、
+    state_file を指定するとレート制限をプロセス間でも共有します。
+    
+    Attributes:
+        requests_per_minute (float): 1分あたりのリクエスト数の上限（None で無制限）
+        audio_seconds_per_minute (float): 1分あたりに送信する音声の長さ（秒）の上限（None で無制限）
+        max_concurrency (int): 同時実行数の上限（None で同時実行数を調整しない）
+        concurrency_limit (float): 現在の同時実行数の上限
+    """
+    # 同時実行数を減らした後、再び減らすまでの最小間隔（秒）
+    DECREASE_INTERVAL = 2.0
+    
+    _shared = {}
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, requests_per_minute=None, audio_seconds_per_minute=None, max_concurrency=None,
+                 min_concurrency=1, latency_tolerance=3.0, state_file=None):
+        """
+        引数:
+            requests_per_minute (float, optional): 1分あたりのリクエスト数の上限
+            audio_seconds_per_minute (float, optional): 1分あたりに送信する音声の長さ（秒）の上限
+            max_concurrency (int, optional): 同時実行数の上限（指定時のみ AIMD で調整）
+            min_concurrency (int, optional): 同時実行数の下限
+            latency_tolerance (float, optional): 応答時間が最小値の何倍を超えたら同時実行数を減らすか
+            state_file (str, optional): プロセス間で共有するレート制限の状態ファイル
+        """
+        self.requests_per_minute = requests_per_minute
+        self.audio_seconds_per_minute = audio_seconds_per_minute
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.state_file = state_file
+        self.request_bucket = self._create_bucket('requests', requests_per_minute)
+        self.audio_bucket = self._create_bucket('audio_seconds', audio_seconds_per_minute)
+        
+        self.concurrency_limit = float(max_concurrency) if max_concurrency else None
+        self._in_flight = 0
+        self._baseline_latency = None  # 応答時間の最小値（ゆっくり追従）
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self.throttled = 0
+        self.waited_seconds = 0.0
+    
+    def _create_bucket(self, key, per_minute):
+        """1分あたりの上限からトークンバケットを作成します（上限なしの場合はNone）"""
+        if not per_minute:
+            return None
+        # 1分間の上限までのバーストを許す
+        if self.state_file:
+            return FileTokenBucket(self.state_file, key, per_minute / 60.0, per_minute)
+        return TokenBucket(per_minute / 60.0, per_minute)
+    
+    @classmethod
+    def shared(cls, **kwargs):
+        """
+        同じ設定のインスタンスをプロセス内で共有して返します
+        
+        引数:
+            **kwargs: コンストラクタの引数
+        
+        返値:
+            APIRateGovernor: 共有インスタンス
+        """
+        key = tuple(sorted(kwargs.items()))
+        with cls._shared_lock:
+            governor = cls._shared.get(key)
+            if governor is None:
+                governor = cls._shared[key] = cls(**kwargs)
+            return governor
+    
+    def acquire(self, audio_seconds=0.0):
+        """
+        リクエストを送信できるまで待ちます（release() と対で呼び出します）
+        
+        引数:
+            audio_seconds (float, optional): 送信する音声の長さ（秒）
+        
+        返値:
+            float: 待った時間（秒）
+        """
+        started = time.monotonic()
+        if self.concurrency_limit is not None:
+            with self._condition:
+                while self._in_flight >= int(self.concurrency_limit):
+                    self._condition.wait()
+                self._in_flight += 1
+        for bucket, amount in ((self.request_bucket, 1), (self.audio_bucket, audio_seconds)):
+            if bucket is None or amount <= 0:
+                continue
+            wait = bucket.reserve(amount)
+            while wait > 0:
+                time.sleep(wait)
+                wait = bucket.reserve(amount)
+        waited = time.monotonic() - started
+        with self._condition:
+            self.waited_seconds += waited
+        return waited
+    
+    def release(self, latency=None, throttled=False):
+        """
+        リクエストの完了を記録し、同時実行数の上限を調整します
+        
+        引数:
+            latency (float, optional): 応答時間（秒, 失敗した場合はNone）
+            throttled (bool, optional): 429 またはタイムアウトだった場合はTrue
+        """
+        with self._condition:
+            if throttled:
+                self.throttled += 1
+            if self.concurrency_limit is None:
+                return
+            self._in_flight -= 1
+            now = time.monotonic()
+            congested = throttled
+            if latency is not None and not throttled:
+                if self._baseline_latency is None or latency < self._baseline_latency:
+                    self._baseline_latency = latency
+                else:
+                    self._baseline_latency += (latency - self._baseline_latency) * 0.01
+                congested = latency > self._baseline_latency * self.latency_tolerance
+            
+            if congested:
+                # 直前に減らした影響が出るまでは続けて減らさない
+                if now - self._last_decrease >= self.DECREASE_INTERVAL:
+                    factor = 0.5 if throttled else 0.9
+                    self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit * factor)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.concurrency_limit = min(float(self.max_concurrency),
+                                             self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self._condition.notify_all()
+    
+    @contextlib.contextmanager
+    def request(self, audio_seconds=0.0):
+        """
+        1回のリクエストを acquire() と release() で囲みます
+        
+        ブロック内の処理時間を応答時間として記録し、429 とタイムアウトの例外は
+        同時実行数を減らす対象として release() に渡します（例外はそのまま送出します）。
+        
+        引数:
+            audio_seconds (float, optional): 送信する音声の長さ（秒）
+        
+        返値:
+            float: 待った時間（秒, with 文の as で受け取る）
+        """
+        waited = self.acquire(audio_seconds)
+        started = time.monotonic()
+        latency = None
+        throttled = False
+        try:
+            yield waited
+            latency = time.monotonic() - started
+        except WhisperAPIError as e:
+            throttled = e.status_code == 429
+            raise
+        except TIMEOUT_ERRORS:
+            throttled = True
+            raise
+        finally:
+            self.release(latency, throttled)
+    
+    def stats(self):
+        """
+        現在の状態を返します
+        
+        返値:
+            dict: concurrency_limit, in_flight, throttled, waited_seconds
+        """
+        with self._condition:
+            return {
+                'concurrency_limit': self.concurrency_limit,
+                'in_flight': self._in_flight,
+                'throttled': self.throttled,
+                'waited_seconds': self.waited_seconds,
+            }
+
+
+########################################################################
+# 音声セグメント
+########################################################################
+class SpeechSegment:
+    """
+    転写対象の音声セグメント
+    
+    Attributes:
+        sequence (int): 取り込み順の連番（結果の並べ替えに使用）
+        pcm (memoryview): セグメントのPCMデータ（16bit リトルエンディアン）
+        start_offset (float): 録音開始からのセグメント開始位置（秒）
+        end_offset (float): 録音開始からのセグメント終了位置（秒）
+        captured_at (float): セグメントを切り出した時刻（time.monotonic）
+        cut_reason (str): 区切った理由 (max_length / silence / flush. 分割途中の暫定セグメントは partial)
+        energies (numpy.ndarray): フレームごとの正規化エネルギー（取り込み時に計算済みの値）
+        sum_squares (int): セグメント全体のサンプルの二乗和（全体のRMS算出に使用）
+        voiced (numpy.ndarray): 発話検出器が音声らしいと判定したフレーム（検出器を使用しない場合はNone）
+        overlap_frames (int): 先頭のうち、前のセグメントの末尾と重なっているフレーム数
+        time_map (SegmentTimeMap): 無音を詰めた場合の、送信する音声と元の音声の時刻の対応（詰めていない場合はNone）
+    """
+    __slots__ = ('sequence', 'pcm', 'start_offset', 'end_offset', 'captured_at', 'cut_reason',
+                 'energies', 'sum_squares', 'voiced', 'overlap_frames', 'time_map')
+    
+    def __init__(self, sequence, pcm, start_offset, end_offset, captured_at=None, cut_reason=None,
+                 energies=None, sum_squares=0, voiced=None, overlap_frames=0, time_map=None):
+        self.sequence = sequence
+        self.pcm = pcm
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.captured_at = time.monotonic() if captured_at is None else captured_at
+        self.cut_reason = cut_reason
+        self.energies = np.zeros(0, dtype=np.float64) if energies is None else energies
+        self.sum_squares = sum_squares
+        self.voiced = voiced
+        self.overlap_frames = overlap_frames
+        self.time_map = time_map
+    
+    def merge(self, other):
+        """後続のセグメントを末尾に連結します（エネルギー情報も引き継ぎ、重なっている部分は除きます）"""
+        skip = other.overlap_frames
+        skip_bytes = len(other.pcm) // len(other.energies) * skip if skip else 0
+        self.pcm = memoryview(b''.join((self.pcm, other.pcm[skip_bytes:])))
+        self.end_offset = other.end_offset
+        self.energies = np.concatenate((self.energies, other.energies[skip:]))
+        self.sum_squares += other.sum_squares
+        if skip_bytes:
+            head = np.frombuffer(other.pcm[:skip_bytes], dtype=np.int16).astype(np.int64)
+            self.sum_squares -= int(np.dot(head, head))
+        if self.voiced is not None and other.voiced is not None:
+            self.voiced = np.concatenate((self.voiced, other.voiced[skip:]))
+    
+    @property
+    def duration(self):
+        """セグメントの長さ（秒）"""
+        return self.end_offset - self.start_offset
+    
+    @property
+    def audio_duration(self):
+        """送信する音声の長さ（秒. 無音を詰めた場合は詰めた後の長さ）"""
+        return self.time_map.duration if self.time_map is not None else self.duration
+    
+    def source_time(self, t):
+        """
+        送信した音声の先頭からの時刻を録音開始からの時刻に変換します
+        
+        引数:
+            t (float): 送信した音声の先頭からの時刻（秒）
+        
+        返値:
+            float: 録音開始からの時刻（秒）
+        """
+        if self.time_map is None:
+            return self.start_offset + t
+        return self.time_map.to_source(t)
+    
+    def __repr__(self):
+        return f"SpeechSegment(#{self.sequence}, {self.start_offset:.2f}-{self.end_offset:.2f}s)"
+
+
+########################################################################
+# 転写結果の信頼度推定
+########################################################################
+def estimate_transcript_confidence(text):
+    """
+    転写テキストから信頼度を推定します（ヒューリスティック）
+    
+    引数:
+        text (str): 転写されたテキスト
+    
+    返値:
+        float: 推定された信頼度 (0.0-1.0)
+    """
+    if not text or len(text.strip()) == 0:
+        return 0.0
+    
+    # 定型句リスト
+    common_phrases = [
+        "ご視聴ありがとうございました。", 
+        "thank you", "thanks", 
+        "はい", "いいえ",
+        "こんにちは", "さようなら"
+    ]
+    
+    text_lower = text.lower().strip()
+    
+    for phrase in common_phrases:
+        if phrase.lower() in text_lower:
+            if len(text_lower) < len(phrase) * 1.5:
+                return 0.3
+    
+    # 文字数が多いほど確信度が高い（最大0.9）
+    char_confidence = min(0.9, len(text.strip()) / 50)
+    
+    # 単語数（空白で区切った数）
+    words = text.strip().split()
+    word_confidence = min(0.9, len(words) / 10)
+    
+    # 合成確信度（文字数と単語数の大きい方を採用）
+    confidence = max(char_confidence, word_confidence)
+    
+    return confidence
+
+
+########################################################################
+# 重なりのある転写結果の連結
+########################################################################
+# 英数字の単語は1トークン、それ以外（日本語など）は1文字を1トークンとする
+_TRANSCRIPT_TOKEN = re.compile(r"[A-Za-z0-9À-ɏ']+|\S")
+
+# 重複を取り除いたあとの先頭から取り除く句読点
+_LEADING_PUNCTUATION = ' \t\n、。，．,.!?！？'
+
+
+def _transcript_tokens(text):
+    """テキストを (小文字にしたトークン, テキスト中の終了位置) のリストに分けます"""
+    return [(match.group().lower(), match.end()) for match in _TRANSCRIPT_TOKEN.finditer(text)]
+
+
+def stitch_transcripts(previous, current, window=20, min_match=2):
+    """
+    音声が重なっている連続したセグメントの転写結果から、後ろのセグメントの重複部分を取り除きます
+    
+    previous の末尾 window トークンと current の先頭 window トークンで共通する部分（連続したトークン列）を
+    探し、min_match トークン以上かつ3文字以上一致した場合は current の先頭から一致部分の終わりまでを削除します。
+    一致は長いほど、また previous の末尾・current の先頭に近いほど優先します
+    （重なった音声の転写は previous の末尾と current の先頭に現れるため）。
+    区切りで切れた単語が両方に含まれていても、一致部分より前の断片ごと取り除かれます。
+    
+    引数:
+        previous (str): 前のセグメントの転写結果
+        current (str): 後ろのセグメントの転写結果
+        window (int, optional): 比較するトークン数（重なりの長さに応じて指定）
+        min_match (int, optional): 重複とみなす最小のトークン数
+    
+    返値:
+        str: 重複を取り除いた current（一致が見つからない場合はそのまま）
+    """
+    previous_tokens = [token for token, _ in _transcript_tokens(previous)[-window:]]
+    current_tokens = _transcript_tokens(current)[:window]
+    
+    # 共通部分の長さを1行分の配列で求める（lengths[j]: previous_tokens[i] と current_tokens[j-1] で終わる一致の長さ）
+    lengths = [0] * (len(current_tokens) + 1)
+    best_score = 0.0
+    best_length = best_end = 0
+    for i, token in enumerate(previous_tokens):
+        for j in range(len(current_tokens), 0, -1):
+            if current_tokens[j - 1][0] != token:
+                lengths[j] = 0
+                continue
+            length = lengths[j] = lengths[j - 1] + 1
+            if length < min_match:
+                continue
+            # 一致の後ろに残る previous のトークン数と、一致の前にある current のトークン数だけ減点
+            score = length - 0.5 * ((len(previous_tokens) - 1 - i) + (j - length))
+            if score > best_score and sum(len(t) for t, _ in current_tokens[j - length:j]) >= 3:
+                best_score, best_length, best_end = score, length, j
+    
+    if not best_length:
+        return current
+    return current[current_tokens[best_end - 1][1]:].lstrip(_LEADING_PUNCTUATION)
+
+
+########################################################################
+# 発話検出（VAD）
+########################################################################
+class VoiceActivityDetector(abc.ABC):
+    """
+    発話検出器の基底クラス
+    
+    エネルギーが無音判定の閾値を超えたフレームのうち、音声らしいものを選びます。
+    フレームはリングバッファ上の (n, frame_samples) の配列としてまとめて渡されます。
+    エネルギーだけで判定する場合（--vad energy）は検出器を使用しません。
+    
+    Attributes:
+        name (str): 検出器名（--vad で指定する値）
+    """
+    name = None
+    
+    def __init__(self, sample_rate=16000, frame_duration_ms=20):
+        """
+        引数:
+            sample_rate (int, optional): サンプリングレート
+            frame_duration_ms (int, optional): 1フレームの長さ（ミリ秒）
+        """
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * frame_duration_ms / 1000)
+    
+    @abc.abstractmethod
+    def detect(self, frames):
+        """
+        フレームごとに音声らしいかどうかを判定します
+        
+        引数:
+            frames (numpy.ndarray): (n, frame_samples) の int16 配列
+        
+        返値:
+            numpy.ndarray: 音声らしいフレームが True の bool 配列 (n,)
+        """
+
+
+class SpectralVAD(VoiceActivityDetector):
+    """
+    帯域エネルギー・スペクトル平坦度・ゼロ交差率による発話検出器
+    
+    次のすべてを満たすフレームを音声とみなします。
+    
+    - 300-3400Hz（電話帯域）のパワーが全体の band_ratio 以上（空調の低音などを除外）
+    - 同帯域のスペクトル平坦度が max_flatness 以下（キーボード音や白色雑音など、
+      帯域全体に広がる音を除外）
+    - ゼロ交差率が max_zcr 以下（ヒスノイズなどの高域の雑音を除外）
+    
+    摩擦音など一部の子音は音声と判定されませんが、無音とみなすには silence_duration 以上
+    続く必要があるため、発話の途中で区切られることはありません。
+    和音の多い音楽は音声と区別できない場合があります。
+    """
+    name = 'spectral'
+    
+    def __init__(self, sample_rate=16000, frame_duration_ms=20, band=(300, 3400),
+                 band_ratio=0.15, max_flatness=0.35, max_zcr=0.25):
+        """
+        引数:
+            sample_rate (int, optional): サンプリングレート
+            frame_duration_ms (int, optional): 1フレームの長さ（ミリ秒）
+            band (tuple, optional): 音声帯域の下限と上限（Hz）
+            band_ratio (float, optional): 音声帯域のパワーが全体に占める割合の下限
+            max_flatness (float, optional): 音声帯域のスペクトル平坦度の上限（0-1, 白色雑音でおよそ0.56）
+            max_zcr (float, optional): ゼロ交差率（サンプルあたり）の上限
+        """
+        super().__init__(sample_rate, frame_duration_ms)
+        self.band_ratio = band_ratio
+        self.max_flatness = max_flatness
+        self.max_zcr = max_zcr
+        self.window = np.hanning(self.frame_samples).astype(np.float32)
+        freqs = np.fft.rfftfreq(self.frame_samples, 1 / sample_rate)
+        self.band_bins = np.flatnonzero((freqs >= band[0]) & (freqs <= band[1]))
+    
+    def features(self, frames):
+        """
+        フレームごとの特徴量をまとめて計算します（調整用）
+        
+        引数:
+            frames (numpy.ndarray): (n, frame_samples) の int16 配列
+        
+        返値:
+            tuple: (音声帯域のパワーの割合, スペクトル平坦度, ゼロ交差率) の配列
+        """
+        samples = frames.astype(np.float32)
+        samples -= samples.mean(axis=1, keepdims=True)
+        
+        # ゼロ交差率（符号が変わったサンプル間の割合）
+        signs = np.signbit(samples)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_samples - 1)
+        
+        # 窓掛けしたパワースペクトル
+        spectrum = np.fft.rfft(samples * self.window, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2 + 1e-6
+        band_power = power[:, self.band_bins]
+        ratio = band_power.sum(axis=1) / power.sum(axis=1)
+        
+        # スペクトル平坦度（幾何平均 / 算術平均）
+        flatness = np.exp(np.log(band_power).mean(axis=1)) / band_power.mean(axis=1)
+        return ratio, flatness, zcr
+    
+    def detect(self, frames):
+        ratio, flatness, zcr = self.features(frames)
+        return (ratio >= self.band_ratio) & (flatness <= self.max_flatness) & (zcr <= self.max_zcr)
+
+
+# --vad で指定できる発話検出器（energy はエネルギーのみで判定）
+VAD_DETECTORS = {detector.name: detector for detector in (SpectralVAD,)}
+
+
+def create_vad(vad, sample_rate=16000, frame_duration_ms=20):
+    """
+    発話検出器を作成します
+    
+    引数:
+        vad (str or VoiceActivityDetector): 検出器名（energy / spectral）または作成済みの検出器
+        sample_rate (int, optional): サンプリングレート
+        frame_duration_ms (int, optional): 1フレームの長さ（ミリ秒）
+    
+    返値:
+        VoiceActivityDetector or None: 発話検出器（energy の場合はNone）
+    
+    例外:
+        ValueError: 未対応の検出器名の場合
+    """
+    if vad is None or isinstance(vad, VoiceActivityDetector):
+        return vad
+    if vad == 'energy':
+        return None
+    if vad not in VAD_DETECTORS:
+        raise ValueError(f"未対応の発話検出器です: {vad} (選択肢: energy, {', '.join(VAD_DETECTORS)})")
+    return VAD_DETECTORS[vad](sample_rate=sample_rate, frame_duration_ms=frame_duration_ms)
+
+
+########################################################################
+# 音声セグメント分割
+########################################################################
+def frame_energy(data):
+    """
+    1フレームの正規化RMSエネルギー（0-1000）を計算します
+    
+    二乗和は整数のまま計算するため、PCMRingBuffer がまとめて計算する値と一致します。
+    
+    引数:
+        data (bytes-like): 16bit リトルエンディアンのPCMデータ
+    
+    返値:
+        float: 正規化エネルギー（無音判定の閾値と同じスケール）
+    """
+    audio_np = np.frombuffer(data, dtype=np.int16)
+    if audio_np.size == 0:
+        return 0.0
+    sum_of_squares = int(np.dot(audio_np.astype(np.int64), audio_np))
+    energy = np.sqrt(sum_of_squares / audio_np.size)
+    return min(1000, energy / 32.767)
+
+
+class PCMRingBuffer:
+    """
+    固定長フレームを格納する事前確保済みの int16 リングバッファ
+    
+    書き込んだフレームの正規化RMSエネルギーを、フレームごとに配列を確保せず
+    まとめて計算します（int16 の整数内積で二乗和を求め、結果は事前確保した配列に書き込みます）。
+    
+    Attributes:
+        capacity (int): 格納できるフレーム数
+        frame_samples (int): 1フレームのサンプル数
+        samples (numpy.ndarray): (capacity, frame_samples) の int16 配列
+        energies (numpy.ndarray): フレームごとの正規化エネルギー (capacity,)
+        square_sums (numpy.ndarray): フレームごとのサンプルの二乗和 (capacity,)
+        write_index (int): これまでに書き込んだ総フレーム数
+    """
+    def __init__(self, capacity, frame_samples):
+        """
+        引数:
+            capacity (int): 格納できるフレーム数
+            frame_samples (int): 1フレームのサンプル数
+        """
+        self.capacity = capacity
+        self.frame_samples = frame_samples
+        self.frame_bytes = frame_samples * 2
+        self.samples = np.zeros((capacity, frame_samples), dtype=np.int16)
+        self.energies = np.zeros(capacity, dtype=np.float64)
+        self.square_sums = np.zeros(capacity, dtype=np.int64)
+        self.write_index = 0
+    
+    @property
+    def write_slot(self):
+        """次に書き込む位置"""
+        return self.write_index % self.capacity
+    
+    def writable_frames(self):
+        """折り返さずに連続して書き込めるフレーム数"""
+        return self.capacity - self.write_slot
+    
+    def write(self, pcm_data):
+        """
+        フレームを書き込み、そのエネルギーをまとめて計算します
+        
+        引数:
+            pcm_data (bytes-like): フレーム長の整数倍のPCMデータ（writable_frames() 以下）
+        
+        返値:
+            numpy.ndarray: 書き込んだフレームのエネルギー（内部配列のビュー。次の書き込みまで有効。
+                二乗和は同じ位置の square_sums に格納されます）
+        """
+        count = len(pcm_data) // self.frame_bytes
+        if count > self.writable_frames():
+            raise ValueError("リングバッファの終端を越えて書き込むことはできません")
+        start = self.write_slot
+        end = start + count
+        rows = self.samples[start:end]
+        rows.reshape(-1)[:] = np.frombuffer(pcm_data, dtype=np.int16, count=count * self.frame_samples)
+        self._compute_energies(start, end)
+        self.write_index += count
+        return self.energies[start:end]
+    
+    def _compute_energies(self, start, end):
+        """samples[start:end] の正規化RMSエネルギーを energies[start:end] に書き込みます"""
+        rows = self.samples[start:end]
+        sums = self.square_sums[start:end]
+        # 行ごとの整数内積（int64で累積するため桁あふれしない）
+        np.einsum('ij,ij->i', rows, rows, dtype=np.int64, out=sums)
+        out = self.energies[start:end]
+        np.divide(sums, self.frame_samples, out=out)
+        np.sqrt(out, out=out)
+        np.divide(out, 32.767, out=out)
+        np.minimum(out, 1000, out=out)
+
+
+class PCMBuffer:
+    """
+    セグメントのPCMデータを連続した領域に追記するバッファ
+    
+    フレームごとに bytes オブジェクトを作らずに追記し、切り出したデータは
+    コピーせずに memoryview のままエンコーダへ渡します。
+    
+    Attributes:
+        length (int): 書き込み済みのバイト数
+    """
+    __slots__ = ('_data', '_view', 'length')
+    
+    def __init__(self, capacity):
+        """
+        引数:
+            capacity (int): 事前に確保するバイト数（不足した場合は拡張します）
+        """
+        self._allocate(capacity)
+    
+    def __len__(self):
+        return self.length
+    
+    def _allocate(self, capacity):
+        """新しい領域を確保し、書き込み位置を先頭に戻します"""
+        self._data = bytearray(capacity)
+        self._view = memoryview(self._data)
+        self.length = 0
+    
+    def append(self, data):
+        """
+        データを末尾に追記します
+        
+        引数:
+            data (bytes-like): 追記するデータ
+        """
+        end = self.length + len(data)
+        if end > len(self._data):
+            # 切り出し済みの memoryview が参照しているため、領域は作り直して拡張する
+            view = self._view[:self.length]
+            self._allocate(max(end, len(self._data) * 2))
+            self._view[:len(view)] = view
+            self.length = len(view)
+        self._view[self.length:end] = data
+        self.length = end
+    
+    def peek(self):
+        """
+        書き込み済みのデータを、書き込みを続けたまま参照します
+        
+        返値:
+            memoryview: 書き込み済みのデータ（コピーはしません。以降の追記や切り出しの影響を受けません）
+        """
+        return self._view[:self.length]
+    
+    def detach(self, end=None):
+        """
+        書き込み済みのデータを切り出し、新しい領域で書き込みを再開します
+        
+        引数:
+            end (int, optional): 切り出すバイト数（未指定時はすべて）
+        
+        返値:
+            memoryview: 切り出したデータ（コピーはしません）
+        """
+        view = self._view[:self.length if end is None else end]
+        self._allocate(len(self._data))
+        return view
+
+
+class NoiseFloorTracker:
+    """
+    最小統計法（minimum statistics）で背景雑音のレベルを推定し、発話判定の閾値を決めます
+    
+    フレームのエネルギーを平滑化し、直近 window 秒間の最小値を雑音レベルとします。
+    window を subwindows 個の区間に分けて区間ごとの最小値だけを保持するため、
+    1フレームあたりの計算量は定数です。閾値は雑音レベルの margin 倍を
+    [min_threshold, max_threshold] に収めた値です。発話中の小さな値を雑音と取り違えないよう、
+    window が埋まるまでは initial_threshold を超えない範囲で調整します。
+    
+    Attributes:
+        margin (float): 雑音レベルに対する閾値の倍率
+        noise_floor (float): 推定した雑音レベル（0-1000, 推定前はNone）
+        threshold (float): 現在の発話判定の閾値
+        smoothed (float): 平滑化したフレームのエネルギー
+    """
+    def __init__(self, frame_duration_ms=20, window=5.0, subwindows=10, smoothing=0.8,
+                 margin=2.0, min_threshold=15.0, max_threshold=400.0, initial_threshold=70.0):
+        """
+        引数:
+            frame_duration_ms (int, optional): 1フレームの長さ（ミリ秒）
+            window (float, optional): 最小値を探す期間（秒）. 最も長い発話より長くします
+            subwindows (int, optional): window の分割数
+            smoothing (float, optional): エネルギーの平滑化係数（0-1, 大きいほど緩やか）
+            margin (float, optional): 雑音レベルに対する閾値の倍率
+            min_threshold (float, optional): 閾値の下限
+            max_threshold (float, optional): 閾値の上限
+            initial_threshold (float, optional): 雑音レベルを推定するまでの閾値
+        """
+        self.subwindow_frames = max(1, int(window * 1000 / frame_duration_ms / subwindows))
+        self.smoothing = smoothing
+        self.margin = margin
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.initial_threshold = initial_threshold
+        self._minima = collections.deque(maxlen=subwindows)
+        self.reset()
+    
+    def reset(self):
+        """推定した雑音レベルを破棄します"""
+        self._minima.clear()
+        self._subwindow_min = math.inf
+        self._subwindow_count = 0
+        self.smoothed = None
+        self.noise_floor = None
+        self.threshold = self.initial_threshold
+        self.frames = 0
+    
+    def _set_floor(self, noise_floor):
+        self.noise_floor = float(noise_floor)
+        threshold = min(max(self.noise_floor * self.margin, self.min_threshold), self.max_threshold)
+        if len(self._minima) < self._minima.maxlen:
+            threshold = min(threshold, self.initial_threshold)
+        self.threshold = threshold
+    
+    def update(self, energy):
+        """
+        1フレームのエネルギーを取り込み、現在の閾値を返します
+        
+        引数:
+            energy (float): フレームの正規化エネルギー（0-1000）
+        
+        返値:
+            float: 発話判定の閾値
+        """
+        energy = float(energy)
+        smoothed = energy if self.smoothed is None else self.smoothing * self.smoothed + (1 - self.smoothing) * energy
+        self.smoothed = smoothed
+        self.frames += 1
+        if smoothed < self._subwindow_min:
+            self._subwindow_min = smoothed
+            # 雑音が下がった場合は区間の終わりを待たずに追従する
+            if self.noise_floor is not None and smoothed < self.noise_floor:
+                self._set_floor(smoothed)
+        
+        self._subwindow_count += 1
+        if self._subwindow_count >= self.subwindow_frames:
+            self._minima.append(self._subwindow_min)
+            self._set_floor(min(self._minima))
+            self._subwindow_min = math.inf
+            self._subwindow_count = 0
+        return self.threshold
+    
+    def state(self):
+        """
+        調整用に現在の推定状態を返します
+        
+        返値:
+            dict: noise_floor, threshold, smoothed, margin, frames
+        """
+        return {
+            'noise_floor': self.noise_floor,
+            'threshold': self.threshold,
+            'smoothed': self.smoothed,
+            'margin': self.margin,
+            'frames': self.frames,
+        }
+
+
+class AudioSegmenter:
+    """
+    エネルギーベースで音声フレーム列をセグメントに分割します
+    
+    以下の条件でセグメントを区切ります:
+    1. 最大セグメント長に達した場合
+    2. 一定時間以上の無音が検出された場合
+    
+    マイク・ファイル・ネットワーク等の入力元に依存しないよう、フレームを
+    1つずつ feed() に渡す形式になっています。
+    
+    noise_tracker を指定した場合は、無音判定の閾値を背景雑音のレベルに合わせて
+    フレームごとに更新します。vad を指定した場合は、閾値を超えたフレームのうち
+    検出器が音声らしいと判定したものだけを発話とみなします。
+    overlap を指定した場合は、最大セグメント長で区切ったセグメントの末尾を
+    次のセグメントの先頭にも含めます（区切りをまたぐ単語を両方で転写し、stitch_transcripts で連結します）。
+    cut_lookback を指定した場合は、最大セグメント長に達したときに直近 cut_lookback 秒のうち
+    最も静かな区間で区切り、それ以降のフレームは次のセグメントに持ち越します。
+    pre_roll を指定した場合は、発話が始まるまでのフレームをセグメントに含めず、
+    発話の直前 pre_roll 秒（プリロール）だけを先頭に付けます。無音で区切ったセグメントの末尾には
+    発話の終わりから hangover 秒までを残します。
+    
+    Attributes:
+        frame_duration_ms (int): 1フレームの長さ（ミリ秒）
+        energy_threshold (float): 無音判定の閾値（noise_tracker 使用時は現在の値）
+        max_frames (int): セグメントの最大フレーム数
+        silence_threshold_frames (int): 無音とみなすフレーム数
+        noise_tracker (NoiseFloorTracker): 閾値を自動調整する場合の雑音レベルの推定器
+        vad (VoiceActivityDetector): 発話検出器（エネルギーのみで判定する場合はNone）
+        overlap_frames (int): 最大セグメント長で区切ったときに次のセグメントに重ねるフレーム数
+        lookback_frames (int): 最大セグメント長に達したときに区切る位置を探すフレーム数
+        pre_roll_frames (int): 発話の直前に付けるフレーム数（Noneの場合は先頭の無音も含める）
+        hangover_frames (int): 無音で区切ったときに発話の後ろに残すフレーム数
+    """
+    # エネルギー計算用リングバッファの長さ（秒）
+    RING_SECONDS = 2
+    
+    # 区切る位置を探すときに静かさを比べる区間の長さ（フレーム数, 20ms で 100ms）
+    CUT_RUN_FRAMES = 5
+    
+    def __init__(self, frame_duration_ms=20, segment_length=10,
+                 energy_threshold=70, silence_duration=1.0, sample_rate=16000, noise_tracker=None, vad=None,
+                 overlap=0.0, cut_lookback=0.0, pre_roll=None, hangover=None):
+        """
+        引数:
+            frame_duration_ms (int, optional): 1フレームの長さ（ミリ秒）
+            segment_length (float, optional): 1セグメントの最大長さ（秒）
+            energy_threshold (float, optional): 無音判定の閾値 0-1000
+            silence_duration (float, optional): 無音とみなす最小の長さ（秒）
+            sample_rate (int, optional): サンプリングレート
+            noise_tracker (NoiseFloorTracker, optional): 閾値を自動調整する場合の雑音レベルの推定器
+            vad (VoiceActivityDetector, optional): 発話検出器
+            overlap (float, optional): 最大セグメント長で区切ったときに次のセグメントに重ねる長さ（秒）
+            cut_lookback (float, optional): 最大セグメント長に達したときに区切る位置を探す長さ（秒, 0 で末尾で区切る）
+            pre_roll (float, optional): 発話の直前に付ける長さ（秒）. 未指定時は先頭の無音もすべてセグメントに含める
+            hangover (float, optional): 無音で区切ったときに発話の後ろに残す長さ（秒）. 未指定時は silence_duration の1/3
+        
+        例外:
+            ValueError: overlap, cut_lookback, その合計または pre_roll がセグメントの最大長の半分以上の場合
+        """
+        self.frame_duration_ms = frame_duration_ms
+        self.energy_threshold = energy_threshold
+        self.noise_tracker = noise_tracker
+        self.vad = vad
+        self.silence_duration = silence_duration
+        self.max_frames = int(segment_length * 1000 / frame_duration_ms)  # セグメント最大フレーム数
+        self.silence_threshold_frames = int(silence_duration * 1000 / frame_duration_ms)  # 無音判定フレーム数
+        self.overlap_frames = int(overlap * 1000 / frame_duration_ms)
+        if self.overlap_frames and self.overlap_frames * 2 >= self.max_frames:
+            raise ValueError(f"重なりの長さ ({overlap}秒) はセグメントの最大長の半分未満にしてください")
+        self.lookback_frames = int(cut_lookback * 1000 / frame_duration_ms)
+        if self.lookback_frames and self.lookback_frames * 2 >= self.max_frames:
+            raise ValueError(f"区切る位置を探す長さ ({cut_lookback}秒) はセグメントの最大長の半分未満にしてください")
+        # 重なりと持ち越しの合計が大きいと、同じ音声を何度も送信することになる
+        if self.overlap_frames and self.lookback_frames and (self.overlap_frames + self.lookback_frames) * 2 >= self.max_frames:
+            raise ValueError(f"重なりの長さと区切る位置を探す長さの合計 ({overlap + cut_lookback}秒) は"
+                             f"セグメントの最大長の半分未満にしてください")
+        self.pre_roll_frames = int(pre_roll * 1000 / frame_duration_ms) if pre_roll is not None else None
+        if self.pre_roll_frames and self.pre_roll_frames * 2 >= self.max_frames:
+            raise ValueError(f"プリロールの長さ ({pre_roll}秒) はセグメントの最大長の半分未満にしてください")
+        self.hangover_frames = (int(hangover * 1000 / frame_duration_ms) if hangover is not None
+                                else int(self.silence_threshold_frames / 3))
+        self._pre_roll = collections.deque(maxlen=self.pre_roll_frames or 0)
+        
+        # フレームのエネルギーはリングバッファ上でまとめて計算する
+        self.frame_samples = int(sample_rate * frame_duration_ms / 1000)
+        self.frame_bytes = self.frame_samples * 2
+        self.ring = PCMRingBuffer(self.RING_SECONDS * 1000 // frame_duration_ms, self.frame_samples)
+        
+        # 分割途中のPCM・フレームのエネルギー・二乗和の累積（セグメント最大長分を事前確保）
+        self.buffer = PCMBuffer(max(1, self.max_frames) * self.frame_bytes)
+        self._energies = np.zeros(max(1, self.max_frames), dtype=np.float64)
+        self._cumulative_squares = np.zeros(max(1, self.max_frames), dtype=np.int64)
+        self._voiced = np.ones(max(1, self.max_frames), dtype=bool)
+        self.reset()
+    
+    def reset(self):
+        """分割状態を初期化します"""
+        self.buffer.detach()
+        self.frames_since_start = 0
+        self.frames_captured = 0  # 開始からの総フレーム数（セグメント位置の算出に使用）
+        self.silence_frames = 0
+        self._carried_frames = 0  # 前のセグメントから重ねたフレーム数
+        self._pre_roll.clear()
+        self._waiting_onset = self.pre_roll_frames is not None  # 発話の開始を待っている（フレームはプリロールにのみ保持）
+        self._pending_bytes = b''
+        if self.noise_tracker is not None:
+            self.noise_tracker.reset()
+            self.energy_threshold = self.noise_tracker.threshold
+    
+    def feed(self, data):
+        """
+        1フレームを追加し、区切りが確定した場合はセグメントを返します
+        
+        引数:
+            data (bytes): 1フレーム分のPCMデータ
+        
+        返値:
+            SpeechSegment or None: 区切られたセグメント（連番は未設定）
+        """
+        slot = self.ring.write_slot
+        energy = self.ring.write(data)[0]
+        voiced = self.vad.detect(self.ring.samples[slot:slot + 1])[0] if self.vad else True
+        return self._push_frame(data, energy, self.ring.square_sums[slot], voiced)
+    
+    def feed_pcm(self, pcm_data):
+        """
+        任意の長さのPCMデータを追加し、区切られたセグメントをすべて返します
+        
+        フレームのエネルギー（と発話検出）はリングバッファ上でまとめて計算します。
+        フレーム長に満たない端数は次回の呼び出しまで保持します。
+        
+        引数:
+            pcm_data (bytes-like): 16bit リトルエンディアンのPCMデータ
+        
+        返値:
+            list: 区切られたセグメント（SpeechSegment, 連番は未設定）のリスト
+        """
+        data = self._pending_bytes + bytes(pcm_data) if self._pending_bytes else bytes(pcm_data)
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending_bytes = data[usable:]
+        view = memoryview(data)
+        
+        segments = []
+        position = 0
+        while position < usable:
+            count = min((usable - position) // self.frame_bytes, self.ring.writable_frames())
+            block_end = position + count * self.frame_bytes
+            slot = self.ring.write_slot
+            energies = self.ring.write(view[position:block_end])
+            square_sums = self.ring.square_sums[slot:slot + count]
+            voiced = self.vad.detect(self.ring.samples[slot:slot + count]) if self.vad else None
+            for i in range(count):
+                frame_start = position + i * self.frame_bytes
+                segment = self._push_frame(view[frame_start:frame_start + self.frame_bytes], energies[i], square_sums[i],
+                                           voiced is None or voiced[i])
+                if segment is not None:
+                    segments.append(segment)
+            position = block_end
+        return segments
+    
+    def _push_frame(self, data, energy, square_sum, voiced=True):
+        """エネルギー計算済みのフレームを追加し、区切り条件を判定します"""
+        self.frames_captured += 1
+        if self.noise_tracker is not None:
+            self.energy_threshold = self.noise_tracker.update(energy)
+        
+        # 無音判定（発話検出器が音声でないと判定したフレームも無音とみなす）
+        silent = energy < self.energy_threshold or not voiced
+        
+        # 発話が始まるまではプリロールにだけ保持し、始まったら直前の分を先頭に付ける
+        if self._waiting_onset:
+            if silent:
+                self._pre_roll.append((bytes(data), energy, square_sum, voiced))
+                return None
+            self._waiting_onset = False
+            for frame in self._pre_roll:
+                self._append_frame(*frame)
+            self._pre_roll.clear()
+        
+        self._append_frame(data, energy, square_sum, voiced)
+        if silent:
+            self.silence_frames += 1
+        else:
+            self.silence_frames = 0
+        
+        # 1. 最大セグメント長に達した（最も静かな位置で区切り、残りと重なり分は次のセグメントへ持ち越す）
+        if self.frames_since_start >= self.max_frames:
+            count = self._quietest_cut() if self.lookback_frames >= self.CUT_RUN_FRAMES else self.frames_since_start
+            return self._cut('max_length', count, carry_from=count - self.overlap_frames)
+        
+        # 2. 無音が一定時間続いた（無音部分を少し含める）
+        if (self.silence_frames >= self.silence_threshold_frames
+                and self.frames_since_start > self.silence_threshold_frames * 2):
+            # 末尾の無音のうち先頭の hangover 分だけを残す
+            keep = self.frames_since_start - self.silence_frames + min(self.silence_frames, self.hangover_frames)
+            return self._cut('silence', keep)
+        
+        return None
+    
+    def _append_frame(self, data, energy, square_sum, voiced):
+        """分割途中のセグメントの末尾にフレームを書き込みます"""
+        index = self.frames_since_start
+        self._energies[index] = energy
+        self._voiced[index] = voiced
+        self._cumulative_squares[index] = square_sum + (self._cumulative_squares[index - 1] if index else 0)
+        self.buffer.append(data)
+        self.frames_since_start += 1
+    
+    def flush(self):
+        """
+        入力の終端で、分割途中のフレームをセグメントとして返します
+        
+        返値:
+            SpeechSegment or None: 残りのセグメント（Whisper APIの下限 0.1秒 に満たない場合はNone）
+        """
+        # 前のセグメントと重なる部分しか無い場合も転写しない
+        if (self.frames_since_start * self.frame_duration_ms < 100
+                or self.frames_since_start <= self._carried_frames):
+            self.reset()
+            return None
+        return self._cut('flush', self.frames_since_start)
+    
+    def peek(self):
+        """
+        分割途中のフレームを、分割状態を変えずにセグメントとして返します（暫定結果の転写に使用）
+        
+        返値:
+            SpeechSegment or None: 分割途中のセグメント（フレームが無い場合はNone）
+        """
+        if not self.frames_since_start:
+            return None
+        return self._segment('partial', self.frames_since_start, self.buffer.peek())
+    
+    def _quietest_cut(self):
+        """
+        直近 lookback_frames のうち、CUT_RUN_FRAMES 個の連続したフレームのエネルギーの和が最小になる区間を探します
+        
+        返値:
+            int: 区切る位置（区間の中央, 分割途中の先頭からのフレーム数）. 同じ静かさの区間が複数ある場合は後ろを選ぶ
+        """
+        end = self.frames_since_start
+        window = self._energies[end - self.lookback_frames:end]
+        cumulative = np.cumsum(window)
+        run = self.CUT_RUN_FRAMES
+        run_sums = cumulative[run - 1:] - np.concatenate(([0.0], cumulative[:-run]))
+        quietest = len(run_sums) - 1 - int(np.argmin(run_sums[::-1]))
+        return end - self.lookback_frames + quietest + run // 2
+    
+    def _cut(self, reason, count, carry_from=None):
+        """
+        現在のセグメントの先頭 count フレームを切り出して分割状態を次のセグメント用に戻します
+        
+        carry_from を指定した場合は、その位置以降のフレームを次のセグメントの先頭に持ち越します
+        （count より前から持ち越した分は、前のセグメントと重なる部分になります）。
+        """
+        total = self.frames_since_start
+        data = self.buffer.detach(total * self.frame_bytes)
+        segment = self._segment(reason, count, data[:count * self.frame_bytes])
+        self.frames_since_start = 0
+        self.silence_frames = 0
+        self._carried_frames = 0
+        if carry_from is not None and carry_from < total:
+            self._carry_over(data, carry_from, total, count - carry_from)
+        elif reason == 'silence' and self.pre_roll_frames is not None:
+            # 区切った後の無音は次の発話のプリロールとして保持する
+            self._waiting_onset = True
+            self._pre_roll.clear()
+            for index in range(max(count, total - self.pre_roll_frames), total):
+                square_sum = self._cumulative_squares[index] - (self._cumulative_squares[index - 1] if index else 0)
+                self._pre_roll.append((bytes(data[index * self.frame_bytes:(index + 1) * self.frame_bytes]),
+                                       self._energies[index], square_sum, self._voiced[index]))
+        return segment
+    
+    def _carry_over(self, data, start, end, overlap):
+        """切り出し前のフレーム [start, end) を次のセグメントの先頭に書き込みます"""
+        frames = end - start
+        self.buffer.append(data[start * self.frame_bytes:end * self.frame_bytes])
+        self._energies[:frames] = self._energies[start:end]
+        base = self._cumulative_squares[start - 1] if start else 0
+        self._cumulative_squares[:frames] = self._cumulative_squares[start:end] - base
+        self._voiced[:frames] = self._voiced[start:end]
+        self.frames_since_start = frames
+        self._carried_frames = max(0, overlap)
+        
+        # 持ち越したフレームの末尾から続く無音の長さを引き継ぐ
+        silent = (self._energies[:frames] < self.energy_threshold) | ~self._voiced[:frames]
+        voiced_frames = np.flatnonzero(~silent)
+        self.silence_frames = frames - 1 - int(voiced_frames[-1]) if len(voiced_frames) else frames
+    
+    def _segment(self, reason, count, pcm):
+        """分割途中のフレームの先頭 count フレームを表すセグメントを作成します"""
+        start_offset = (self.frames_captured - self.frames_since_start) * self.frame_duration_ms / 1000
+        return SpeechSegment(
+            None, pcm, start_offset,
+            start_offset + count * self.frame_duration_ms / 1000,
+            cut_reason=reason,
+            energies=self._energies[:count].copy(),
+            sum_squares=int(self._cumulative_squares[count - 1]) if count else 0,
+            voiced=self._voiced[:count].copy() if self.vad else None,
+            overlap_frames=min(self._carried_frames, count)
+        )
+    
+    def analyze_silence(self, segment):
+        """
+        音声セグメントが無音かどうかを判定します
+        
+        取り込み時に計算済みのフレームごとのエネルギーと二乗和を使用するため、
+        音声データを再度読み直すことはありません。
+        
+        引数:
+            segment (SpeechSegment): 判定する音声セグメント
+        
+        返値:
+            tuple: (無音の場合True, 全体の正規化エネルギー, 活発なフレームの割合)
+        """
+        count = len(segment.energies)
+        if not count:
+            return True, 0.0, 0.0
+        
+        # セグメント全体のRMSエネルギーを二乗和から計算
+        rms = math.sqrt(segment.sum_squares / (count * self.frame_samples))
+        normalized_energy = min(1000, rms / 32.767)
+        
+        # 活発な音声を含むフレームの割合を計算
+        active = segment.energies > self.energy_threshold
+        if segment.voiced is not None:
+            active &= segment.voiced
+        active_ratio = np.count_nonzero(active) / count
+        
+        # 無音判定：
+        # 1. 全体のエネルギーが閾値の50%より低い、かつ
+        # 2. 活発なフレームの割合が5%未満
+        # 発話検出器を使用する場合は、雑音で全体のエネルギーが大きくても 2. のみで判定する
+        if segment.voiced is not None:
+            is_silent = active_ratio < 0.05
+        else:
+            is_silent = normalized_energy < self.energy_threshold * 0.5 and active_ratio < 0.05
+        return is_silent, normalized_energy, active_ratio
+
+
+########################################################################
+# 送信前の無音の圧縮
+########################################################################
+class SegmentTimeMap:
+    """
+    無音を詰めて送信した音声上の時刻と、元の音声上の時刻の対応
+    
+    Attributes:
+        uploaded_starts (numpy.ndarray): 残した区間ごとの、送信した音声の先頭からの開始時刻（秒）
+        source_starts (numpy.ndarray): 残した区間ごとの、録音開始からの開始時刻（秒）
+        duration (float): 送信した音声の長さ（秒）
+    """
+    def __init__(self, uploaded_starts, source_starts, duration):
+        self.uploaded_starts = uploaded_starts
+        self.source_starts = source_starts
+        self.duration = duration
+    
+    def to_source(self, t):
+        """
+        送信した音声上の時刻を録音開始からの時刻に変換します
+        
+        引数:
+            t (float): 送信した音声の先頭からの時刻（秒）
+        
+        返値:
+            float: 録音開始からの時刻（秒）
+        """
+        index = max(0, int(np.searchsorted(self.uploaded_starts, t, side='right')) - 1)
+        return float(self.source_starts[index] + t - self.uploaded_starts[index])
+
+
+class SilenceCompactor:
+    """
+    送信前にセグメント内の無音を詰めて、APIに送信する音声を短くします
+    
+    取り込み時に計算済みのフレームごとのエネルギー（と発話検出の結果）から無音のフレームを求め、
+    発話の間の max_pause より長い無音は前後 max_pause 分だけを残して詰め、
+    セグメントの先頭と末尾の無音は edge まで削ります。
+    詰めた位置は SegmentTimeMap に記録し、元の音声上の時刻に戻せるようにします。
+    
+    Attributes:
+        frame_duration_ms (int): 1フレームの長さ（ミリ秒）
+        pause_frames (int): 発話の間に残す無音のフレーム数
+        edge_frames (int): 先頭と末尾に残す無音のフレーム数
+    """
+    # 詰めた後の音声の最小の長さ（ミリ秒, Whisper APIの下限）
+    MIN_DURATION_MS = 100
+    
+    def __init__(self, frame_duration_ms=20, max_pause=0.3, edge=None):
+        """
+        引数:
+            frame_duration_ms (int, optional): 1フレームの長さ（ミリ秒）
+            max_pause (float, optional): 発話の間に残す無音の長さ（秒）
+            edge (float, optional): 先頭と末尾に残す無音の長さ（秒）. 未指定時は max_pause の半分
+        """
+        self.frame_duration_ms = frame_duration_ms
+        self.pause_frames = int(max_pause * 1000 / frame_duration_ms)
+        self.edge_frames = int((max_pause / 2 if edge is None else edge) * 1000 / frame_duration_ms)
+    
+    def compact(self, segment, energy_threshold):
+        """
+        セグメントの無音を詰めたセグメントを返します
+        
+        引数:
+            segment (SpeechSegment): 送信するセグメント
+            energy_threshold (float): 無音判定の閾値 0-1000
+        
+        返値:
+            SpeechSegment: 無音を詰めたセグメント（詰める無音が無い場合は segment をそのまま返す）
+        """
+        count = len(segment.energies)
+        silent = segment.energies < energy_threshold
+        if segment.voiced is not None:
+            silent |= ~segment.voiced
+        if not count or silent.all():
+            return segment
+        
+        # 無音が続く区間ごとに残すフレームを決める
+        keep = np.ones(count, dtype=bool)
+        boundaries = np.flatnonzero(np.diff(np.concatenate(([0], silent.view(np.int8), [0]))))
+        for start, end in zip(boundaries[0::2], boundaries[1::2]):
+            if start == 0:
+                keep[:max(0, end - self.edge_frames)] = False
+            elif end == count:
+                keep[start + self.edge_frames:] = False
+            elif end - start > self.pause_frames:
+                head = (self.pause_frames + 1) // 2
+                keep[start + head:end - (self.pause_frames - head)] = False
+        kept = int(np.count_nonzero(keep))
+        if kept == count or kept * self.frame_duration_ms < self.MIN_DURATION_MS:
+            return segment
+        
+        frames = np.frombuffer(segment.pcm, dtype=np.int16).reshape(count, -1)[keep]
+        samples = frames.ravel().astype(np.int64)
+        
+        # 残した区間ごとの送信した音声上の位置と元の位置
+        frame_seconds = self.frame_duration_ms / 1000
+        run_starts = np.flatnonzero(keep & ~np.concatenate(([False], keep[:-1])))
+        time_map = SegmentTimeMap((np.cumsum(keep) - keep)[run_starts] * frame_seconds,
+                                  segment.start_offset + run_starts * frame_seconds,
+                                  kept * frame_seconds)
+        return SpeechSegment(
+            segment.sequence, memoryview(frames.tobytes()), segment.start_offset, segment.end_offset,
+            captured_at=segment.captured_at,
+            cut_reason=segment.cut_reason,
+            energies=segment.energies[keep],
+            sum_squares=int(np.dot(samples, samples)),
+            voiced=segment.voiced[keep] if segment.voiced is not None else None,
+            overlap_frames=int(np.count_nonzero(keep[:segment.overlap_frames])),
+            time_map=time_map
+        )
+
+
+########################################################################
+# 音声の取り込み
+########################################################################
+class CaptureRingBuffer:
+    """
+    コールバックで取り込んだPCMを格納する事前確保済みのリングバッファ
+    
+    書き込み（PyAudio のコールバック）と読み出し（セグメント分割のスレッド）が
+    それぞれ1つずつの場合に、ロックを使わずに受け渡します。
+    書き込み側と読み出し側はそれぞれ自分の累計バイト数だけを更新します。
+    
+    Attributes:
+        capacity (int): 格納できるバイト数
+        written (int): これまでに書き込んだ総バイト数
+        consumed (int): これまでに読み出した総バイト数
+        overflows (int): バッファが満杯で取り込みデータを破棄した回数
+        dropped_bytes (int): 破棄したバイト数
+        input_overflows (int): PortAudio が入力オーバーフローを報告した回数
+        input_underflows (int): PortAudio が入力アンダーフローを報告した回数
+    """
+    def __init__(self, capacity):
+        """
+        引数:
+            capacity (int): 格納できるバイト数
+        """
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self._view = memoryview(self._data)
+        self.written = 0
+        self.consumed = 0
+        self.overflows = 0
+        self.dropped_bytes = 0
+        self.input_overflows = 0
+        self.input_underflows = 0
+    
+    def available(self):
+        """読み出し可能なバイト数"""
+        return self.written - self.consumed
+    
+    def write(self, data, status_flags=0):
+        """
+        取り込んだデータを書き込みます（書き込み側のスレッドから呼び出します）
+        
+        引数:
+            data (bytes-like): 取り込んだPCMデータ
+            status_flags (int, optional): PortAudio から渡されたステータス
+        
+        返値:
+            bool: 書き込めた場合はTrue（満杯で破棄した場合はFalse）
+        """
+        if status_flags & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if status_flags & pyaudio.paInputUnderflow:
+            self.input_underflows += 1
+        
+        size = len(data)
+        if size > self.capacity - (self.written - self.consumed):
+            # 読み出しが追いつかない場合は新しいデータを破棄する（書き込み側は待たない）
+            self.overflows += 1
+            self.dropped_bytes += size
+            return False
+        
+        start = self.written % self.capacity
+        first = min(size, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        if first < size:
+            self._view[:size - first] = data[first:]
+        self.written += size
+        return True
+    
+    def read(self, max_bytes=None):
+        """
+        溜まっているデータを読み出します（読み出し側のスレッドから呼び出します）
+        
+        引数:
+            max_bytes (int, optional): 読み出す最大バイト数
+        
+        返値:
+            bytes: 読み出したデータ（無い場合は空）
+        """
+        size = self.written - self.consumed
+        if max_bytes is not None:
+            size = min(size, max_bytes)
+        if size <= 0:
+            return b''
+        
+        start = self.consumed % self.capacity
+        first = min(size, self.capacity - start)
+        if first < size:
+            data = bytes(self._view[start:]) + bytes(self._view[:size - first])
+        else:
+            data = bytes(self._view[start:start + size])
+        self.consumed += size
+        return data
+    
+    def stats(self):
+        """
+        取り込みの統計情報を返します
+        
+        返値:
+            dict: バッファの使用量、オーバーフロー・アンダーフローの回数など
+        """
+        return {
+            'buffered_bytes': self.available(),
+            'capacity': self.capacity,
+            'written_bytes': self.written,
+            'overflows': self.overflows,
+            'dropped_bytes': self.dropped_bytes,
+            'input_overflows': self.input_overflows,
+            'input_underflows': self.input_underflows,
+        }
+
+
+class AudioSource(abc.ABC):
+    """
+    転写する音声の入力元
+    
+    read() で 16bit・モノラル・sample_rate のPCMを先頭から順に返します。
+    マイクのように実時間で届く入力元（realtime=True）と、ファイルのように
+    処理できる速さで読み出せる入力元があります。
+    
+    Attributes:
+        name (str): 表示用の名前
+        sample_rate (int): サンプリングレート
+        realtime (bool): 実時間で届く入力元の場合True
+    """
+    name = 'source'
+    realtime = False
+    
+    def __init__(self, sample_rate=16000):
+        """
+        引数:
+            sample_rate (int, optional): サンプリングレート
+        """
+        self.sample_rate = sample_rate
+    
+    @property
+    def bytes_per_second(self):
+        """1秒あたりのPCMのバイト数"""
+        return self.sample_rate * 2
+    
+    @property
+    def overflows(self):
+        """取り込みが追いつかずに音声を破棄した回数"""
+        return 0
+    
+    def open(self):
+        """入力を開始します"""
+    
+    @abc.abstractmethod
+    def read(self, max_bytes):
+        """
+        PCMデータを読み出します
+        
+        引数:
+            max_bytes (int): 読み出す最大バイト数
+        
+        返値:
+            bytes or None: PCMデータ（まだ届いていない場合は空、終端に達した場合はNone）
+        """
+    
+    def close(self):
+        """入力を終了します"""
+    
+    def stats(self):
+        """
+        取り込みの統計情報を返します
+        
+        返値:
+            dict: 入力元ごとの統計情報
+        """
+        return {}
+
+
+class MicrophoneSource(AudioSource):
+    """
+    PyAudio でマイクから取り込む入力元
+    
+    callback 方式では PyAudio のコールバックが CaptureRingBuffer にコピーするだけにし、
+    読み出し側の処理が遅れても（バッファが満杯になるまで）音声を失いません。
+    blocking 方式では read() の中でストリームから読み取ります。
+    """
+    name = 'microphone'
+    realtime = True
+    
+    # マイクの取り込み方式
+    CAPTURE_MODES = ('callback', 'blocking')
+    
+    # callback 方式で取り込んだ音声を保持できる長さ（秒）
+    CAPTURE_BUFFER_SECONDS = 5
+    
+    def __init__(self, sample_rate=16000, frames_per_buffer=320, capture_mode='callback'):
+        """
+        引数:
+            sample_rate (int, optional): サンプリングレート
+            frames_per_buffer (int, optional): 1回の取り込みのサンプル数
+            capture_mode (str, optional): 取り込み方式 (callback / blocking)
+        """
+        super().__init__(sample_rate)
+        if capture_mode not in self.CAPTURE_MODES:
+            raise ValueError(f"未対応の取り込み方式です: {capture_mode}")
+        self.frames_per_buffer = frames_per_buffer
+        self.capture_mode = capture_mode
+        self.capture_buffer = None
+        self.audio = None
+        self.stream = None
+    
+    @property
+    def overflows(self):
+        return self.capture_buffer.overflows if self.capture_buffer else 0
+    
+    def open(self):
+        # PyAudioインスタンスを作成
+        self.audio = pyaudio.PyAudio()
+        
+        # callback 方式ではコールバックがリングバッファにコピーするだけにする
+        stream_callback = None
+        self.capture_buffer = None
+        if self.capture_mode == 'callback':
+            self.capture_buffer = CaptureRingBuffer(int(self.CAPTURE_BUFFER_SECONDS * self.bytes_per_second))
+            stream_callback = self._capture_callback
+        
+        # オーディオストリームを開く
+        try:
+            self.stream = self.audio.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=self.sample_rate,
+                input=True,
+                frames_per_buffer=self.frames_per_buffer,
+                stream_callback=stream_callback
+            )
+        except Exception as e:
+            self.audio.terminate()
+            self.audio = None
+            raise RuntimeError(f"マイクへのアクセスに失敗しました: {e}")
+    
+    def _capture_callback(self, in_data, frame_count, time_info, status_flags):
+        """PyAudio のコールバック：取り込んだ音声をリングバッファにコピーするだけにします"""
+        self.capture_buffer.write(in_data, status_flags)
+        return (None, pyaudio.paContinue)
+    
+    def read(self, max_bytes):
+        if self.capture_buffer is not None:
+            return self.capture_buffer.read(max_bytes)
+        
+        # 音声データを読み取り（処理が遅れて複数フレーム溜まっている場合はまとめて読み取る）
+        available_frames = self.stream.get_read_available() // self.frames_per_buffer
+        read_frames = max(1, min(available_frames, max_bytes // (self.frames_per_buffer * 2)))
+        return self.stream.read(self.frames_per_buffer * read_frames, exception_on_overflow=False)
+    
+    def close(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio:
+            self.audio.terminate()
+            self.audio = None
+    
+    def stats(self):
+        return self.capture_buffer.stats() if self.capture_buffer else {}
+
+
+class FileSource(AudioSource):
+    """
+    音声ファイル（WAV / FLAC など）を読み出す入力元
+    
+    16bit・モノラル・同じサンプリングレートのWAVはそのまま読み出し、
+    それ以外の形式は ffmpeg で変換しながら読み出します。
+    realtime=False の場合は処理できる速さで読み出します（実時間より高速に処理できます）。
+    """
+    name = 'file'
+    
+    def __init__(self, path, sample_rate=16000, realtime=False):
+        """
+        引数:
+            path (str): 音声ファイルのパス
+            sample_rate (int, optional): サンプリングレート
+            realtime (bool, optional): 実時間と同じ速さで読み出す場合True
+        """
+        super().__init__(sample_rate)
+        self.path = path
+        self.realtime = realtime
+        self._wave = None
+        self._process = None
+        self._failed = False
+        self._started_at = None
+        self.bytes_read = 0
+    
+    def open(self):
+        try:
+            wf = wave.open(self.path, 'rb')
+        except (wave.Error, EOFError):
+            wf = None
+        if wf and (wf.getnchannels(), wf.getsampwidth(), wf.getframerate()) == (1, 2, self.sample_rate):
+            self._wave = wf
+        else:
+            if wf:
+                wf.close()
+            # WAV以外、または形式が異なる場合は ffmpeg で 16bit・モノラルのPCMに変換する
+            self._process = subprocess.Popen(
+                [AudioSegment.converter, '-v', 'error', '-nostdin', '-i', self.path,
+                 '-f', 's16le', '-ac', '1', '-ar', str(self.sample_rate), '-'],
+                stdout=subprocess.PIPE
+            )
+        self._failed = False
+        self._started_at = time.monotonic()
+        self.bytes_read = 0
+    
+    def read(self, max_bytes):
+        if self.realtime:
+            # 経過時間分だけ読み出す
+            elapsed_bytes = int((time.monotonic() - self._started_at) * self.bytes_per_second)
+            max_bytes = min(max_bytes, (elapsed_bytes - self.bytes_read) // 2 * 2)
+            if max_bytes <= 0:
+                return b''
+        
+        if self._wave:
+            data = self._wave.readframes(max_bytes // 2)
+        else:
+            data = self._process.stdout.read(max_bytes)
+        if not data:
+            if self._process and not self._failed and self._process.wait() != 0:
+                self._failed = True
+                raise RuntimeError(f"ffmpeg で音声ファイルを読み込めませんでした: {self.path}")
+            return None
+        self.bytes_read += len(data)
+        return data
+    
+    def close(self):
+        if self._wave:
+            self._wave.close()
+            self._wave = None
+        if self._process:
+            self._process.stdout.close()
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process = None
+    
+    def stats(self):
+        return {'audio_seconds': self.bytes_read / self.bytes_per_second}
+
+
+class RawPCMSource(AudioSource):
+    """
+    標準入力や名前付きパイプから 16bit・モノラルの生PCMを読み出す入力元
+    
+    書き込み側が送った分だけ読み出し、書き込み側が閉じた時点で終端とします。
+    """
+    name = 'pcm'
+    
+    def __init__(self, path='-', sample_rate=16000):
+        """
+        引数:
+            path (str, optional): 名前付きパイプやファイルのパス（'-' の場合は標準入力）
+            sample_rate (int, optional): サンプリングレート
+        """
+        super().__init__(sample_rate)
+        self.path = path
+        self._file = None
+        self.bytes_read = 0
+    
+    def open(self):
+        # 名前付きパイプの場合は書き込み側が開くまで待つ
+        self._file = sys.stdin.buffer if self.path == '-' else open(self.path, 'rb')
+        self.bytes_read = 0
+    
+    def read(self, max_bytes):
+        data = self._file.read1(max_bytes)
+        if not data:
+            return None
+        self.bytes_read += len(data)
+        return data
+    
+    def close(self):
+        if self._file and self._file is not sys.stdin.buffer:
+            self._file.close()
+        self._file = None
+    
+    def stats(self):
+        return {'audio_seconds': self.bytes_read / self.bytes_per_second}
+
+
+# 拡張子で生PCMとみなすファイル
+RAW_PCM_EXTENSIONS = ('.pcm', '.raw', '.s16le')
+
+
+def open_audio_source(spec=None, sample_rate=16000, realtime=False, capture_mode='callback', frames_per_buffer=320):
+    """
+    入力の指定から音声の入力元を作成します
+    
+    引数:
+        spec (str, optional): 'mic'（未指定時）, '-'（標準入力の生PCM）, 名前付きパイプ、または音声ファイルのパス
+        sample_rate (int, optional): サンプリングレート
+        realtime (bool, optional): ファイルを実時間と同じ速さで読み出す場合True
+        capture_mode (str, optional): マイクの取り込み方式 (callback / blocking)
+        frames_per_buffer (int, optional): マイクの1回の取り込みのサンプル数
+    
+    返値:
+        AudioSource: 入力元
+    
+    例外:
+        FileNotFoundError: 指定したファイルが存在しない場合
+    """
+    if spec in (None, 'mic'):
+        return MicrophoneSource(sample_rate, frames_per_buffer=frames_per_buffer, capture_mode=capture_mode)
+    if spec == '-':
+        return RawPCMSource('-', sample_rate)
+    if not os.path.exists(spec):
+        raise FileNotFoundError(f"入力ファイルが見つかりません: {spec}")
+    if stat.S_ISFIFO(os.stat(spec).st_mode) or spec.lower().endswith(RAW_PCM_EXTENSIONS):
+        return RawPCMSource(spec, sample_rate)
+    return FileSource(spec, sample_rate, realtime=realtime)
+
+
+########################################################################
+# 転写結果の並べ替え
+########################################################################
+class ResultSequencer:
+    """
+    並行して転写されたセグメントの結果を取り込み順に並べ替えて出力します
+    
+    連番の抜けがある間は後続の結果を保留し、抜けが埋まった時点でまとめて出力します。
+    先に届いた結果が max_wait 秒を超えて保留された場合は抜けを諦めて先に進み、
+    後から届いた結果はその時点で（順不同として）出力します。
+    
+    Attributes:
+        max_wait (float): 抜けを待つ最大時間（秒）
+        next_sequence (int): 次に出力する連番
+    """
+    def __init__(self, on_release, max_wait=5.0, first_sequence=0):
+        """
+        引数:
+            on_release (callable): (連番, 結果, 順序どおりか) を受け取る関数。
+                ロック内で呼び出されるため、短時間で戻る必要があります
+            max_wait (float, optional): 抜けを待つ最大時間（秒）
+            first_sequence (int, optional): 最初の連番
+        """
+        self.on_release = on_release
+        self.max_wait = max_wait
+        self.next_sequence = first_sequence
+        self._pending = {}  # 連番 -> (結果, 到着時刻)
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.out_of_order = 0
+    
+    def start(self):
+        """待ち時間を監視するスレッドを起動します"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._watch, name='result-sequencer')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def submit(self, sequence, result):
+        """
+        セグメントの結果を登録します
+        
+        引数:
+            sequence (int): セグメントの連番
+            result: 転写結果。出力するものが無い場合はNone
+        """
+        with self._condition:
+            if sequence < self.next_sequence:
+                # 待ち時間を超えて諦めた後に届いた結果
+                if result is not None:
+                    self.out_of_order += 1
+                    self.on_release(sequence, result, False)
+                return
+            self._pending[sequence] = (result, time.monotonic())
+            self._release_ready()
+            self._condition.notify_all()
+    
+    def skip(self, sequence):
+        """結果を出力しないセグメント（破棄・連結されたもの等）を登録します"""
+        self.submit(sequence, None)
+    
+    def _release_ready(self):
+        """連番が揃っている結果を出力します（ロック内で呼び出すこと）"""
+        while self.next_sequence in self._pending:
+            result, _ = self._pending.pop(self.next_sequence)
+            if result is not None:
+                self.on_release(self.next_sequence, result, True)
+            self.next_sequence += 1
+    
+    def _watch(self):
+        """保留中の結果が max_wait を超えたら抜けを諦めて出力を進めます"""
+        with self._condition:
+            while self._running:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                oldest = min(arrived for _, arrived in self._pending.values())
+                remaining = oldest + self.max_wait - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self.next_sequence = min(self._pending)
+                self._release_ready()
+    
+    def flush(self):
+        """保留中の結果を抜けを無視してすべて連番順に出力します"""
+        with self._condition:
+            while self._pending:
+                self.next_sequence = min(self._pending)
+                self._release_ready()
+    
+    def stop(self):
+        """保留中の結果を出力し、監視スレッドを停止します"""
+        self.flush()
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+
+########################################################################
+# 転写ワーカープール
+########################################################################
+class TranscriptionWorkerPool:
+    """
+    固定数のワーカースレッドと上限付きキューでセグメントの転写を実行します
+    
+    APIの応答が遅くなってもスレッドが際限なく増えないよう、同時実行数と
+    待ち行列の長さを制限します。キューが満杯のときの動作は overflow_policy で指定します。
+    
+    - block: 空きができるまで投入側を待たせる（音声取得側にバックプレッシャーがかかります）
+    - drop_oldest: 最も古い待ちセグメントを破棄して新しいセグメントを入れる
+    - merge: 新しいセグメントを直前の待ちセグメントに連結する（リクエスト数を減らします）
+    
+    Attributes:
+        num_workers (int): ワーカースレッド数
+        max_queue_size (int): 待ち行列の最大長
+        overflow_policy (str): キューが満杯のときの動作
+    """
+    OVERFLOW_POLICIES = ('block', 'drop_oldest', 'merge')
+    
+    def __init__(self, handler, num_workers=4, max_queue_size=8,
+                 overflow_policy='block', merge_fn=None, on_drop=None, on_error=None, name='transcribe'):
+        """
+        引数:
+            handler (callable): キューから取り出した要素を処理する関数
+            num_workers (int, optional): ワーカースレッド数
+            max_queue_size (int, optional): 待ち行列の最大長
+            overflow_policy (str, optional): block / drop_oldest / merge
+            merge_fn (callable, optional): merge 時に (待ち要素, 新要素) から連結した要素を返す関数
+            on_drop (callable, optional): drop_oldest で破棄された要素を受け取る関数
+            on_error (callable, optional): handler が送出した例外を (要素, 例外) で受け取る関数。
+                except 節の中で呼び出されるため traceback.print_exc() でスタックトレースを表示できます
+            name (str, optional): スレッド名の接頭辞
+        """
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"未対応のキューあふれ時の動作です: {overflow_policy} (選択肢: {', '.join(self.OVERFLOW_POLICIES)})")
+        if overflow_policy == 'merge' and merge_fn is None:
+            raise ValueError("merge を使用するには merge_fn が必要です")
+        
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.overflow_policy = overflow_policy
+        self.merge_fn = merge_fn
+        self.on_drop = on_drop
+        self.on_error = on_error
+        self.name = name
+        
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+        
+        # 統計情報
+        self._busy_workers = 0
+        self._busy_time = 0.0
+        self._started_at = None
+        self._submitted = 0
+        self._completed = 0
+        self._dropped = 0
+        self._merged = 0
+        self._failed = 0
+        self._peak_queue_depth = 0
+    
+    def start(self):
+        """ワーカースレッドを起動します"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._started_at = time.perf_counter()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+    
+    def submit(self, item):
+        """
+        要素をキューに投入します
+        
+        引数:
+            item: handler に渡す要素
+        
+        返値:
+            bool: キューに投入（または連結）された場合はTrue、停止中の場合はFalse
+        """
+        dropped = None
+        with self._condition:
+            if not self._running:
+                return False
+            self._submitted += 1
+            
+            if len(self._queue) >= self.max_queue_size:
+                if self.overflow_policy == 'block':
+                    while self._running and len(self._queue) >= self.max_queue_size:
+                        self._condition.wait()
+                    if not self._running:
+                        return False
+                elif self.overflow_policy == 'drop_oldest':
+                    dropped = self._queue.popleft()
+                    self._dropped += 1
+                else:
+                    # 直前の待ちセグメントに連結（キュー長は増えない）
+                    self._queue[-1] = self.merge_fn(self._queue[-1], item)
+                    self._merged += 1
+                    return True
+            
+            self._queue.append(item)
+            self._peak_queue_depth = max(self._peak_queue_depth, len(self._queue))
+            self._condition.notify_all()
+        
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped)
+        return True
+    
+    def _worker(self):
+        """キューから要素を取り出して handler を実行するワーカーループ"""
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                self._busy_workers += 1
+                self._condition.notify_all()
+            
+            start_time = time.perf_counter()
+            try:
+                self.handler(item)
+            except Exception as e:
+                # handler 側で処理しきれなかった例外でワーカーを終了させない
+                with self._condition:
+                    self._failed += 1
+                if self.on_error:
+                    self.on_error(item, e)
+            finally:
+                with self._condition:
+                    self._busy_workers -= 1
+                    self._busy_time += time.perf_counter() - start_time
+                    self._completed += 1
+                    self._condition.notify_all()
+    
+    def wait_idle(self, timeout=None):
+        """
+        キューが空になり、実行中の処理がすべて終わるまで待機します
+        
+        返値:
+            bool: タイムアウト前にすべて完了した場合はTrue
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._queue or self._busy_workers:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+    
+    def stop(self, drain=True, timeout=None):
+        """
+        ワーカーを停止します
+        
+        引数:
+            drain (bool, optional): Trueの場合は待ち行列を処理し終えるまで待機します
+            timeout (float, optional): drain時の最大待機時間（秒）
+        
+        返値:
+            bool: 待ち行列をすべて処理し終えた場合はTrue
+        """
+        completed = self.wait_idle(timeout) if drain else False
+        with self._condition:
+            self._running = False
+            if not drain:
+                self._queue.clear()
+            self._condition.notify_all()
+        return completed
+    
+    def stats(self):
+        """
+        キューの深さとワーカーの稼働状況を返します
+        
+        返値:
+            dict: queue_depth, peak_queue_depth, busy_workers, num_workers, utilization,
+                  submitted, completed, dropped, merged, failed
+        """
+        with self._condition:
+            elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+            utilization = self._busy_time / (elapsed * self.num_workers) if elapsed > 0 else 0.0
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_size': self.max_queue_size,
+                'peak_queue_depth': self._peak_queue_depth,
+                'busy_workers': self._busy_workers,
+                'num_workers': self.num_workers,
+                'utilization': min(1.0, utilization),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'dropped': self._dropped,
+                'merged': self._merged,
+                'failed': self._failed,
+            }
+
+
+########################################################################
+# 計測値（メトリクス）
+########################################################################
+# 時間のヒストグラムの区切り（秒）
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    """
+    ラベルの組ごとに値を保持する計測値の基底クラス
+    
+    Attributes:
+        name (str): 計測値の名前（接頭辞を含む）
+        help_text (str): 説明
+        label_names (tuple): ラベル名
+    """
+    kind = 'untyped'
+    
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        """ラベルの値をラベル名の順に並べたタプルを返します"""
+        return tuple(str(labels[name]) for name in self.label_names)
+    
+    def samples(self):
+        """(接尾辞, ラベルの値, 値) の一覧を返します"""
+        with self._lock:
+            return [('', key, value) for key, value in sorted(self._values.items())]
+    
+    def snapshot(self):
+        """ラベルがなければ値を、あればラベルの値ごとの辞書を返します"""
+        with self._lock:
+            if not self.label_names:
+                return self._values.get((), 0)
+            return {','.join(key): value for key, value in sorted(self._values.items())}
+
+
+class Counter(_Metric):
+    """増加のみする計測値（件数、バイト数など）"""
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        """
+        値を増やします
+        
+        引数:
+            amount (float, optional): 増分
+            **labels: ラベルの値
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    増減する計測値（実行中のリクエスト数など）
+    
+    fn を指定した場合は、取得のたびに fn() の値を返します。
+    """
+    kind = 'gauge'
+    
+    def __init__(self, name, help_text, label_names=(), fn=None):
+        super().__init__(name, help_text, label_names)
+        self.fn = fn
+    
+    def set(self, value, **labels):
+        """値を設定します"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount=1, **labels):
+        """値を増やします"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        """値を減らします"""
+        self.inc(-amount, **labels)
+    
+    def samples(self):
+        if self.fn is not None:
+            return [('', (), self.fn())]
+        return super().samples()
+    
+    def snapshot(self):
+        if self.fn is not None:
+            return self.fn()
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    """
+    値の分布を区切りごとの件数で保持する計測値（処理時間など）
+    
+    Attributes:
+        buckets (tuple): 区切りの上限値（昇順）
+    """
+    kind = 'histogram'
+    
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        """
+        値を記録します
+        
+        引数:
+            value (float): 記録する値
+            **labels: ラベルの値
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [区切りごとの件数（最後は +Inf）, 合計, 件数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+    
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    samples.append(('_bucket', key + (le,), cumulative))
+                samples.append(('_sum', key, total))
+                samples.append(('_count', key, count))
+        return samples
+    
+    def snapshot(self):
+        def summarize(state):
+            counts, total, count = state
+            return {'count': count, 'sum': total, 'mean': total / count if count else 0.0}
+        with self._lock:
+            if not self.label_names:
+                state = self._values.get(())
+                return summarize(state) if state else {'count': 0, 'sum': 0.0, 'mean': 0.0}
+            return {','.join(key): summarize(state) for key, state in sorted(self._values.items())}
+
+
+def _escape_label(value):
+    """Prometheus のラベル値をエスケープします"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """
+    計測値の登録先
+    
+    同じ名前で登録した場合は既存の計測値を返すため、複数の転写器で共有できます。
+    snapshot() で辞書として、render() で Prometheus のテキスト形式で取得します。
+    
+    Attributes:
+        prefix (str): 計測値の名前の接頭辞
+    """
+    
+    def __init__(self, prefix='whisperlive'):
+        """
+        Args:
+            prefix (str, optional): 計測値の名前の接頭辞. デフォルト "whisperlive"
+        """
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, cls, name, help_text, label_names, **kwargs):
+        full_name = f"{self.prefix}_{name}" if self.prefix else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, help_text, label_names, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"計測値 {full_name} は {metric.kind} として登録済みです")
+            return metric
+    
+    def counter(self, name, help_text, label_names=()):
+        """Counter を登録して返します"""
+        return self._register(Counter, name, help_text, label_names)
+    
+    def gauge(self, name, help_text, label_names=(), fn=None):
+        """Gauge を登録して返します（fn は最後に登録したものが使用されます）"""
+        gauge = self._register(Gauge, name, help_text, label_names)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+    
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        """Histogram を登録して返します"""
+        return self._register(Histogram, name, help_text, label_names, buckets=buckets)
+    
+    def snapshot(self):
+        """
+        すべての計測値の現在値を返します
+        
+        返値:
+            dict: 計測値の名前（接頭辞を除く）と値. ラベルのある計測値はラベルの値ごとの辞書、
+                Histogram は count / sum / mean の辞書
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        offset = len(self.prefix) + 1 if self.prefix else 0
+        return {metric.name[offset:]: metric.snapshot() for metric in metrics}
+    
+    def render(self):
+        """
+        すべての計測値を Prometheus のテキスト形式で返します
+        
+        返値:
+            str: text/plain; version=0.0.4 の本文
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, value in metric.samples():
+                names = metric.label_names + (('le',) if suffix == '_bucket' else ())
+                labels = ','.join(f'{name}="{_escape_label(v)}"' for name, v in zip(names, key))
+                lines.append(f"{metric.name}{suffix}{{{labels}}} {value}" if labels else f"{metric.name}{suffix} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """GET /metrics に Prometheus のテキスト形式で応答するハンドラ"""
+    
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    計測値を HTTP の /metrics で公開するサーバー（Prometheus から収集する場合に使用）
+    
+    Attributes:
+        registry (MetricsRegistry): 公開する計測値
+        host (str): 待ち受けアドレス
+        port (int): 待ち受けポート（0 を指定した場合は start() 後に実際のポート）
+    """
+    
+    def __init__(self, registry, host='127.0.0.1', port=9464):
+        """
+        Args:
+            registry (MetricsRegistry): 公開する計測値
+            host (str, optional): 待ち受けアドレス. デフォルト "127.0.0.1"
+            port (int, optional): 待ち受けポート. デフォルト 9464
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._httpd = None
+    
+    @property
+    def url(self):
+        """/metrics のURL"""
+        return f"http://{self.host}:{self.port}/metrics"
+    
+    def start(self):
+        """別スレッドで待ち受けを開始します"""
+        self._httpd = http.server.ThreadingHTTPServer((self.host, self.port), _MetricsRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.registry = self.registry
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        """待ち受けを終了します"""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+class TranscriberMetrics:
+    """
+    WhisperLiveTranscriber の計測値
+    
+    Attributes:
+        registry (MetricsRegistry): 計測値の登録先
+    """
+    
+    # segments_total の outcome ラベル
+    #   emitted: 転写結果を出力, silent: 無音のため送信せず, low_confidence: 確信度が閾値未満,
+    #   empty: 転写結果が空（APIエラーを含む。内訳は api_errors_total）, failed: 転写処理中の例外,
+    #   dropped / merged: 転写待ちが上限に達して破棄・連結
+    SEGMENT_OUTCOMES = ('emitted', 'silent', 'low_confidence', 'empty', 'failed', 'dropped', 'merged')
+    
+    def __init__(self, registry, circuit_breaker=None, rate_limiter=None, segmenter=None):
+        """
+        Args:
+            registry (MetricsRegistry): 計測値の登録先
+            circuit_breaker (CircuitBreaker, optional): 状態を公開するサーキットブレーカー
+            rate_limiter (APIRateGovernor, optional): 同時実行数の上限を公開するレート制限
+            segmenter (AudioSegmenter, optional): 無音判定の閾値と推定した雑音レベルを公開するセグメント分割器
+        """
+        self.registry = registry
+        self.started_at = time.monotonic()
+        self.segments_cut = registry.counter('segments_cut_total', '分割したセグメント数', ('reason',))
+        self.segments = registry.counter('segments_total', 'セグメントの処理結果ごとの件数', ('outcome',))
+        self.audio_seconds = registry.counter('audio_seconds_total', '入力から読み取った音声の長さ（秒）')
+        self.transcribed_seconds = registry.counter('transcribed_audio_seconds_total', 'APIに送信した音声の長さ（秒）')
+        self.compacted_seconds = registry.counter('compacted_audio_seconds_total', '送信前に詰めた無音の長さ（秒）')
+        self.encode_seconds = registry.histogram('encode_seconds', 'セグメントのエンコード時間（秒）', ('codec',))
+        self.upload_bytes = registry.counter('upload_bytes_total', 'APIに送信した音声データのバイト数', ('codec',))
+        self.request_seconds = registry.histogram('request_seconds', 'API呼び出しの所要時間（秒）')
+        self.requests_in_flight = registry.gauge('requests_in_flight', '応答待ちのAPIリクエスト数')
+        self.api_errors = registry.counter('api_errors_total', 'APIエラーの件数（HTTPステータスまたは timeout / connection / other）', ('code',))
+        self.retries = registry.counter('retries_total', 'APIリクエストの再試行回数')
+        self.deferred = registry.counter('segments_deferred_total', 'APIが利用できないため転写を保留した回数')
+        self.deferred_pending = registry.gauge('deferred_segments', '転写を保留中のセグメント数')
+        self.partials = registry.counter('partial_requests_total',
+                                         '暫定結果のリクエスト数（shown: 表示, stale: 確定済みのため破棄, empty: 結果が空, failed: エラー）',
+                                         ('outcome',))
+        if circuit_breaker is not None:
+            states = {'closed': 0, 'half_open': 1, 'open': 2}
+            registry.gauge('circuit_state', 'サーキットブレーカーの状態（0: closed, 1: half_open, 2: open）',
+                           fn=lambda: states[circuit_breaker.state])
+        self.rate_limit_wait = registry.histogram('rate_limit_wait_seconds', 'レート制限・同時実行数の上限で待った時間（秒）')
+        if rate_limiter is not None and rate_limiter.concurrency_limit is not None:
+            registry.gauge('concurrency_limit', 'AIMD で調整した同時実行数の上限',
+                           fn=lambda: rate_limiter.concurrency_limit)
+        if segmenter is not None:
+            registry.gauge('energy_threshold', '現在の無音判定の閾値（0-1000）',
+                           fn=lambda: segmenter.energy_threshold)
+            tracker = segmenter.noise_tracker
+            if tracker is not None:
+                registry.gauge('noise_floor', '推定した背景雑音のレベル（0-1000）',
+                               fn=lambda: tracker.noise_floor or 0.0)
+        self.uptime = registry.gauge('uptime_seconds', '録音を開始してからの経過時間（秒）',
+                                     fn=lambda: time.monotonic() - self.started_at)
+        self.realtime_factor = registry.gauge('realtime_factor', '経過時間に対する処理した音声の長さの比',
+                                              fn=self._realtime_factor)
+    
+    def start(self):
+        """経過時間の起点を現在時刻にします"""
+        self.started_at = time.monotonic()
+    
+    def _realtime_factor(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.audio_seconds.snapshot() / elapsed if elapsed > 0 else 0.0
+
 
 ########################################################################
 # WhisperLiveTranscriber クラス
@@ -27,15 +3100,42 @@ class WhisperLiveTranscriber:
         confidence_threshold (float): 確信度の閾値
         skip_silence (bool): 無音区間スキップの有効/無効
         debug_mode (bool): デバッグモードの有効/無効
+        upload_codec (str): アップロード時のコーデック名、または 'auto'
+        http_client (WhisperHTTPClient): API呼び出しに使用する接続プール
+        worker_pool (TranscriptionWorkerPool): 転写処理を実行するワーカープール
+        source (AudioSource): 音声の入力元（マイク、ファイル、標準入力など）
+        on_transcription (callable): 転写結果が確定するたびに（取り込み順で）呼び出される関数
+        metrics (TranscriberMetrics): 計測値（無効時はNone）
+        rate_limiter (APIRateGovernor): API利用枠に合わせたレート制限（無効時はNone）
+        noise_tracker (NoiseFloorTracker): 無音判定の閾値を自動調整する雑音レベルの推定器（無効時はNone）
     """
     
+    # 録音停止時に転写待ちセグメントの処理を待つ最大時間（秒）
+    STOP_DRAIN_TIMEOUT = 10.0
+    
+    # 一度に読み取る最大フレーム数
+    MAX_READ_FRAMES = 50
+    
+    # 一時的なエラーで再試行を打ち切ったセグメントを保留し直す回数の上限
+    MAX_DEFER_ROUNDS = 3
+    
     ########################################################################
     # コンストラクタ
     ########################################################################
     def __init__(self, api_key, language='ja', sample_rate=16000, 
                  segment_length=10, energy_threshold=70, 
                  silence_duration=1.0, confidence_threshold=0.3,
-                 skip_silence=True, debug_mode=False):
+                 skip_silence=True, debug_mode=False, debug_audio_dir=None,
+                 upload_codec='mp3', upload_bandwidth=None,
+                 http_pool_size=None, connect_timeout=5.0, read_timeout=60.0, http2=True,
+                 num_workers=4, max_queue_size=8, overflow_policy='block',
+                 reorder_max_wait=5.0, capture_mode='callback', input_source=None,
+                 api_base=None, on_transcription=None, metrics=None,
+                 max_retries=3, retry_base_delay=0.5, retry_max_delay=8.0, request_deadline=60.0,
+                 circuit_threshold=5, circuit_recovery_time=30.0, max_deferred_seconds=120.0,
+                 rate_limiter=None, adaptive_threshold=False, noise_margin=2.0, vad='energy',
+                 partial_interval=None, max_partials=3, on_partial=None, overlap=0.0, cut_lookback=0.0,
+                 pre_roll=None, hangover=None, max_pause=None):
         """
         WhisperLiveTranscriberのインスタンスを初期化します。
         
@@ -47,22 +3147,100 @@ class WhisperLiveTranscriber:
             confidence_threshold (float, optional): 確信度の閾値. デフォルト 0.5
             skip_silence (bool, optional): 無音区間スキップの有効/無効. デフォルト True
             debug_mode (bool, optional): デバッグモードの有効/無効. デフォルト False
+            debug_audio_dir (str, optional): 送信した音声データを保存するディレクトリ（デバッグ用）. デフォルト None
+            upload_codec (str, optional): アップロード時のコーデック (wav/flac/opus/mp3/auto). デフォルト "mp3"
+            upload_bandwidth (float, optional): autoモードで使用するアップロード帯域（バイト/秒）. 未指定時は実測から推定
+            http_pool_size (int, optional): API接続プールの最大接続数. デフォルト num_workers と同数
+            connect_timeout (float, optional): API接続タイムアウト（秒）. デフォルト 5.0
+            read_timeout (float, optional): API応答の読み取りタイムアウト（秒）. デフォルト 60.0
+            http2 (bool, optional): 利用可能であれば HTTP/2 を使用する. デフォルト True
+            num_workers (int, optional): 同時に転写するセグメント数の上限. デフォルト 4
+            max_queue_size (int, optional): 転写待ちセグメント数の上限. デフォルト 8
+            overflow_policy (str, optional): 転写待ちが上限に達したときの動作 (block/drop_oldest/merge). デフォルト "block"
+            reorder_max_wait (float, optional): 前のセグメントの結果を待つ最大時間（秒）. 超えると順不同で出力. デフォルト 5.0
+            capture_mode (str, optional): マイクの取り込み方式. "callback" は PyAudio のコールバックで
+                リングバッファに取り込み、セグメント分割を別スレッドで行う. "blocking" は同じスレッドで
+                読み取りと分割を行う. デフォルト "callback"
+            input_source (AudioSource, optional): 音声の入力元. 未指定時はマイク（capture_mode に従う）
+            api_base (str, optional): APIのベースURL. 未指定時は環境変数 OPENAI_BASE_URL、なければ OpenAI
+            on_transcription (callable, optional): 転写結果のテキストを受け取る関数. デフォルト None
+            metrics (MetricsRegistry, optional): 計測値の登録先. 指定時のみ計測する. デフォルト None
+            max_retries (int, optional): 429・5xx・タイムアウト・接続エラー時の再試行回数. デフォルト 3
+            retry_base_delay (float, optional): 1回目の再試行までの待ち時間の上限（秒, 以降は倍増しジッタを加える）. デフォルト 0.5
+            retry_max_delay (float, optional): 再試行までの待ち時間の上限（秒, Retry-After が長い場合はそちらに従う）. デフォルト 8.0
+            request_deadline (float, optional): 1セグメントの転写（再試行を含む）にかける最大時間（秒）. デフォルト 60.0
+            circuit_threshold (int, optional): APIの呼び出しを一時停止するまでの連続失敗回数（0 で無効）. デフォルト 5
+            circuit_recovery_time (float, optional): 呼び出しを停止してから再開を試すまでの時間（秒）. デフォルト 30.0
+            max_deferred_seconds (float, optional): APIの停止中に保留しておく音声の長さの上限（秒, 0 で保留しない）. デフォルト 120.0
+            rate_limiter (APIRateGovernor, optional): リクエスト数・音声の長さ・同時実行数の制限.
+                複数の転写器で利用枠を共有する場合は APIRateGovernor.shared() で作成したものを渡す. デフォルト None
+            adaptive_threshold (bool, optional): 無音判定の閾値を背景雑音のレベルに合わせて自動調整する.
+                energy_threshold は雑音レベルを推定するまでの初期値になる. デフォルト False
+            noise_margin (float, optional): 自動調整時の雑音レベルに対する閾値の倍率. デフォルト 2.0
+            vad (str or VoiceActivityDetector, optional): 発話検出の方式. "energy" はエネルギーのみで判定し、
+                "spectral" は帯域エネルギー・スペクトル平坦度・ゼロ交差率で音声以外の音を除外する. デフォルト "energy"
+            partial_interval (float, optional): 分割途中のセグメントを暫定結果として転写する間隔（秒）.
+                区切りを待たずに最初のテキストを表示する. 未指定時は暫定結果を転写しない. デフォルト None
+            max_partials (int, optional): 1セグメントあたりの暫定結果のリクエスト数の上限. デフォルト 3
+            on_partial (callable, optional): 暫定結果のテキストを受け取る関数（同じセグメントの確定結果で置き換える）. デフォルト None
+            overlap (float, optional): 最大セグメント長で区切ったときに次のセグメントに重ねる長さ（秒）.
+                区切りをまたぐ単語を両方で転写し、重複した部分は結果を連結するときに取り除く. デフォルト 0.0
+            cut_lookback (float, optional): 最大セグメント長に達したときに、直近のこの長さ（秒）のうち最も静かな位置で区切る.
+                残りは次のセグメントに持ち越す. 0 の場合は最大長ちょうどで区切る. デフォルト 0.0
+            pre_roll (float, optional): 発話の直前に付ける長さ（秒）. 指定すると発話が始まるまでの無音は送信しない.
+                未指定時は区切った後の無音もすべて次のセグメントに含める. デフォルト None
+            hangover (float, optional): 無音で区切ったときに発話の後ろに残す長さ（秒）.
+                未指定時は silence_duration の1/3. デフォルト None
+            max_pause (float, optional): 送信前に、発話の間のこの長さ（秒）より長い無音を詰め、先頭と末尾の無音をその半分まで削る.
+                未指定時は無音を詰めない. デフォルト None
         """
         self.api_key = api_key
         self.language = language
         self.sample_rate = sample_rate
         self.channels = 1
         self.format = pyaudio.paInt16
+        self.sample_width = pyaudio.get_sample_size(self.format)
         self.is_recording = False
         self.transcriptions = []
+        self._transcription_sequences = []  # transcriptions と同じ並びの連番
+        self.on_transcription = on_transcription
         self.debug_mode = debug_mode
+        self.debug_audio_dir = debug_audio_dir  # 指定時のみ送信音声をファイルに残す
+        
+        # APIエラー時の再試行とサーキットブレーカー（停止中のセグメントは保留して回復後に転写）
+        self.read_timeout = read_timeout
+        self.retry_policy = RetryPolicy(max_attempts=max_retries + 1, base_delay=retry_base_delay,
+                                        max_delay=retry_max_delay, deadline=request_deadline)
+        self.circuit_breaker = CircuitBreaker(circuit_threshold, circuit_recovery_time) if circuit_threshold > 0 else None
+        self.max_deferred_seconds = max_deferred_seconds
+        self._deferred = collections.deque()
+        self._deferred_seconds = 0.0
+        self._defer_rounds = {}  # 連番 -> 再試行を打ち切った回数
+        self._deferred_lock = threading.Lock()
+        
+        # API利用枠に合わせたレート制限（未指定時は制限しない）
+        self.rate_limiter = rate_limiter
+        
+        # 暫定結果（分割途中のセグメントを一定間隔で転写し、確定結果で置き換える）
+        self.partial_interval = partial_interval
+        self.max_partials = max_partials
+        self.on_partial = on_partial
+        self._partial_epoch = 0  # セグメントを区切るたびに増やし、確定済みの暫定結果を判別する
+        self._partials_sent = 0
+        self._partial_thread = None
+        self._partial_shown = False
+        self._display_lock = threading.Lock()
         
         # 音声セグメントの設定
         self.segment_length = segment_length  # 秒
-        self.energy_threshold = energy_threshold  # 無音判定の閾値
+        self.energy_threshold = energy_threshold  # 無音判定の閾値（自動調整時は初期値）
+        self.adaptive_threshold = adaptive_threshold
         self.silence_duration = silence_duration  # 無音とみなす最小の長さ（秒）
         self.confidence_threshold = confidence_threshold  # 転写結果の確信度閾値
         self.skip_silence = skip_silence  # 無音区間をスキップするかどうか
+        self.overlap = overlap  # 最大長で区切ったときに次のセグメントに重ねる長さ（秒）
+        self._overlapped = {}  # 連番 -> 前のセグメントと重なっている長さ（秒）
+        self._last_emitted = None  # 最後に出力した (連番, 転写結果)
         
         # フレーム設定
         self.frame_duration_ms = 20  # 1フレームの長さ（ミリ秒）
@@ -71,14 +3249,99 @@ class WhisperLiveTranscriber:
         
         # ストリーム処理用変数
         self.buffer = []
+        self.noise_tracker = (NoiseFloorTracker(frame_duration_ms=self.frame_duration_ms, margin=noise_margin,
+                                                initial_threshold=energy_threshold)
+                              if adaptive_threshold else None)
+        self.segmenter = AudioSegmenter(
+            frame_duration_ms=self.frame_duration_ms,
+            segment_length=segment_length,
+            energy_threshold=energy_threshold,
+            silence_duration=silence_duration,
+            sample_rate=sample_rate,
+            noise_tracker=self.noise_tracker,
+            vad=create_vad(vad, sample_rate, self.frame_duration_ms),
+            overlap=overlap,
+            cut_lookback=cut_lookback,
+            pre_roll=pre_roll,
+            hangover=hangover
+        )
+        self.compactor = (SilenceCompactor(frame_duration_ms=self.frame_duration_ms, max_pause=max_pause)
+                          if max_pause is not None else None)
+        
+        # 計測値（無効時は計測しない）
+        self.metrics = (TranscriberMetrics(metrics, self.circuit_breaker, rate_limiter, self.segmenter)
+                        if metrics is not None else None)
+        
+        # 転写ワーカープールの設定（start_recordingで起動）
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.worker_pool = None
+        self.reorder_max_wait = reorder_max_wait
+        self.sequencer = None
+        self._next_sequence = 0
+        if overflow_policy not in TranscriptionWorkerPool.OVERFLOW_POLICIES:
+            raise ValueError(f"未対応のキューあふれ時の動作です: {overflow_policy}")
+        
+        # 音声の入力元（未指定時はマイク）
+        if input_source is None:
+            input_source = MicrophoneSource(sample_rate, frames_per_buffer=self.frames_per_buffer,
+                                            capture_mode=capture_mode)
+        self.source = input_source
+        self.input_finished = threading.Event()  # 入力の終端まで処理すると設定される
+        self._reported_overflows = 0
         
-        # APIエンドポイント
-        self.api_url = "https://api.openai.com/v1/audio/transcriptions"
+        # APIエンドポイントと接続プール（同時リクエスト数に合わせたサイズ）
+        if http_pool_size is None:
+            http_pool_size = num_workers
+        self.api_url = transcriptions_url(api_base)
+        self.http_client = WhisperHTTPClient(
+            pool_size=http_pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            http2=http2
+        )
+        
+        # アップロード用コーデック
+        self.upload_codec = upload_codec
+        if upload_codec == 'auto':
+            self.codec = None
+            self.codec_selector = AutoCodecSelector(upload_bandwidth=upload_bandwidth, sample_rate=sample_rate)
+        elif upload_codec in UPLOAD_CODECS:
+            self.codec = UPLOAD_CODECS[upload_codec]()
+            self.codec_selector = None
+        else:
+            raise ValueError(f"未対応のコーデックです: {upload_codec} (選択肢: {', '.join(UPLOAD_CODECS)}, auto)")
         
         self._debug("WhisperLiveTranscriberを初期化しました")
         self._debug(f"設定: セグメント長={segment_length}秒, 無音閾値={energy_threshold}/1000, 無音判定={silence_duration}秒")
+        self._debug(f"APIエンドポイント: {self.api_url}")
+        self._debug(f"アップロードコーデック: {upload_codec}")
+        self._debug(f"API接続プール: 最大{http_pool_size}接続, HTTP/2={'有効' if self.http_client.http2 else '無効'}")
+        self._debug(f"転写ワーカー: {num_workers}スレッド, 待ち行列上限={max_queue_size}, あふれ時={overflow_policy}")
+        self._debug(f"再試行: 最大{max_retries}回, 期限={request_deadline}秒, "
+                    f"サーキットブレーカー: {f'{circuit_threshold}回連続失敗で{circuit_recovery_time}秒停止' if self.circuit_breaker else '無効'}")
+        if isinstance(self.source, MicrophoneSource):
+            self._debug(f"入力: マイク (取り込み方式: {self.source.capture_mode})")
+        else:
+            self._debug(f"入力: {self.source.name} ({'実時間' if self.source.realtime else '高速処理'})")
         if self.skip_silence:
             self._debug("無音区間検出: 有効 (無音セグメントはAPIに送信されません)")
+        if self.noise_tracker:
+            self._debug(f"無音閾値の自動調整: 有効 (雑音レベルの{noise_margin}倍)")
+        if self.segmenter.vad:
+            self._debug(f"発話検出: {self.segmenter.vad.name}")
+        if self.overlap:
+            self._debug(f"最大長で区切ったときの重なり: {self.overlap}秒")
+        if cut_lookback:
+            self._debug(f"最大長に達したときは直近{cut_lookback}秒のうち最も静かな位置で区切ります")
+        if pre_roll is not None:
+            self._debug(f"発話前の無音は送信しません (プリロール: {pre_roll}秒, "
+                        f"発話後: {self.segmenter.hangover_frames * self.frame_duration_ms / 1000}秒)")
+        if self.compactor:
+            self._debug(f"送信前の無音の圧縮: 有効 (発話の間の無音は最大{max_pause}秒)")
+        if self.partial_interval:
+            self._debug(f"暫定結果: {self.partial_interval}秒ごと, 1セグメントあたり最大{self.max_partials}回")
         
         # 常に表示する重要な情報
         print("Whisper API 文字起こしツール")
@@ -107,24 +3370,48 @@ class WhisperLiveTranscriber:
         
         self.is_recording = True
         self.transcriptions = []
+        self._transcription_sequences = []
+        self._next_sequence = 0
+        self._reported_overflows = 0
+        self.input_finished.clear()
+        self._deferred.clear()
+        self._deferred_seconds = 0.0
+        self._defer_rounds = {}
+        self._partial_epoch = 0
+        self._partials_sent = 0
+        self._partial_shown = False
+        self._overlapped = {}
+        self._last_emitted = None
+        if self.metrics:
+            self.metrics.start()
         
-        # PyAudioインスタンスを作成
-        self.audio = pyaudio.PyAudio()
-        
-        # オーディオストリームを開く
+        # 入力元を開く
         try:
-            self.stream = self.audio.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.sample_rate,
-                input=True,
-                frames_per_buffer=self.frames_per_buffer
-            )
+            self.source.open()
         except Exception as e:
-            self._debug(f"オーディオストリームの初期化中にエラーが発生しました: {e}")
+            self._debug(f"音声入力の初期化中にエラーが発生しました: {e}")
             self.is_recording = False
-            self.audio.terminate()
-            raise RuntimeError(f"マイクへのアクセスに失敗しました: {e}")
+            raise
+        
+        # 実時間で届かない入力元は、待ち行列が空くまで読み出しを止めて全セグメントを転写する
+        overflow_policy = self.overflow_policy
+        if not self.source.realtime and overflow_policy != 'block':
+            self._debug(f"実時間でない入力のため、あふれ時の動作を {overflow_policy} から block に変更します")
+            overflow_policy = 'block'
+        
+        # 結果の並べ替えと転写ワーカープールを起動
+        self.sequencer = ResultSequencer(self._emit_transcription, max_wait=self.reorder_max_wait)
+        self.sequencer.start()
+        self.worker_pool = TranscriptionWorkerPool(
+            self._transcribe_segment,
+            num_workers=self.num_workers,
+            max_queue_size=self.max_queue_size,
+            overflow_policy=overflow_policy,
+            merge_fn=self._merge_segments,
+            on_drop=self._drop_segment,
+            on_error=self._on_worker_error
+        )
+        self.worker_pool.start()
         
         # プログレスマーカーの表示
         self._show_progress_marker()
@@ -134,159 +3421,256 @@ class WhisperLiveTranscriber:
         self.processing_thread.daemon = True
         self.processing_thread.start()
     
+    def get_stats(self):
+        """
+        転写ワーカープールの統計情報を返します
+        
+        返値:
+            dict: キューの深さ、ワーカー稼働率などの統計情報（未起動時は空）.
+                'capture' に入力元の取り込みの統計情報、閾値の自動調整時は
+                'noise' に雑音レベルの推定状態（NoiseFloorTracker.state()）を含みます
+        """
+        stats = self.worker_pool.stats() if self.worker_pool else {}
+        if stats:
+            stats['capture'] = self.source.stats()
+            if self.noise_tracker:
+                stats['noise'] = self.noise_tracker.state()
+        return stats
+    
+    def get_metrics(self):
+        """
+        計測値の現在値を返します
+        
+        返値:
+            dict: MetricsRegistry.snapshot() の結果（計測が無効の場合は空）
+        """
+        return self.metrics.registry.snapshot() if self.metrics else {}
+    
+    def wait_for_input(self, timeout=None):
+        """
+        ファイルなどの入力を終端まで処理し終えるまで待ちます
+        
+        引数:
+            timeout (float, optional): 最大待ち時間（秒）
+        
+        返値:
+            bool: 終端まで処理した場合はTrue（マイク入力では停止するまで False）
+        """
+        return self.input_finished.wait(timeout)
+    
     def _show_progress_marker(self):
         """録音中であることを示すプログレスマーカーを表示します"""
         if self.is_recording:
             print(".", end='', flush=True)
             threading.Timer(1.0, self._show_progress_marker).start()
     
+    def _read_audio(self):
+        """
+        次に処理する音声データを入力元から取得します
+        
+        返値:
+            bytes or None: PCMデータ（まだ届いていない場合は空、入力の終端ではNone）
+        """
+        data = self.source.read(self.frames_per_buffer * self.sample_width * self.MAX_READ_FRAMES)
+        if self.source.overflows != self._reported_overflows:
+            self._reported_overflows = self.source.overflows
+            self._debug(f"取り込みバッファが満杯のため音声を破棄しました (累計 {self._reported_overflows} 回)")
+        return data
+    
     def _process_audio(self):
         """
         音声ストリームを処理し、時間ベースでセグメント分割します
         
-        このメソッドは内部スレッドとして実行され、以下の条件でセグメントを分割します:
+        このメソッドは内部スレッドとして実行され、AudioSegmenter によって
+        以下の条件でセグメントを分割します:
         1. 最大セグメント長に達した場合
         2. 一定時間以上の無音が検出された場合
+        
+        マイクの callback 方式では取り込みはコールバック側で行われるため、このスレッドの
+        処理が遅れても音声は失われません（リングバッファが満杯になるまで）。
+        ファイルなどの入力では、終端に達すると残りをセグメントとして処理して終了します。
         """
-        frames = []
-        frames_since_start = 0
-        silence_frames = 0
-        max_frames = int(self.segment_length * 1000 / self.frame_duration_ms)  # セグメント最大フレーム数
-        silence_threshold_frames = int(self.silence_duration * 1000 / self.frame_duration_ms)  # 無音判定フレーム数
+        self.segmenter.reset()
+        metrics = self.metrics
         
         while self.is_recording:
             try:
-                # 音声データを読み取り
-                data = self.stream.read(self.frames_per_buffer, exception_on_overflow=False)
-                frames.append(data)
-                frames_since_start += 1
-                
-                # 現在のフレームのエネルギーを計算
-                audio_np = np.frombuffer(data, dtype=np.int16)
-                energy = np.sqrt(np.mean(audio_np.astype(np.float32)**2))
-                normalized_energy = min(1000, energy / 32.767)
-                
-                # 無音判定
-                if normalized_energy < self.energy_threshold:
-                    silence_frames += 1
-                else:
-                    silence_frames = 0
-                
-                # セグメント分割条件判定
-                should_process = False
-                
-                # 1. 最大セグメント長に達した
-                if frames_since_start >= max_frames:
-                    should_process = True
-                    reason = "最大セグメント長に達しました"
-                
-                # 2. 無音が一定時間続いた
-                elif silence_frames >= silence_threshold_frames and frames_since_start > silence_threshold_frames * 2:
-                    should_process = True
-                    reason = f"{self.silence_duration}秒の無音を検出しました"
+                data = self._read_audio()
+                if data is None:
+                    # 入力の終端：分割途中のフレームも転写する
+                    self._debug("入力の終端に達しました")
+                    segment = self.segmenter.flush()
+                    self._end_partial()
+                    if segment is not None:
+                        if metrics:
+                            metrics.segments_cut.inc(reason=segment.cut_reason)
+                        self._process_segment(segment)
+                    self.input_finished.set()
+                    break
+                if not data:
+                    # 次のフレームが取り込まれるまで待つ
+                    time.sleep(self.frame_duration_ms / 2000)
+                    continue
+                if metrics:
+                    metrics.audio_seconds.inc(len(data) / self.source.bytes_per_second)
                 
-                # セグメント処理
-                if should_process and frames:
-                    self._debug(f"音声セグメント分割: {reason} (長さ: {frames_since_start * self.frame_duration_ms / 1000:.1f}秒)")
-                    
-                    # 無音で区切った場合は、無音部分を少し含める
-                    if "無音" in reason:
-                        processing_frames = frames[:-silence_frames] + frames[-silence_frames:][:int(silence_threshold_frames/3)]
+                # セグメント処理（フレームのエネルギーはまとめて計算される）
+                for segment in self.segmenter.feed_pcm(data):
+                    if segment.cut_reason == 'silence':
+                        reason = f"{self.silence_duration}秒の無音を検出しました"
                     else:
-                        processing_frames = frames
+                        reason = "最大セグメント長に達しました"
+                    self._debug(f"音声セグメント分割: {reason} (長さ: {segment.duration:.1f}秒, "
+                                f"無音閾値: {self.segmenter.energy_threshold:.1f})")
+                    if metrics:
+                        metrics.segments_cut.inc(reason=segment.cut_reason)
                     
                     # 検出したセグメントを処理
-                    self._process_segment(processing_frames)
-                    
-                    # フレームをリセット
-                    frames = []
-                    frames_since_start = 0
-                    silence_frames = 0
+                    self._end_partial()
+                    self._process_segment(segment)
+                
+                # 区切りを待たずに分割途中のセグメントを暫定結果として転写
+                if self.partial_interval:
+                    self._request_partial()
             
             except Exception as e:
                 self._debug(f"音声処理中にエラーが発生しました: {e}")
                 time.sleep(0.1)  # エラー時に少し待機
     
+    ########################################################################
+    # 暫定結果の転写
+    ########################################################################
+    def _request_partial(self):
+        """
+        分割途中のセグメントが partial_interval 伸びるごとに、暫定結果の転写を別スレッドで開始します
+        
+        API呼び出しを増やしすぎないよう、1セグメントあたり max_partials 回までとし、
+        前の暫定結果の応答待ち・確定セグメントの転写待ち・APIの障害中は送信しません。
+        """
+        if self._partials_sent >= self.max_partials:
+            return
+        if self._partial_thread is not None and self._partial_thread.is_alive():
+            return
+        if self.circuit_breaker and self.circuit_breaker.state != 'closed':
+            return
+        segment = self.segmenter.peek()
+        if segment is None or segment.duration < self.partial_interval * (self._partials_sent + 1):
+            return
+        if self.segmenter.analyze_silence(segment)[0] or self.worker_pool.stats()['queue_depth']:
+            return
+        
+        self._partials_sent += 1
+        self._partial_thread = threading.Thread(target=self._transcribe_partial,
+                                                args=(segment, self._partial_epoch), daemon=True)
+        self._partial_thread.start()
+    
+    def _end_partial(self):
+        """セグメントを区切ったときに、以降に届く暫定結果を破棄するよう記録します"""
+        # 判定を終えた暫定結果が区切った後に表示されないよう、表示と同じロックで更新する
+        with self._display_lock:
+            self._partial_epoch += 1
+            self._partials_sent = 0
+    
+    def _transcribe_partial(self, segment, epoch):
+        """
+        分割途中のセグメントを1回だけ転写し、区切られていなければ暫定結果として表示します
+        
+        暫定結果は再試行・保留を行わず、サーキットブレーカーの判定にも含めません。
+        
+        引数:
+            segment (SpeechSegment): 分割途中のセグメント（AudioSegmenter.peek() の結果）
+            epoch (int): 送信時の _partial_epoch
+        """
+        metrics = self.metrics
+        try:
+            segment = self._compact_segment(segment)
+            audio_data, codec = self._encode_segment(segment.pcm)
+            text = self._request_transcription(audio_data, codec.filename, codec.mime_type,
+                                               self.read_timeout, segment.audio_duration).strip()
+        except Exception as e:
+            self._debug(f"暫定結果の転写中にエラーが発生しました: {e}")
+            if metrics:
+                metrics.partials.inc(outcome='failed')
+            return
+        
+        with self._display_lock:
+            if epoch != self._partial_epoch:
+                outcome = 'stale'
+            elif not text:
+                outcome = 'empty'
+            else:
+                outcome = 'shown'
+                self._debug(f"暫定結果 ({segment.start_offset:.1f}-{segment.end_offset:.1f}秒): {text}")
+                if not self.debug_mode:
+                    print(f"\r\033[K~ {text}", end='', flush=True)
+                    self._partial_shown = True
+                if self.on_partial:
+                    self.on_partial(text)
+        if metrics:
+            metrics.partials.inc(outcome=outcome)
+    
     ########################################################################
     # セグメントの処理
     ########################################################################
-    def _process_segment(self, frames):
+    def _process_segment(self, segment):
         """
         検出された音声セグメントを処理します
         
         無音セグメントの場合はスキップし、有音セグメントの場合は
-        別スレッドで転写処理を実行します。
+        連番を付けてワーカープールに転写処理を投入します。
         
         引数:
-            frames (list): 処理する音声フレームのリスト
+            segment (SpeechSegment): 処理する音声セグメント
         """
-        if not frames:
+        if not len(segment.pcm):
             return
-            
+        
+        # APIが回復していれば保留中のセグメントを転写待ちに戻す
+        if self._deferred:
+            self._resubmit_deferred()
+            if not self.source.realtime:
+                self._wait_for_deferred_capacity()
+        
         # 音声セグメントが無音かどうかをチェック
-        is_silent = self._is_silent_segment(frames)
+        is_silent = self._is_silent_segment(segment)
         
         if is_silent and self.skip_silence:
             self._debug("無音セグメントを検出したため、転写処理をスキップします")
+            if self.metrics:
+                self.metrics.segments.inc(outcome='silent')
             return
         
-        # 別スレッドで処理
-        processing_thread = threading.Thread(
-            target=self._transcribe_segment,
-            args=(frames.copy(),)
-        )
-        processing_thread.daemon = True
-        processing_thread.start()
+        segment.sequence = self._next_sequence
+        self._next_sequence += 1
+        if segment.overlap_frames:
+            self._overlapped[segment.sequence] = segment.overlap_frames * self.frame_duration_ms / 1000
         
+        # ワーカープールで処理（キューが満杯の場合は overflow_policy に従う）
+        if not self.worker_pool.submit(segment):
+            self.sequencer.skip(segment.sequence)
+            if self.metrics:
+                self.metrics.segments.inc(outcome='dropped')
+        if self.debug_mode:
+            stats = self.worker_pool.stats()
+            self._debug(f"転写待ち: {stats['queue_depth']}/{stats['max_queue_size']}, 実行中: {stats['busy_workers']}/{stats['num_workers']}")
+    
     ########################################################################
     # 無音セグメントの判定
     ########################################################################
-    def _is_silent_segment(self, frames):
+    def _is_silent_segment(self, segment):
         """
         音声セグメントが無音かどうかを判定します
         
         引数:
-            frames (list): 判定する音声フレームのリスト
-            
+            segment (SpeechSegment): 判定する音声セグメント
+        
         返値:
             bool: 無音セグメントの場合はTrue、それ以外はFalse
         """
-        # フレームをnumpy配列に変換して連結
-        audio_data = []
-        for frame in frames:
-            audio_np = np.frombuffer(frame, dtype=np.int16)
-            audio_data.append(audio_np)
-        
-        if not audio_data:
-            return True
-            
-        audio_np = np.concatenate(audio_data)
-        
-        # セグメント全体のRMSエネルギーを計算
-        energy = np.sqrt(np.mean(audio_np.astype(np.float32)**2))
-        normalized_energy = min(1000, energy / 32.767)
-        
-        # 活発な音声を含むフレームの割合を計算
-        active_frames = 0
-        total_frames = len(frames)
-        
-        for frame in frames:
-            frame_np = np.frombuffer(frame, dtype=np.int16)
-            frame_energy = np.sqrt(np.mean(frame_np.astype(np.float32)**2))
-            frame_normalized = min(1000, frame_energy / 32.767)
-            
-            if frame_normalized > self.energy_threshold:
-                active_frames += 1
-        
-        active_ratio = active_frames / total_frames if total_frames > 0 else 0
-        
-        # 無音判定：
-        # 1. 全体のエネルギーが閾値の50%より低い、かつ
-        # 2. 活発なフレームの割合が5%未満
-        is_silent = normalized_energy < self.energy_threshold * 0.5 and active_ratio < 0.05
+        is_silent, normalized_energy, active_ratio = self.segmenter.analyze_silence(segment)
         
         if is_silent:
-            self._debug(f"無音セグメント検出: 全体エネルギー={normalized_energy:.1f}/{self.energy_threshold}, 活発フレーム比率={active_ratio:.2f}")
+            self._debug(f"無音セグメント検出: 全体エネルギー={normalized_energy:.1f}/{self.segmenter.energy_threshold:.1f}, 活発フレーム比率={active_ratio:.2f}")
         
         return is_silent
     
@@ -299,144 +3683,438 @@ class WhisperLiveTranscriber:
         
         引数:
             text (str): 転写されたテキスト
-            
+        
         返値:
             float: 推定された信頼度 (0.0-1.0)
         """
-        if not text or len(text.strip()) == 0:
-            return 0.0
-        
-        # 定型句リスト
-        common_phrases = [
-            "ご視聴ありがとうございました。", 
-            "thank you", "thanks", 
-            "はい", "いいえ",
-            "こんにちは", "さようなら"
-        ]
-        
-        text_lower = text.lower().strip()
-        
-        for phrase in common_phrases:
-            if phrase.lower() in text_lower:
-                if len(text_lower) < len(phrase) * 1.5:
-                    return 0.3
-        
-        # 文字数が多いほど確信度が高い（最大0.9）
-        char_confidence = min(0.9, len(text.strip()) / 50)
-        
-        # 単語数（空白で区切った数）
-        words = text.strip().split()
-        word_confidence = min(0.9, len(words) / 10)
-        
-        # 合成確信度（文字数と単語数の大きい方を採用）
-        confidence = max(char_confidence, word_confidence)
-        
-        return confidence
+        return estimate_transcript_confidence(text)
     
     ########################################################################
     # セグメントの文字起こし
     ########################################################################
-    def _transcribe_segment(self, frames):
+    def _transcribe_segment(self, segment):
         """
         音声セグメントをWhisper APIに送信して転写します
         
+        一時ファイルは使用せず、メモリ上でエンコードした音声データを
+        そのままAPIリクエストの本文に渡します。結果（採用しなかった場合はNone）は
+        ResultSequencer に登録され、取り込み順に出力されます。
+        APIの障害で転写できなかったセグメントは保留し、回復後に転写します。
+        
         引数:
-            frames (list): 転写する音声フレームのリスト
+            segment (SpeechSegment): 転写する音声セグメント
         """
+        result = None
+        metrics = self.metrics
+        outcome = 'failed'
         try:
-            # 一時ファイルを作成
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                temp_filename = temp_file.name
-            
-            self._debug(f"一時ファイルを作成: {temp_filename}")
-            
-            # WAVファイルとして保存
-            with wave.open(temp_filename, 'wb') as wf:
-                wf.setnchannels(self.channels)
-                wf.setsampwidth(self.audio.get_sample_size(self.format))
-                wf.setframerate(self.sample_rate)
-                wf.writeframes(b''.join(frames))
+            # 無音を詰めてから、セグメントのPCMをコピーせずにメモリ上でエンコード
+            # （保留・連結に備えて、元のセグメントはそのまま残す）
+            upload = self._compact_segment(segment)
+            if metrics:
+                encode_started = time.perf_counter()
+            audio_data, codec = self._encode_segment(upload.pcm)
+            if metrics:
+                metrics.encode_seconds.observe(time.perf_counter() - encode_started, codec=codec.name)
+                metrics.upload_bytes.inc(len(audio_data), codec=codec.name)
+                metrics.transcribed_seconds.inc(upload.audio_duration)
+                metrics.compacted_seconds.inc(segment.audio_duration - upload.audio_duration)
             
-            # WAVファイルをMP3に変換
-            audio = AudioSegment.from_wav(temp_filename)
-            mp3_filename = temp_filename.replace('.wav', '.mp3')
-            audio.export(mp3_filename, format="mp3")
+            # デバッグ用に送信音声を保存
+            if self.debug_audio_dir:
+                self._save_debug_audio(audio_data, codec.filename)
             
-            self._debug(f"APIリクエスト送信中...")
+            self._debug(f"APIリクエスト送信中... ({len(audio_data)} bytes)")
             
             # APIリクエスト
-            transcription = self._transcribe_audio(mp3_filename)
-            
-            # 一時ファイルの削除
-            try:
-                os.remove(temp_filename)
-                os.remove(mp3_filename)
-            except Exception as e:
-                self._debug(f"一時ファイル削除エラー: {e}")
+            transcription = self._transcribe_audio(audio_data, codec.filename, codec.mime_type, upload.audio_duration)
             
             # 転写結果の信頼性を評価
             if transcription and transcription.strip():
                 confidence = self._get_transcript_confidence(transcription)
                 
                 if confidence >= self.confidence_threshold:
-                    self.transcriptions.append(transcription)
+                    result = transcription
+                    outcome = 'emitted'
                     # エネルギーや信頼度などの詳細情報はデバッグモードでのみ表示
-                    self._debug(f"転写結果 (確信度: {confidence:.2f}): {transcription}")
-                    # 通常モードでは転写結果のみ表示
-                    if not self.debug_mode:
-                        print(f"\n> {transcription}")
+                    self._debug(f"転写結果 #{segment.sequence} ({segment.start_offset:.1f}-{segment.end_offset:.1f}秒, 確信度: {confidence:.2f}): {transcription}")
                 else:
                     self._debug(f"低確信度の転写結果を無視 ({confidence:.2f}): {transcription}")
+                    outcome = 'low_confidence'
             else:
                 self._debug("転写結果が空でした")
+                outcome = 'empty'
         
         except Exception as e:
-            import traceback
-            self._debug(f"転写中にエラーが発生しました: {e}")
-            if self.debug_mode:
-                traceback.print_exc()
+            if self._defer_segment(segment, e):
+                outcome = 'deferred'
+            else:
+                import traceback
+                self._debug(f"転写中にエラーが発生しました: {e}")
+                if self.debug_mode and not self.retry_policy.is_retryable(e):
+                    traceback.print_exc()
+        
+        finally:
+            # 保留したセグメントの結果は回復後に転写してから登録する
+            if outcome != 'deferred':
+                if metrics:
+                    metrics.segments.inc(outcome=outcome)
+                self.sequencer.submit(segment.sequence, result)
     
     ########################################################################
-    # Whisper APIを使用した音声ファイルの転写
+    # APIの障害中のセグメントの保留
     ########################################################################
-    def _transcribe_audio(self, audio_file):
+    def _defer_segment(self, segment, error):
         """
-        Whisper APIを使用して音声ファイルを転写します
+        APIの障害で転写できなかったセグメントを保留します
+        
+        実時間の入力では保留中の音声が max_deferred_seconds を超えると古いものから破棄します
+        （実時間でない入力では _wait_for_deferred_capacity で読み出しを止めます）。
         
         引数:
-            audio_file (str): 転写する音声ファイルのパス
-            
+            segment (SpeechSegment): 転写できなかったセグメント
+            error (Exception): 発生した例外
+        
         返値:
-            str: 転写されたテキスト、エラー時は空文字列
+            bool: 保留した場合はTrue（再試行しないエラーや保留し直す回数の上限に達した場合はFalse）
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        if self.max_deferred_seconds <= 0:
+            return False
+        if not isinstance(error, CircuitOpenError) and not self.retry_policy.is_retryable(error):
+            return False
         
-        with open(audio_file, 'rb') as f:
-            files = {
-                'file': (os.path.basename(audio_file), f, 'audio/mpeg'),
-                'model': (None, 'whisper-1'),
-                'language': (None, self.language)
-            }
+        dropped = []
+        with self._deferred_lock:
+            if not isinstance(error, CircuitOpenError):
+                rounds = self._defer_rounds.get(segment.sequence, 0) + 1
+                if rounds >= self.MAX_DEFER_ROUNDS:
+                    self._defer_rounds.pop(segment.sequence, None)
+                    self._debug(f"一時的なエラーが続いたため転写を諦めます (#{segment.sequence}): {error}")
+                    return False
+                self._defer_rounds[segment.sequence] = rounds
+            self._deferred.append(segment)
+            self._deferred_seconds += segment.duration
+            while (self.source.realtime and len(self._deferred) > 1
+                   and self._deferred_seconds > self.max_deferred_seconds):
+                oldest = self._deferred.popleft()
+                self._deferred_seconds -= oldest.duration
+                self._defer_rounds.pop(oldest.sequence, None)
+                dropped.append(oldest)
+            pending, pending_seconds = len(self._deferred), self._deferred_seconds
+        
+        self._debug(f"APIを利用できないため転写を保留します (#{segment.sequence}, 保留中: {pending}件/{pending_seconds:.1f}秒): {error}")
+        for oldest in dropped:
+            self._debug(f"保留中の音声が上限を超えたため古いセグメントを破棄しました (#{oldest.sequence}, {oldest.duration:.1f}秒)")
+            self.sequencer.skip(oldest.sequence)
+        if self.metrics:
+            self.metrics.deferred.inc()
+            self.metrics.deferred_pending.set(pending)
+            if dropped:
+                self.metrics.segments.inc(len(dropped), outcome='dropped')
+        return True
+    
+    def _resubmit_deferred(self):
+        """
+        サーキットブレーカーが呼び出しを許す状態であれば、保留中のセグメントを転写待ちに戻します
+        
+        試行を再開した直後（half_open）は1件だけ戻し、成功して閉じてから残りを戻します。
+        
+        返値:
+            int: 転写待ちに戻したセグメント数
+        """
+        state = self.circuit_breaker.state if self.circuit_breaker else 'closed'
+        if state == 'open':
+            return 0
+        with self._deferred_lock:
+            if state == 'closed':
+                segments = list(self._deferred)
+                self._deferred.clear()
+            else:
+                segments = [self._deferred.popleft()] if self._deferred else []
+            self._deferred_seconds -= sum(segment.duration for segment in segments)
+            pending = len(self._deferred)
+        if not segments:
+            return 0
+        
+        self._debug(f"保留中のセグメントを転写待ちに戻します ({len(segments)}件, 残り{pending}件)")
+        if self.metrics:
+            self.metrics.deferred_pending.set(pending)
+        for segment in segments:
+            if not self.worker_pool.submit(segment):
+                self.sequencer.skip(segment.sequence)
+        return len(segments)
+    
+    def _wait_for_deferred_capacity(self):
+        """実時間でない入力で、保留中の音声が上限に達している間は読み出しを止めてAPIの回復を待ちます"""
+        while self.is_recording and self._deferred_seconds >= self.max_deferred_seconds:
+            retry_in = self.circuit_breaker.retry_in() if self.circuit_breaker else 0.0
+            time.sleep(min(max(retry_in, 0.05), 1.0))
+            self._resubmit_deferred()
+    
+    def _drain_pending(self, timeout=None):
+        """
+        転写待ちと保留中のセグメントを処理し終えるまで待ちます
+        
+        引数:
+            timeout (float, optional): 最大待ち時間（秒, None で無制限）
+        
+        返値:
+            bool: すべて処理し終えた場合はTrue
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not self.worker_pool.wait_idle(remaining):
+                return False
+            if not self._deferred:
+                return True
+            if remaining is not None and deadline - time.monotonic() <= 0:
+                return False
+            if not self._resubmit_deferred():
+                # ブレーカーが開いている間は試行を再開できるまで待つ
+                wait = max(self.circuit_breaker.retry_in(), 0.05)
+                if deadline is not None:
+                    wait = min(wait, max(0.0, deadline - time.monotonic()))
+                time.sleep(wait)
+    
+    def _merge_segments(self, queued, new):
+        """転写待ちのセグメントに新しいセグメントを連結します（merge 時）"""
+        queued.merge(new)
+        self._overlapped.pop(new.sequence, None)
+        self.sequencer.skip(new.sequence)
+        if self.metrics:
+            self.metrics.segments.inc(outcome='merged')
+        return queued
+    
+    def _drop_segment(self, segment):
+        """転写待ちから破棄されたセグメントを記録します（drop_oldest 時）"""
+        self._debug(f"転写待ちが上限に達したため古いセグメントを破棄しました (#{segment.sequence}, {segment.duration:.1f}秒)")
+        self.sequencer.skip(segment.sequence)
+        if self.metrics:
+            self.metrics.segments.inc(outcome='dropped')
+    
+    def _on_worker_error(self, item, error):
+        """転写処理で捕捉されなかった例外を表示します（デバッグモード時はスタックトレースも表示）"""
+        import traceback
+        self._debug(f"セグメントの処理中に予期しないエラーが発生しました: {error}")
+        if self.debug_mode:
+            traceback.print_exc()
+    
+    ########################################################################
+    # 転写結果の出力
+    ########################################################################
+    def _emit_transcription(self, sequence, text, in_order):
+        """
+        ResultSequencer から取り込み順に渡された転写結果を出力します
+        
+        引数:
+            sequence (int): セグメントの連番
+            text (str): 転写結果
+            in_order (bool): 取り込み順どおりに出力された場合はTrue
+        """
+        # 直前のセグメントと音声が重なっている場合は、重複した部分を取り除く
+        overlap = self._overlapped.pop(sequence, 0)
+        previous = self._last_emitted
+        self._last_emitted = (sequence, text)
+        if overlap and in_order and previous and previous[0] == sequence - 1:
+            stitched = stitch_transcripts(previous[1], text, window=int(overlap * 10) + 5)
+            if stitched != text:
+                self._debug(f"重なり部分の重複を取り除きました (#{sequence}): {text} -> {stitched}")
+            text = stitched
+            if not text:
+                return
+        
+        # 最終結果は常に取り込み順になるよう連番の位置に挿入
+        index = bisect.bisect(self._transcription_sequences, sequence)
+        self._transcription_sequences.insert(index, sequence)
+        self.transcriptions.insert(index, text)
+        
+        if not in_order:
+            self._debug(f"待ち時間を超えたため順不同で出力します (#{sequence})")
+        # 通常モードでは転写結果のみ表示（暫定結果を表示中はその行を置き換える）
+        with self._display_lock:
+            if not self.debug_mode:
+                print(f"\r\033[K> {text}" if self._partial_shown else f"\n> {text}")
+                self._partial_shown = False
+            if self.on_transcription:
+                self.on_transcription(text)
+    
+    ########################################################################
+    # 送信前の無音の圧縮
+    ########################################################################
+    def _compact_segment(self, segment):
+        """
+        送信前にセグメント内の長い無音を詰めます
+        
+        引数:
+            segment (SpeechSegment): 送信するセグメント
+        
+        返値:
+            SpeechSegment: 無音を詰めたセグメント（無効時・詰める無音が無い場合は segment）
+        """
+        if not self.compactor:
+            return segment
+        compacted = self.compactor.compact(segment, self.segmenter.energy_threshold)
+        if compacted is not segment:
+            self._debug(f"無音を詰めました: {segment.audio_duration:.2f}秒 -> {compacted.audio_duration:.2f}秒")
+        return compacted
+    
+    ########################################################################
+    # セグメントのエンコード
+    ########################################################################
+    def _encode_segment(self, pcm_data):
+        """
+        PCMデータをアップロード用のコーデックでエンコードします
+        
+        autoモードではセグメント長から推定遅延が最小のコーデックを選び、
+        実測したエンコード時間とサイズを次回以降の選択に反映します。
+        
+        引数:
+            pcm_data (bytes-like): 16bit リトルエンディアンのPCMデータ
+        
+        返値:
+            tuple: (エンコード済みの音声データ, 使用したAudioCodec)
+        """
+        duration = len(pcm_data) / (self.sample_rate * self.sample_width * self.channels)
+        codec = self.codec_selector.select(duration) if self.codec_selector else self.codec
+        
+        start_time = time.perf_counter()
+        try:
+            audio_data = codec.encode(pcm_data, self.sample_rate, self.channels, self.sample_width)
+        except (OSError, RuntimeError) as e:
+            if not self.codec_selector:
+                raise
+            # autoモードでは使用できないコーデックを除外してWAVで送信
+            self._debug(f"{codec.name}でのエンコードに失敗したため除外します: {e}")
+            self.codec_selector.disable(codec.name)
+            codec = WavCodec()
+            audio_data = codec.encode(pcm_data, self.sample_rate, self.channels, self.sample_width)
+            return audio_data, codec
+        encode_time = time.perf_counter() - start_time
+        
+        if self.codec_selector:
+            self.codec_selector.record_encode(codec.name, duration, encode_time, len(audio_data))
+        self._debug(f"エンコード完了: {codec.name}, {duration:.1f}秒 -> {len(audio_data)} bytes ({encode_time * 1000:.1f}ms)")
+        return audio_data, codec
+    
+    def _save_debug_audio(self, audio_data, filename):
+        """送信する音声データをデバッグ用ディレクトリに保存します"""
+        try:
+            os.makedirs(self.debug_audio_dir, exist_ok=True)
+            name, ext = os.path.splitext(filename)
+            path = os.path.join(self.debug_audio_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}{ext}")
+            with open(path, 'wb') as f:
+                f.write(audio_data)
+            self._debug(f"送信音声を保存しました: {path}")
+        except Exception as e:
+            self._debug(f"送信音声の保存に失敗しました: {e}")
+    
+    ########################################################################
+    # Whisper APIを使用した音声データの転写
+    ########################################################################
+    def _transcribe_audio(self, audio_data, filename='segment.mp3', mime_type='audio/mpeg', duration=0.0):
+        """
+        Whisper APIを使用して音声データを転写します
+        
+        429・5xx・タイムアウト・接続エラーは retry_policy に従って待ち時間を空けて再試行します。
+        各試行の読み取りタイムアウトは read_timeout と残りの deadline の短い方です。
+        
+        引数:
+            audio_data (bytes-like or file-like): 転写する音声データ
+            filename (str, optional): multipartに記載するファイル名（拡張子で形式が判別されます）
+            mime_type (str, optional): 音声データのMIMEタイプ
+            duration (float, optional): 音声の長さ（秒, レート制限に使用）
+        
+        返値:
+            str: 転写されたテキスト、再試行しないエラー（400 など）の場合は空文字列
+        
+        例外:
+            CircuitOpenError: サーキットブレーカーが開いているため呼び出さなかった場合
+            WhisperAPIError, 通信エラー: 再試行しても一時的なエラーが解消しなかった場合
+        """
+        try:
+            return call_with_retry(
+                lambda read_timeout: self._request_transcription(audio_data, filename, mime_type, read_timeout, duration),
+                self.retry_policy, self.circuit_breaker, self.read_timeout, on_retry=self._on_retry
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            if not self.retry_policy.is_retryable(e):
+                return ""
+            self._debug(f"再試行を打ち切りました: {e}")
+            raise
+    
+    def _on_retry(self, attempt, delay, error):
+        """再試行の前に呼び出され、ログと計測値に記録します"""
+        self._debug(f"{delay:.1f}秒後に再試行します ({attempt}/{self.retry_policy.max_attempts - 1}回目): {error}")
+        if self.metrics:
+            self.metrics.retries.inc()
+    
+    def _request_transcription(self, audio_data, filename, mime_type, read_timeout, duration=0.0):
+        """
+        Whisper APIを1回呼び出します
+        
+        rate_limiter が指定されている場合は、利用枠と同時実行数の上限に収まるまで待ってから送信し、
+        結果（429・タイムアウト・応答時間）を同時実行数の調整に反映します。
+        
+        引数:
+            audio_data (bytes-like or file-like): 転写する音声データ
+            filename (str): multipartに記載するファイル名
+            mime_type (str): 音声データのMIMEタイプ
+            read_timeout (float): 読み取りタイムアウト（秒）
+            duration (float, optional): 音声の長さ（秒）
+        
+        返値:
+            str: 転写されたテキスト
+        
+        例外:
+            WhisperAPIError: APIが200以外のステータスを返した場合
+        """
+        upload_size = len(audio_data) if isinstance(audio_data, (bytes, bytearray, memoryview)) else 0
+        metrics = self.metrics
+        rate_limit = self.rate_limiter.request(duration) if self.rate_limiter else contextlib.nullcontext()
+        with rate_limit as waited:
+            if waited is not None:
+                if metrics:
+                    metrics.rate_limit_wait.observe(waited)
+                if waited >= 0.1:
+                    self._debug(f"API利用枠の制限により {waited:.1f}秒 待機しました")
+            if metrics:
+                metrics.requests_in_flight.inc()
             
+            start_time = time.perf_counter()
             try:
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    files=files
+                text = self.http_client.transcribe(
+                    self.api_url, self.api_key, audio_data,
+                    filename=filename, mime_type=mime_type, language=self.language,
+                    read_timeout=read_timeout
                 )
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get('text', '')
-                else:
-                    self._debug(f"APIエラー: {response.status_code}, {response.text}")
-                    return ""
+                if self.codec_selector:
+                    self.codec_selector.record_upload(upload_size, time.perf_counter() - start_time)
+                return text
+            
+            except WhisperAPIError as e:
+                self._debug(f"APIエラー: {e.status_code}, {e.body}")
+                if metrics:
+                    metrics.api_errors.inc(code=e.status_code)
+                raise
             
             except Exception as e:
                 self._debug(f"API通信中にエラーが発生しました: {e}")
-                return ""
+                if metrics:
+                    if not isinstance(e, TRANSIENT_ERRORS):
+                        code = 'other'
+                    else:
+                        code = 'timeout' if isinstance(e, TIMEOUT_ERRORS) else 'connection'
+                    metrics.api_errors.inc(code=code)
+                raise
+            
+            finally:
+                if metrics:
+                    metrics.requests_in_flight.dec()
+                    metrics.request_seconds.observe(time.perf_counter() - start_time)
     
     ########################################################################
     # 録音の停止
@@ -454,17 +4132,35 @@ class WhisperLiveTranscriber:
         
         self.is_recording = False
         
-        # ストリームとPyAudioを閉じる
-        if hasattr(self, 'stream') and self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-        
-        if hasattr(self, 'audio') and self.audio:
-            self.audio.terminate()
-        
-        # 処理スレッドが終了するのを待つ
+        # 処理スレッドが終了するのを待ち、入力元を閉じる（応答待ちの暫定結果は破棄する）
         if hasattr(self, 'processing_thread') and self.processing_thread:
             self.processing_thread.join(timeout=2.0)
+        self.source.close()
+        self._end_partial()
+        
+        # 転写待ちのセグメントを処理し終えるまで待つ（入力を終端まで処理した場合は時間制限なし）
+        if self.worker_pool:
+            drain_timeout = None if self.input_finished.is_set() else self.STOP_DRAIN_TIMEOUT
+            if not self._drain_pending(drain_timeout):
+                self._debug("転写待ちのセグメントが残っていますが、待機を打ち切りました")
+            self.worker_pool.stop(drain=False)
+            self._debug(f"ワーカー統計: {self.worker_pool.stats()}")
+            if self._deferred:
+                print(f"\n警告: APIを利用できなかったため {len(self._deferred)} 件"
+                      f"（{self._deferred_seconds:.1f}秒）の音声を転写できませんでした")
+        if self.sequencer:
+            self.sequencer.stop()
+        
+        # 取り込みで音声が失われた場合は常に知らせる
+        capture_stats = self.source.stats()
+        if capture_stats:
+            self._debug(f"取り込み統計: {capture_stats}")
+            if capture_stats.get('overflows') or capture_stats.get('input_overflows'):
+                dropped_seconds = capture_stats['dropped_bytes'] / (self.sample_rate * self.sample_width * self.channels)
+                print(f"\n警告: 音声の取り込みが追いつきませんでした "
+                      f"(破棄: {dropped_seconds:.1f}秒, 入力オーバーフロー: {capture_stats['input_overflows']}回)")
+        if self.metrics:
+            self._debug(f"計測値: {self.get_metrics()}")
         
         # 最終結果を結合
         final_transcription = ' '.join(self.transcriptions)
@@ -475,6 +4171,78 @@ class WhisperLiveTranscriber:
         return final_transcription
 
 
+def _save_transcription(final_text, output):
+    """転写結果をファイルに保存します（指定されている場合）"""
+    if not output:
+        return
+    try:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(final_text)
+        print(f"\n転写結果を {output} に保存しました。")
+    except Exception as e:
+        print(f"\nファイル保存中にエラーが発生しました: {e}")
+
+
+def _create_rate_limiter(args):
+    """コマンドライン引数から API の利用枠の制限を作成します（指定が無い場合はNone）"""
+    if not (args.max_rpm or args.max_audio_rate or args.adaptive_concurrency):
+        return None
+    return APIRateGovernor.shared(
+        requests_per_minute=args.max_rpm,
+        audio_seconds_per_minute=args.max_audio_rate,
+        max_concurrency=args.num_workers if args.adaptive_concurrency else None,
+        state_file=args.rate_limit_file
+    )
+
+
+def _run_batch(args, api_key):
+    """batch サブコマンド：ディレクトリ内の音声ファイルをまとめて転写します"""
+    from batch import BatchTranscriber
+    
+    try:
+        batch = BatchTranscriber(
+            api_key=api_key,
+            output_dir=args.output_dir or os.path.join(args.input_dir, 'transcripts'),
+            language=args.language,
+            segment_length=args.segment_length,
+            energy_threshold=args.energy_threshold,
+            silence_duration=args.silence_duration,
+            confidence_threshold=args.confidence_threshold,
+            skip_silence=not args.no_skip_silence,
+            upload_codec=args.upload_codec,
+            num_workers=args.num_workers,
+            max_queue_size=args.max_queue_size,
+            http_pool_size=args.http_pool_size,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            http2=not args.no_http2,
+            api_url=transcriptions_url(args.api_base),
+            manifest_path=args.manifest,
+            rate_limiter=_create_rate_limiter(args),
+            adaptive_threshold=args.adaptive_threshold,
+            noise_margin=args.noise_margin,
+            vad=args.vad,
+            overlap=args.overlap,
+            cut_lookback=args.cut_lookback,
+            pre_roll=args.pre_roll,
+            hangover=args.hangover,
+            max_pause=args.max_pause,
+            max_retries=args.max_retries,
+            request_deadline=args.request_deadline,
+            circuit_threshold=args.circuit_threshold,
+            circuit_recovery_time=args.circuit_recovery_time,
+            debug_mode=args.debug
+        )
+        batch.run(args.input_dir)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        import traceback
+        print(f"エラーが発生しました: {e}")
+        if args.debug:
+            traceback.print_exc()
+
+
 def main():
     """メイン関数：コマンドライン引数を解析し、転写処理を実行します"""
     parser = argparse.ArgumentParser(description='WhisperLive - リアルタイム音声転写ツール')
@@ -486,6 +4254,26 @@ def main():
                         help='無音判定の閾値 0-1000 (低いほど敏感, デフォルト: 70)')
     parser.add_argument('--silence_duration', type=float, default=1.0, 
                         help='無音とみなす最小の長さ（秒, デフォルト: 1.0）')
+    parser.add_argument('--adaptive_threshold', action='store_true',
+                        help='無音判定の閾値を背景雑音のレベルに合わせて自動調整 (--energy_threshold は初期値になる)')
+    parser.add_argument('--noise_margin', type=float, default=2.0,
+                        help='自動調整時の雑音レベルに対する閾値の倍率 (デフォルト: 2.0)')
+    parser.add_argument('--overlap', type=float, default=0.0,
+                        help='最大セグメント長で区切ったときに次のセグメントに重ねる長さ（秒, 重複した転写は取り除く. デフォルト: 0）')
+    parser.add_argument('--cut_lookback', type=float, default=0.0,
+                        help='最大セグメント長に達したとき、直近のこの長さ（秒）のうち最も静かな位置で区切る (例: 1.5, デフォルト: 0 = 最大長ちょうど)')
+    parser.add_argument('--pre_roll', type=float,
+                        help='発話前の無音を送信せず、発話の直前のこの長さ（秒）だけを付ける (例: 0.3, 未指定時は無音も送信)')
+    parser.add_argument('--hangover', type=float,
+                        help='無音で区切ったときに発話の後ろに残す長さ（秒, デフォルト: --silence_duration の1/3）')
+    parser.add_argument('--max_pause', type=float,
+                        help='送信前に、発話の間のこの長さ（秒）より長い無音を詰め、先頭と末尾の無音をその半分まで削る (例: 0.3, 未指定時は詰めない)')
+    parser.add_argument('--partial_interval', type=float,
+                        help='分割途中の音声をこの間隔（秒）で暫定的に転写して表示 (低遅延. 未指定時は区切りごとに表示)')
+    parser.add_argument('--max_partials', type=int, default=3,
+                        help='1セグメントあたりの暫定結果のリクエスト数の上限 (デフォルト: 3)')
+    parser.add_argument('--vad', type=str, default='energy', choices=['energy'] + list(VAD_DETECTORS),
+                        help='発話検出の方式 (spectral: キーボード音・空調などの音声以外の音を除外, デフォルト: energy)')
     parser.add_argument('--confidence_threshold', type=float, default=0.3,
                         help='転写結果の確信度閾値 (0-1, デフォルト: 0.3)')
     parser.add_argument('--no_skip_silence', action='store_true',
@@ -494,6 +4282,70 @@ def main():
                         help='デバッグモードを有効化 (詳細なログを表示)')
     parser.add_argument('--output', type=str, 
                         help='転写結果をテキストファイルに保存（ファイルパスを指定）')
+    parser.add_argument('--debug_audio_dir', type=str,
+                        help='APIに送信した音声をこのディレクトリに保存 (デバッグ用, 既定では保存しない)')
+    parser.add_argument('--upload_codec', type=str, default='mp3',
+                        choices=list(UPLOAD_CODECS) + ['auto'],
+                        help='アップロード時のコーデック (auto: セグメント長と実測値から遅延最小のものを選択, デフォルト: mp3)')
+    parser.add_argument('--upload_bandwidth', type=float,
+                        help='autoモードで想定するアップロード帯域 (kbps, 未指定時は実測から推定)')
+    parser.add_argument('--http_pool_size', type=int,
+                        help='API接続プールの最大接続数 (デフォルト: --num_workers と同数)')
+    parser.add_argument('--connect_timeout', type=float, default=5.0,
+                        help='API接続タイムアウト（秒, デフォルト: 5.0）')
+    parser.add_argument('--read_timeout', type=float, default=60.0,
+                        help='API応答の読み取りタイムアウト（1回の試行あたり, 秒, デフォルト: 60.0）')
+    parser.add_argument('--max_retries', type=int, default=3,
+                        help='429・5xx・タイムアウト・接続エラー時の再試行回数 (指数バックオフ, Retry-After に従う, デフォルト: 3)')
+    parser.add_argument('--request_deadline', type=float, default=60.0,
+                        help='1セグメントの転写（再試行を含む）にかける最大時間（秒, デフォルト: 60.0）')
+    parser.add_argument('--circuit_threshold', type=int, default=5,
+                        help='APIの呼び出しを一時停止するまでの連続失敗回数 (0: 無効, デフォルト: 5)')
+    parser.add_argument('--circuit_recovery_time', type=float, default=30.0,
+                        help='APIの呼び出しを停止してから再開を試すまでの時間（秒, デフォルト: 30.0）')
+    parser.add_argument('--max_deferred_seconds', type=float, default=120.0,
+                        help='APIの停止中に保留して回復後に転写する音声の長さの上限（秒, 0: 保留しない, デフォルト: 120）')
+    parser.add_argument('--max_rpm', type=float,
+                        help='1分あたりのAPIリクエスト数の上限 (既定では制限しない)')
+    parser.add_argument('--max_audio_rate', type=float,
+                        help='1分あたりにAPIに送信する音声の長さ（秒）の上限 (既定では制限しない)')
+    parser.add_argument('--adaptive_concurrency', action='store_true',
+                        help='429 や応答の遅れに応じて同時リクエスト数を --num_workers 以下で自動調整する (AIMD)')
+    parser.add_argument('--rate_limit_file', type=str,
+                        help='--max_rpm / --max_audio_rate の利用状況を共有する状態ファイル (同じファイルを指定したプロセス間で共有)')
+    parser.add_argument('--no_http2', action='store_true',
+                        help='HTTP/2 を使用しない (httpx と h2 がインストールされている場合のみ有効)')
+    parser.add_argument('--num_workers', type=int, default=4,
+                        help='同時に転写するセグメント数の上限 (デフォルト: 4)')
+    parser.add_argument('--max_queue_size', type=int, default=8,
+                        help='転写待ちセグメント数の上限 (デフォルト: 8)')
+    parser.add_argument('--overflow_policy', type=str, default='block',
+                        choices=TranscriptionWorkerPool.OVERFLOW_POLICIES,
+                        help='転写待ちが上限に達したときの動作 (block: 待機, drop_oldest: 古いものを破棄, merge: 直前のセグメントに連結, デフォルト: block)')
+    parser.add_argument('--reorder_max_wait', type=float, default=5.0,
+                        help='前のセグメントの転写結果を待つ最大時間（秒, 超えると順不同で表示, デフォルト: 5.0）')
+    parser.add_argument('--capture_mode', type=str, default='callback',
+                        choices=MicrophoneSource.CAPTURE_MODES,
+                        help='マイクの取り込み方式 (callback: コールバックでバッファに取り込み別スレッドで分割, blocking: 読み取りと分割を同じスレッドで行う, デフォルト: callback)')
+    parser.add_argument('--input', type=str, default='mic',
+                        help='音声の入力元 (mic: マイク, -: 標準入力の生PCM, 名前付きパイプ, WAV/FLACなどの音声ファイル, デフォルト: mic)')
+    parser.add_argument('--realtime', action='store_true',
+                        help='音声ファイルを実時間と同じ速さで読み出す (既定では処理できる速さで読み出す)')
+    parser.add_argument('--api_base', type=str,
+                        help='APIのベースURL (例: http://127.0.0.1:8000/v1, デフォルト: 環境変数 OPENAI_BASE_URL または OpenAI)')
+    parser.add_argument('--metrics_port', type=int,
+                        help='計測値を http://127.0.0.1:PORT/metrics で公開する（Prometheus 形式, 既定では計測しない）')
+    
+    # サブコマンド（未指定時はリアルタイム転写）
+    subparsers = parser.add_subparsers(dest='command')
+    batch_parser = subparsers.add_parser(
+        'batch', help='ディレクトリ内の音声ファイルをまとめて転写します',
+        description='ディレクトリ内の音声ファイルをまとめて転写します（共通オプションは batch の前に指定します）')
+    batch_parser.add_argument('input_dir', type=str, help='音声ファイルを含むディレクトリ（サブディレクトリも対象）')
+    batch_parser.add_argument('--output_dir', type=str,
+                              help='転写結果とマニフェストを書き出すディレクトリ (デフォルト: INPUT_DIR/transcripts)')
+    batch_parser.add_argument('--manifest', type=str,
+                              help='進捗を記録するマニフェストのパス (デフォルト: OUTPUT_DIR/manifest.jsonl)')
     
     args = parser.parse_args()
     
@@ -502,44 +4354,81 @@ def main():
     # APIキーがコマンドラインで指定されていない場合、環境変数またはユーザー入力を使用
     if not api_key:
         api_key = os.environ.get('OPENAI_API_KEY')
-        
+    
     if not api_key:
         api_key = input("OpenAI API Keyを入力してください: ")
     
+    if args.command == 'batch':
+        _run_batch(args, api_key)
+        return
+    
+    # 計測値の公開（指定時のみ計測する）
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = MetricsRegistry()
+        metrics_server = MetricsServer(metrics, port=args.metrics_port)
+        metrics_server.start()
+        print(f"計測値を公開しています: {metrics_server.url}")
+    
     # 転写器を初期化
     try:
+        input_source = open_audio_source(args.input, realtime=args.realtime, capture_mode=args.capture_mode)
         transcriber = WhisperLiveTranscriber(
             api_key=api_key,
             language=args.language,
             segment_length=args.segment_length,
             energy_threshold=args.energy_threshold,
             silence_duration=args.silence_duration,
+            adaptive_threshold=args.adaptive_threshold,
+            noise_margin=args.noise_margin,
+            vad=args.vad,
             confidence_threshold=args.confidence_threshold,
             skip_silence=not args.no_skip_silence,
-            debug_mode=args.debug
+            debug_mode=args.debug,
+            debug_audio_dir=args.debug_audio_dir,
+            upload_codec=args.upload_codec,
+            upload_bandwidth=args.upload_bandwidth * 1000 / 8 if args.upload_bandwidth else None,
+            http_pool_size=args.http_pool_size,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            http2=not args.no_http2,
+            num_workers=args.num_workers,
+            max_queue_size=args.max_queue_size,
+            overflow_policy=args.overflow_policy,
+            reorder_max_wait=args.reorder_max_wait,
+            input_source=input_source,
+            api_base=args.api_base,
+            metrics=metrics,
+            partial_interval=args.partial_interval,
+            max_partials=args.max_partials,
+            overlap=args.overlap,
+            cut_lookback=args.cut_lookback,
+            pre_roll=args.pre_roll,
+            hangover=args.hangover,
+            max_pause=args.max_pause,
+            max_retries=args.max_retries,
+            request_deadline=args.request_deadline,
+            circuit_threshold=args.circuit_threshold,
+            circuit_recovery_time=args.circuit_recovery_time,
+            max_deferred_seconds=args.max_deferred_seconds,
+            rate_limiter=_create_rate_limiter(args)
         )
         
         # 録音開始
         transcriber.start_recording()
         
-        # ユーザーがCtrl+Cを押すまで待機
-        while True:
-            time.sleep(0.1)
+        # ユーザーがCtrl+Cを押すか、入力の終端まで処理するまで待機
+        while not transcriber.wait_for_input(0.1):
+            pass
+        
+        print("\n\n入力の終端に達しました")
+        _save_transcription(transcriber.stop_recording(), args.output)
     
     except KeyboardInterrupt:
         print("\n\n録音を停止します...")
         # 録音停止
         if 'transcriber' in locals() and transcriber.is_recording:
-            final_text = transcriber.stop_recording()
-            
-            # 結果をファイルに保存（指定されている場合）
-            if args.output:
-                try:
-                    with open(args.output, 'w', encoding='utf-8') as f:
-                        f.write(final_text)
-                    print(f"\n転写結果を {args.output} に保存しました。")
-                except Exception as e:
-                    print(f"\nファイル保存中にエラーが発生しました: {e}")
+            _save_transcription(transcriber.stop_recording(), args.output)
     
     except Exception as e:
         import traceback
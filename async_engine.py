@@ -0,0 +1,532 @@
+import time
+import asyncio
+import threading
+import pyaudio
+from WhisperLive import (
+    AudioSegmenter, FfmpegCodec, UPLOAD_CODECS, transcriptions_url,
+    estimate_transcript_confidence, RetryPolicy, CircuitBreaker, CircuitOpenError,
+    WhisperAPIError, parse_retry_after
+)
+
+try:
+    import httpx  # 非同期HTTPクライアント（非同期エンジンを使用する場合は必須）
+except ImportError:
+    httpx = None
+
+########################################################################
+# 非同期HTTPクライアントの作成
+########################################################################
+def create_async_client(pool_size=16, connect_timeout=5.0, read_timeout=60.0, http2=True):
+    """
+    複数のセッションで共有できる keep-alive 付きの非同期HTTPクライアントを作成します
+    
+    引数:
+        pool_size (int, optional): 同時に保持する最大接続数
+        connect_timeout (float, optional): 接続タイムアウト（秒）
+        read_timeout (float, optional): 応答の読み取りタイムアウト（秒）
+        http2 (bool, optional): h2 がインストールされていれば HTTP/2 を使用する
+    
+    返値:
+        httpx.AsyncClient: 非同期HTTPクライアント
+    """
+    if httpx is None:
+        raise RuntimeError("非同期エンジンには httpx が必要です: pip install httpx[http2]")
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    if http2:
+        try:
+            return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+        except ImportError:
+            # h2 パッケージが無い場合は HTTP/1.1 で接続
+            pass
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+async def async_call_with_retry(request, policy, breaker=None, read_timeout=60.0, on_retry=None):
+    """
+    WhisperLive.call_with_retry の asyncio 版です
+    
+    429・5xx・タイムアウト・接続エラーは policy の待ち時間（Retry-After 以上）を空けて再試行します。
+    サーキットブレーカーが開いている間は、deadline の範囲で再開を待ってから呼び出します。
+    
+    引数:
+        request (callable): 読み取りタイムアウト（秒）を受け取り、APIを1回呼び出すコルーチン関数
+        policy (RetryPolicy): 再試行方針
+        breaker (CircuitBreaker, optional): サーキットブレーカー
+        read_timeout (float, optional): 1回の呼び出しの読み取りタイムアウト（秒）
+        on_retry (callable, optional): 再試行の前に (失敗回数, 待ち時間, 例外) を受け取る関数
+    
+    返値:
+        request の返値
+    
+    例外:
+        CircuitOpenError: deadline までにサーキットブレーカーが閉じなかった場合
+        WhisperAPIError, 通信エラー: 再試行しないエラー、または再試行しても解消しなかった場合
+    """
+    deadline = time.monotonic() + policy.deadline if policy.deadline else None
+    attempt = 0
+    
+    while True:
+        if breaker and not breaker.allow_request():
+            wait = max(breaker.retry_in(), 0.05)
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                raise CircuitOpenError(breaker.retry_in())
+            await asyncio.sleep(wait)
+            continue
+        
+        timeout = read_timeout
+        if deadline is not None:
+            timeout = max(0.1, min(timeout, deadline - time.monotonic()))
+        try:
+            result = await request(timeout)
+        except Exception as e:
+            retryable = policy.is_retryable(e)
+            if breaker:
+                # 400 などの応答はAPI自体には到達できているため失敗として数えない
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not retryable:
+                raise
+            
+            attempt += 1
+            delay = policy.backoff(attempt, getattr(e, 'retry_after', None))
+            if attempt >= policy.max_attempts or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            if on_retry:
+                on_retry(attempt, delay, e)
+            await asyncio.sleep(delay)
+            continue
+        
+        if breaker:
+            breaker.record_success()
+        return result
+
+
+########################################################################
+# 転写結果
+########################################################################
+class TranscriptionResult:
+    """
+    非同期エンジンが返す転写結果
+    
+    Attributes:
+        sequence (int): セグメントの連番
+        text (str): 転写結果
+        start_offset (float): 開始からのセグメント開始位置（秒）
+        end_offset (float): 開始からのセグメント終了位置（秒）
+        latency (float): セグメントを切り出してから結果が得られるまでの時間（秒）
+    """
+    __slots__ = ('sequence', 'text', 'start_offset', 'end_offset', 'latency')
+    
+    def __init__(self, sequence, text, start_offset, end_offset, latency):
+        self.sequence = sequence
+        self.text = text
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.latency = latency
+    
+    def __repr__(self):
+        return f"TranscriptionResult(#{self.sequence}, {self.start_offset:.2f}-{self.end_offset:.2f}s, {self.text!r})"
+
+
+########################################################################
+# AsyncWhisperLiveEngine クラス
+########################################################################
+class AsyncWhisperLiveEngine:
+    """
+    asyncio で動作するリアルタイム音声文字起こしエンジン
+    
+    WhisperLiveTranscriber と同じセグメント分割・無音判定・確信度フィルタを
+    イベントループ上で実行します。音声の取得は1本の専用スレッドだけが行い、
+    API呼び出しは共有可能な非同期HTTPクライアントで並行して実行します。
+    転写結果は async for で取り込み順に受け取れます。
+        
+        engine = AsyncWhisperLiveEngine(api_key)
+        await engine.start()
+        async for result in engine:
+            print(result.text)
+    
+    Attributes:
+        api_key (str): OpenAI APIキー
+        language (str): 文字起こし対象の言語
+        capture (bool): マイクから音声を取得するかどうか（False の場合は feed() で供給）
+        max_concurrency (int): 同時に実行するAPIリクエスト数の上限
+    """
+    
+    ########################################################################
+    # コンストラクタ
+    ########################################################################
+    def __init__(self, api_key, language='ja', sample_rate=16000,
+                 segment_length=10, energy_threshold=70,
+                 silence_duration=1.0, confidence_threshold=0.3,
+                 skip_silence=True, upload_codec='mp3',
+                 max_concurrency=4, max_queue_size=8, reorder_max_wait=5.0,
+                 api_url=None, client=None, capture=True,
+                 max_retries=3, request_deadline=60.0, circuit_threshold=5, circuit_recovery_time=30.0,
+                 debug_mode=False):
+        """
+        AsyncWhisperLiveEngineのインスタンスを初期化します。
+        
+        Args:
+            api_key (str): OpenAI APIキー
+            language (str, optional): 文字起こし対象の言語. デフォルト "ja"
+            sample_rate (int, optional): サンプリングレート. デフォルト 16000
+            segment_length (int, optional): 1セグメントの最大長さ（秒）. デフォルト 10
+            energy_threshold (int, optional): 無音判定の閾値. デフォルト 70
+            silence_duration (float, optional): 無音とみなす最小の長さ（秒）. デフォルト 1.0
+            confidence_threshold (float, optional): 確信度の閾値. デフォルト 0.3
+            skip_silence (bool, optional): 無音区間スキップの有効/無効. デフォルト True
+            upload_codec (str, optional): アップロード時のコーデック (wav/flac/opus/mp3). デフォルト "mp3"
+            max_concurrency (int, optional): 同時に実行するAPIリクエスト数の上限. デフォルト 4
+            max_queue_size (int, optional): 転写待ちセグメント数の上限（超えると分割処理が待機）. デフォルト 8
+            reorder_max_wait (float, optional): 前のセグメントの結果を待つ最大時間（秒）. デフォルト 5.0
+            api_url (str, optional): Whisper API のエンドポイント. 未指定時は環境変数 OPENAI_BASE_URL、なければ OpenAI
+            client (httpx.AsyncClient, optional): 共有する非同期HTTPクライアント. 未指定時はエンジンが作成して閉じます
+            capture (bool, optional): マイクから音声を取得する. False の場合は feed() で音声を供給. デフォルト True
+            max_retries (int, optional): 429・5xx・タイムアウト・接続エラー時の再試行回数. デフォルト 3
+            request_deadline (float, optional): 1セグメントの転写（再試行を含む）にかける最大時間（秒）. デフォルト 60.0
+            circuit_threshold (int, optional): APIの呼び出しを一時停止するまでの連続失敗回数（0 で無効）. デフォルト 5
+            circuit_recovery_time (float, optional): 呼び出しを停止してから再開を試すまでの時間（秒）. デフォルト 30.0
+            debug_mode (bool, optional): デバッグモードの有効/無効. デフォルト False
+        """
+        if upload_codec not in UPLOAD_CODECS:
+            raise ValueError(f"未対応のコーデックです: {upload_codec} (選択肢: {', '.join(UPLOAD_CODECS)})")
+        
+        self.api_key = api_key
+        self.language = language
+        self.sample_rate = sample_rate
+        self.channels = 1
+        self.format = pyaudio.paInt16
+        self.sample_width = pyaudio.get_sample_size(self.format)
+        self.confidence_threshold = confidence_threshold
+        self.skip_silence = skip_silence
+        self.codec = UPLOAD_CODECS[upload_codec]()
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max(1, max_queue_size)
+        self.reorder_max_wait = reorder_max_wait
+        self.api_url = api_url or transcriptions_url()
+        self.capture = capture
+        self.retry_policy = RetryPolicy(max_attempts=max_retries + 1, deadline=request_deadline)
+        self.circuit_breaker = CircuitBreaker(circuit_threshold, circuit_recovery_time) if circuit_threshold > 0 else None
+        self.debug_mode = debug_mode
+        
+        # フレーム設定
+        self.frame_duration_ms = 20
+        self.frames_per_buffer = int(sample_rate * self.frame_duration_ms / 1000)
+        self.segmenter = AudioSegmenter(
+            frame_duration_ms=self.frame_duration_ms,
+            segment_length=segment_length,
+            energy_threshold=energy_threshold,
+            silence_duration=silence_duration,
+            sample_rate=sample_rate
+        )
+        
+        # HTTPクライアント（未指定時は start() で作成）
+        self.client = client
+        self._owns_client = client is None
+        
+        self.is_running = False
+        self._loop = None
+        self._frames = None
+        self._segments = None
+        self._results = None
+        self._tasks = []
+        self._reader_thread = None
+        self._next_sequence = 0
+        self._next_release = 0
+        self._pending_results = {}
+        self._reorder_timer = None
+    
+    def _debug(self, message):
+        """デバッグモードが有効な場合のみメッセージを表示します"""
+        if self.debug_mode:
+            print(f"[DEBUG] {message}")
+    
+    ########################################################################
+    # 開始
+    ########################################################################
+    async def start(self):
+        """
+        文字起こしを開始します。
+        
+        capture=True の場合はマイクを開き、専用スレッドで音声の取得を開始します。
+        
+        Raises:
+            RuntimeError: マイクへのアクセスに失敗した場合
+        """
+        if self.is_running:
+            self._debug("既に実行中です")
+            return
+        
+        self._loop = asyncio.get_running_loop()
+        self._frames = asyncio.Queue()
+        self._segments = asyncio.Queue(maxsize=self.max_queue_size)
+        self._results = asyncio.Queue()
+        self._next_sequence = 0
+        self._next_release = 0
+        self._pending_results = {}
+        self.segmenter.reset()
+        
+        if self.client is None:
+            self.client = create_async_client(pool_size=self.max_concurrency)
+        
+        if self.capture:
+            self.audio = pyaudio.PyAudio()
+            try:
+                self.stream = self.audio.open(
+                    format=self.format,
+                    channels=self.channels,
+                    rate=self.sample_rate,
+                    input=True,
+                    frames_per_buffer=self.frames_per_buffer
+                )
+            except Exception as e:
+                self.audio.terminate()
+                raise RuntimeError(f"マイクへのアクセスに失敗しました: {e}")
+        
+        self.is_running = True
+        self._tasks = [asyncio.ensure_future(self._segment_loop())]
+        self._tasks += [asyncio.ensure_future(self._worker()) for _ in range(self.max_concurrency)]
+        
+        if self.capture:
+            self._reader_thread = threading.Thread(target=self._read_audio, name='async-engine-reader')
+            self._reader_thread.daemon = True
+            self._reader_thread.start()
+    
+    def _read_audio(self):
+        """マイクから音声を読み取り、イベントループのキューに渡す専用スレッド"""
+        while self.is_running:
+            try:
+                data = self.stream.read(self.frames_per_buffer, exception_on_overflow=False)
+            except Exception as e:
+                self._debug(f"音声取得中にエラーが発生しました: {e}")
+                time.sleep(0.1)
+                continue
+            self._loop.call_soon_threadsafe(self._frames.put_nowait, data)
+    
+    ########################################################################
+    # 外部からの音声供給
+    ########################################################################
+    async def feed(self, pcm_data):
+        """
+        音声データを供給します（capture=False の場合に使用）
+        
+        引数:
+            pcm_data (bytes): 16bit リトルエンディアンのPCMデータ（長さは任意）
+        
+        例外:
+            RuntimeError: start() の前、または stop() の後に呼び出した場合
+        """
+        if not self.is_running:
+            raise RuntimeError("文字起こしが実行されていません。feed() の前に start() を呼び出してください")
+        self._frames.put_nowait(bytes(pcm_data))
+        # 分割処理に制御を渡す
+        await asyncio.sleep(0)
+    
+    ########################################################################
+    # セグメント分割
+    ########################################################################
+    async def _segment_loop(self):
+        """フレームをセグメントに分割し、転写待ちキューに投入します"""
+        while True:
+            data = await self._frames.get()
+            if data is None:
+                break
+            # 受け取ったPCMはまとめてエネルギーを計算して分割する
+            for segment in self.segmenter.feed_pcm(data):
+                self._debug(f"音声セグメント分割: {segment.cut_reason} (長さ: {segment.duration:.1f}秒)")
+                await self._submit(segment)
+        
+        # 入力の終端: 残りのフレームも転写する
+        segment = self.segmenter.flush()
+        if segment is not None:
+            await self._submit(segment)
+        for _ in range(self.max_concurrency):
+            await self._segments.put(None)
+    
+    async def _submit(self, segment):
+        """無音でなければ連番を付けて転写待ちキューに投入します（満杯の場合は待機）"""
+        is_silent, normalized_energy, active_ratio = self.segmenter.analyze_silence(segment)
+        if is_silent and self.skip_silence:
+            self._debug(f"無音セグメントをスキップします: 全体エネルギー={normalized_energy:.1f}, 活発フレーム比率={active_ratio:.2f}")
+            return
+        segment.sequence = self._next_sequence
+        self._next_sequence += 1
+        await self._segments.put(segment)
+    
+    ########################################################################
+    # 転写
+    ########################################################################
+    async def _worker(self):
+        """転写待ちキューからセグメントを取り出して転写するワーカー"""
+        while True:
+            segment = await self._segments.get()
+            if segment is None:
+                return
+            result = None
+            try:
+                text = await self._transcribe(segment)
+                if text and text.strip():
+                    confidence = estimate_transcript_confidence(text)
+                    if confidence >= self.confidence_threshold:
+                        result = TranscriptionResult(
+                            segment.sequence, text, segment.start_offset, segment.end_offset,
+                            time.monotonic() - segment.captured_at
+                        )
+                    else:
+                        self._debug(f"低確信度の転写結果を無視 ({confidence:.2f}): {text}")
+            except Exception as e:
+                # 再試行しても転写できなかった（この区間の結果は欠ける）
+                print(f"セグメント #{segment.sequence} ({segment.start_offset:.1f}-{segment.end_offset:.1f}秒) "
+                      f"を転写できませんでした: {e}")
+            finally:
+                self._complete(segment.sequence, result)
+    
+    async def _transcribe(self, segment):
+        """
+        セグメントをエンコードしてWhisper APIに送信します（一時的なエラーは再試行します）
+        
+        返値:
+            str: 転写されたテキスト
+        
+        例外:
+            WhisperAPIError, 通信エラー, CircuitOpenError: 再試行しても転写できなかった場合
+        """
+        if isinstance(self.codec, FfmpegCodec):
+            # ffmpeg の実行中もイベントループを止めない
+            audio_data = await self._loop.run_in_executor(
+                None, self.codec.encode, segment.pcm, self.sample_rate, self.channels, self.sample_width)
+        else:
+            audio_data = self.codec.encode(segment.pcm, self.sample_rate, self.channels, self.sample_width)
+        
+        async def request(read_timeout):
+            response = await self.client.post(
+                self.api_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                files={'file': (self.codec.filename, audio_data, self.codec.mime_type)},
+                data={'model': 'whisper-1', 'language': self.language},
+                timeout=httpx.Timeout(read_timeout, connect=self.client.timeout.connect)
+            )
+            if response.status_code != 200:
+                self._debug(f"APIエラー: {response.status_code}, {response.text}")
+                raise WhisperAPIError(response.status_code, response.text,
+                                      parse_retry_after(response.headers.get('Retry-After')))
+            return response.json().get('text', '')
+        
+        return await async_call_with_retry(
+            request, self.retry_policy, self.circuit_breaker, self.client.timeout.read or 60.0,
+            on_retry=lambda attempt, delay, e: self._debug(
+                f"#{segment.sequence}: {delay:.1f}秒後に再試行します ({attempt}/{self.retry_policy.max_attempts - 1}回目): {e}")
+        )
+    
+    ########################################################################
+    # 結果の並べ替え
+    ########################################################################
+    def _complete(self, sequence, result):
+        """
+        セグメントの結果を登録し、連番が揃ったものから取り込み順に出力します
+        
+        先に届いた結果が reorder_max_wait 秒を超えて保留された場合は抜けを諦めて先に進みます。
+        """
+        if sequence < self._next_release:
+            # 待ち時間を超えて諦めた後に届いた結果
+            if result is not None:
+                self._results.put_nowait(result)
+            return
+        self._pending_results[sequence] = (result, time.monotonic())
+        self._release_ready()
+        self._schedule_reorder()
+    
+    def _release_ready(self):
+        """連番が揃っている結果を出力キューに移します"""
+        while self._next_release in self._pending_results:
+            result, _ = self._pending_results.pop(self._next_release)
+            if result is not None:
+                self._results.put_nowait(result)
+            self._next_release += 1
+    
+    def _schedule_reorder(self):
+        """最も古い保留中の結果が届いてから reorder_max_wait 秒後にタイマーを設定し直します"""
+        if self._reorder_timer is not None:
+            self._reorder_timer.cancel()
+            self._reorder_timer = None
+        if not self._pending_results:
+            return
+        oldest = min(arrived for _, arrived in self._pending_results.values())
+        delay = max(0.0, oldest + self.reorder_max_wait - time.monotonic())
+        self._reorder_timer = self._loop.call_later(delay, self._reorder_timeout)
+    
+    def _reorder_timeout(self):
+        """待ち時間を超えた抜けを諦めて出力を進めます"""
+        self._reorder_timer = None
+        if not self._pending_results:
+            return
+        oldest = min(arrived for _, arrived in self._pending_results.values())
+        if oldest + self.reorder_max_wait <= time.monotonic():
+            self._next_release = min(self._pending_results)
+            self._release_ready()
+        self._schedule_reorder()
+    
+    ########################################################################
+    # 結果の取得
+    ########################################################################
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        """
+        次の転写結果を返します。stop() 後にすべての結果を返し終えると終了します。
+        
+        返値:
+            TranscriptionResult: 転写結果
+        """
+        if self._results is None:
+            raise StopAsyncIteration
+        result = await self._results.get()
+        if result is None:
+            # 終了マーカーは他の待機者のために戻しておく
+            self._results.put_nowait(None)
+            raise StopAsyncIteration
+        return result
+    
+    ########################################################################
+    # 停止
+    ########################################################################
+    async def stop(self):
+        """
+        文字起こしを停止します。
+        
+        音声の取得を止め、分割途中の音声と転写待ちのセグメントを処理し終えてから
+        結果の出力を終了します。
+        """
+        if not self.is_running:
+            self._debug("実行していません")
+            return
+        self.is_running = False
+        
+        if self.capture:
+            if self._reader_thread:
+                await self._loop.run_in_executor(None, self._reader_thread.join, 2.0)
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+        
+        # 入力の終端を通知し、分割・転写の完了を待つ
+        self._frames.put_nowait(None)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        # 保留中の結果をすべて出力して終了
+        if self._reorder_timer is not None:
+            self._reorder_timer.cancel()
+            self._reorder_timer = None
+        while self._pending_results:
+            self._next_release = min(self._pending_results)
+            self._release_ready()
+        self._results.put_nowait(None)
+        
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -0,0 +1,443 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from WhisperLive import (
+    AudioSegmenter, NoiseFloorTracker, create_vad, stitch_transcripts, TranscriptionWorkerPool, WhisperHTTPClient, WhisperAPIError,
+    UPLOAD_CODECS, transcriptions_url, RAW_PCM_EXTENSIONS, estimate_transcript_confidence, open_audio_source, SilenceCompactor,
+    RetryPolicy, CircuitBreaker, call_with_retry
+)
+
+# 転写対象とする音声ファイルの拡張子
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.m4a', '.ogg', '.opus', '.webm') + RAW_PCM_EXTENSIONS
+
+# 進捗を記録するマニフェストのファイル名（出力ディレクトリ内）
+MANIFEST_NAME = 'manifest.jsonl'
+
+########################################################################
+# BatchFile クラス
+########################################################################
+class BatchFile:
+    """
+    バッチ処理中の1ファイル
+    
+    Attributes:
+        path (str): 音声ファイルのパス
+        name (str): 入力ディレクトリからの相対パス（マニフェストのキー）
+        transcript_path (str): 転写結果を書き出すパス
+        results (dict): 連番 → 転写結果（採用しなかった場合はNone）
+        overlapped (dict): 連番 → 前のセグメントと重なっている長さ（秒）
+        pending (int): 転写待ち・転写中のセグメント数
+        failed (int): 転写に失敗したセグメント数
+        read_error (str): 読み出しに失敗した場合のエラー内容
+        reading (bool): 音声を読み出し中の場合True
+    """
+    def __init__(self, path, name, transcript_path):
+        self.path = path
+        self.name = name
+        self.transcript_path = transcript_path
+        self.results = {}
+        self.overlapped = {}
+        self.pending = 0
+        self.failed = 0
+        self.read_error = None
+        self.reading = True
+        self.uploaded = 0
+        self.reused = 0
+        self.started_at = time.monotonic()
+
+
+########################################################################
+# BatchTranscriber クラス
+########################################################################
+class BatchTranscriber:
+    """
+    ディレクトリ内の音声ファイルをまとめて転写するクラス
+    
+    ファイルごとに通常モードと同じ無音検出でセグメントを分割し、転写は全ファイルで共有する
+    ワーカープールで実行します。完了したセグメントはマニフェストに記録するため、
+    中断後に再実行すると転写済みのセグメントはAPIに送信せずに続きから処理します。
+    
+    Attributes:
+        output_dir (str): 転写結果とマニフェストを書き出すディレクトリ
+        manifest_path (str): マニフェストのパス
+        worker_pool (TranscriptionWorkerPool): 全ファイルで共有するワーカープール
+    """
+    def __init__(self, api_key, output_dir, language='ja', sample_rate=16000,
+                 segment_length=10, energy_threshold=70, silence_duration=1.0,
+                 confidence_threshold=0.3, skip_silence=True, upload_codec='mp3',
+                 num_workers=8, max_queue_size=32, http_pool_size=None,
+                 connect_timeout=5.0, read_timeout=60.0, http2=True,
+                 api_url=None, manifest_path=None, rate_limiter=None,
+                 adaptive_threshold=False, noise_margin=2.0, vad='energy', overlap=0.0,
+                 cut_lookback=0.0, pre_roll=None, hangover=None, max_pause=None,
+                 max_retries=3, request_deadline=60.0, circuit_threshold=5, circuit_recovery_time=30.0,
+                 debug_mode=False):
+        """
+        Args:
+            api_key (str): OpenAI APIキー
+            output_dir (str): 転写結果とマニフェストを書き出すディレクトリ
+            language (str, optional): 文字起こし対象の言語. デフォルト "ja"
+            sample_rate (int, optional): 処理するサンプリングレート. デフォルト 16000
+            segment_length (int, optional): 1セグメントの最大長さ（秒）. デフォルト 10
+            energy_threshold (int, optional): 無音判定の閾値. デフォルト 70
+            silence_duration (float, optional): 無音とみなす最小の長さ（秒）. デフォルト 1.0
+            confidence_threshold (float, optional): 確信度の閾値. デフォルト 0.3
+            skip_silence (bool, optional): 無音区間スキップの有効/無効. デフォルト True
+            upload_codec (str, optional): アップロード時のコーデック (wav/flac/opus/mp3). デフォルト "mp3"
+            num_workers (int, optional): 全ファイル合計の同時転写数. デフォルト 8
+            max_queue_size (int, optional): 全ファイル合計の転写待ち上限. デフォルト 32
+            http_pool_size (int, optional): API接続プールの最大接続数. デフォルト num_workers と同数
+            connect_timeout (float, optional): API接続タイムアウト（秒）. デフォルト 5.0
+            read_timeout (float, optional): API応答の読み取りタイムアウト（秒）. デフォルト 60.0
+            http2 (bool, optional): 利用可能であれば HTTP/2 を使用する. デフォルト True
+            api_url (str, optional): Whisper API のエンドポイント. 未指定時は環境変数 OPENAI_BASE_URL、なければ OpenAI
+            manifest_path (str, optional): マニフェストのパス. デフォルト output_dir/manifest.jsonl
+            rate_limiter (APIRateGovernor, optional): リクエスト数・音声の長さ・同時実行数の制限. デフォルト None
+            adaptive_threshold (bool, optional): 無音判定の閾値をファイルごとの背景雑音に合わせて自動調整する. デフォルト False
+            noise_margin (float, optional): 自動調整時の雑音レベルに対する閾値の倍率. デフォルト 2.0
+            vad (str, optional): 発話検出の方式 (energy/spectral). デフォルト "energy"
+            overlap (float, optional): 最大セグメント長で区切ったときに次のセグメントに重ねる長さ（秒）. デフォルト 0.0
+            cut_lookback (float, optional): 最大セグメント長に達したときに最も静かな位置を探す長さ（秒）. デフォルト 0.0
+            pre_roll (float, optional): 発話の直前に付ける長さ（秒）. 指定すると発話前の無音は送信しない. デフォルト None
+            hangover (float, optional): 無音で区切ったときに発話の後ろに残す長さ（秒）. デフォルト silence_duration の1/3
+            max_pause (float, optional): 送信前に、発話の間のこの長さ（秒）より長い無音を詰める. デフォルト None（詰めない）
+            max_retries (int, optional): 429・5xx・タイムアウト・接続エラー時の再試行回数. デフォルト 3
+            request_deadline (float, optional): 1セグメントの転写（再試行を含む）にかける最大時間（秒）. デフォルト 60.0
+            circuit_threshold (int, optional): APIの呼び出しを一時停止するまでの連続失敗回数（0 で無効）. デフォルト 5
+            circuit_recovery_time (float, optional): 呼び出しを停止してから再開を試すまでの時間（秒）. デフォルト 30.0
+            debug_mode (bool, optional): デバッグモードの有効/無効. デフォルト False
+        """
+        if upload_codec not in UPLOAD_CODECS:
+            raise ValueError(f"未対応のコーデックです: {upload_codec} (選択肢: {', '.join(UPLOAD_CODECS)})")
+        
+        self.api_key = api_key
+        self.output_dir = output_dir
+        self.manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_NAME)
+        self.language = language
+        self.sample_rate = sample_rate
+        self.segment_length = segment_length
+        self.energy_threshold = energy_threshold
+        self.adaptive_threshold = adaptive_threshold
+        self.noise_margin = noise_margin
+        self.overlap = overlap
+        self.cut_lookback = cut_lookback
+        self.pre_roll = pre_roll
+        self.hangover = hangover
+        self.silence_duration = silence_duration
+        self.confidence_threshold = confidence_threshold
+        self.skip_silence = skip_silence
+        self.codec = UPLOAD_CODECS[upload_codec]()
+        self.api_url = api_url or transcriptions_url()
+        self.rate_limiter = rate_limiter
+        self.read_timeout = read_timeout
+        self.retry_policy = RetryPolicy(max_attempts=max_retries + 1, deadline=request_deadline)
+        self.circuit_breaker = CircuitBreaker(circuit_threshold, circuit_recovery_time) if circuit_threshold > 0 else None
+        self.debug_mode = debug_mode
+        
+        # フレーム設定
+        self.frame_duration_ms = 20
+        self.vad = create_vad(vad, sample_rate, self.frame_duration_ms)  # 状態を持たないため全ファイルで共有
+        self.compactor = (SilenceCompactor(frame_duration_ms=self.frame_duration_ms, max_pause=max_pause)
+                          if max_pause is not None else None)
+        self.read_size = int(sample_rate * 2)  # 1回に読み出すバイト数（1秒分）
+        
+        # 全ファイルで共有する接続プールとワーカープール（待ち行列が満杯の間は読み出しを止める）
+        self.http_client = WhisperHTTPClient(
+            pool_size=http_pool_size or num_workers,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            http2=http2
+        )
+        self.worker_pool = TranscriptionWorkerPool(
+            self._transcribe,
+            num_workers=num_workers,
+            max_queue_size=max_queue_size,
+            overflow_policy='block',
+            on_error=self._on_worker_error,
+            name='batch-transcribe'
+        )
+        
+        self._condition = threading.Condition()
+        self._manifest = None
+        self._completed_files = set()
+        self._completed_segments = {}  # ファイル名 → {(開始, 終了): 転写結果}
+        self.files_done = 0
+        self.files_failed = 0
+        self.files_skipped = 0
+    
+    def _debug(self, message):
+        """デバッグモードが有効な場合のみメッセージを表示します"""
+        if self.debug_mode:
+            print(f"[DEBUG] {message}")
+    
+    ########################################################################
+    # マニフェスト
+    ########################################################################
+    def _load_manifest(self):
+        """前回までの進捗をマニフェストから読み込みます"""
+        self._completed_files = set()
+        self._completed_segments = {}
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 中断時に書きかけになった行は無視する
+                if record.get('type') == 'segment':
+                    key = (record['start'], record['end'])
+                    self._completed_segments.setdefault(record['file'], {})[key] = record['text']
+                elif record.get('type') == 'file':
+                    self._completed_files.add(record['file'])
+        self._debug(f"マニフェストを読み込みました: 完了ファイル={len(self._completed_files)}, "
+                    f"完了セグメント={sum(len(s) for s in self._completed_segments.values())}")
+    
+    def _write_manifest(self, record):
+        """マニフェストに1件追記します（self._condition を取得した状態で呼び出します）"""
+        if self._manifest is None or self._manifest.closed:
+            return  # 中断後に完了した転写は記録しない（再実行時に送信し直す）
+        self._manifest.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._manifest.flush()
+    
+    @staticmethod
+    def _segment_key(segment):
+        """マニフェストでセグメントを識別するキー（開始・終了位置）"""
+        return (round(segment.start_offset, 3), round(segment.end_offset, 3))
+    
+    ########################################################################
+    # 実行
+    ########################################################################
+    def find_files(self, input_dir, extensions=AUDIO_EXTENSIONS):
+        """
+        ディレクトリ以下の音声ファイルを探します
+        
+        引数:
+            input_dir (str): 入力ディレクトリ
+            extensions (tuple, optional): 対象とする拡張子
+        
+        返値:
+            list: (パス, 相対パス) のリスト（相対パス順）
+        """
+        output_dir = os.path.abspath(self.output_dir)
+        files = []
+        for root, dirs, names in os.walk(input_dir):
+            # 出力ディレクトリが入力ディレクトリ内にある場合は対象外
+            dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_dir)
+            for name in names:
+                if name.lower().endswith(extensions):
+                    path = os.path.join(root, name)
+                    files.append((path, os.path.relpath(path, input_dir).replace(os.sep, '/')))
+        return sorted(files, key=lambda item: item[1])
+    
+    def run(self, input_dir, extensions=AUDIO_EXTENSIONS):
+        """
+        ディレクトリ内の音声ファイルをすべて転写し、ファイルごとに転写結果を書き出します
+        
+        引数:
+            input_dir (str): 入力ディレクトリ
+            extensions (tuple, optional): 対象とする拡張子
+        
+        返値:
+            dict: 処理結果の集計（完了・失敗・スキップしたファイル数など）
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._load_manifest()
+        files = self.find_files(input_dir, extensions)
+        print(f"{len(files)} 個の音声ファイルを処理します（転写済み: {len(self._completed_files)}）")
+        
+        started_at = time.monotonic()
+        self.worker_pool.start()
+        self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        try:
+            for path, name in files:
+                if name in self._completed_files:
+                    self.files_skipped += 1
+                    continue
+                transcript_path = os.path.join(self.output_dir, os.path.splitext(name)[0] + '.txt')
+                self._process_file(BatchFile(path, name, transcript_path))
+            # 最後のファイルの転写が終わるまで待つ
+            self.worker_pool.stop(drain=True)
+        except KeyboardInterrupt:
+            self.worker_pool.stop(drain=False)
+            print("\n中断しました。再実行すると転写済みのセグメントを除いて続きから処理します。")
+            raise
+        finally:
+            with self._condition:
+                self._manifest.close()
+            self.http_client.close()
+        
+        summary = {
+            'files': len(files),
+            'done': self.files_done,
+            'failed': self.files_failed,
+            'skipped': self.files_skipped,
+            'elapsed': round(time.monotonic() - started_at, 1),
+        }
+        print(f"完了: {summary['done']}, 失敗: {summary['failed']}, 転写済みでスキップ: {summary['skipped']} "
+              f"({summary['elapsed']}秒)")
+        return summary
+    
+    def _process_file(self, job):
+        """
+        1ファイルを読み出してセグメント分割し、転写をワーカープールに投入します
+        
+        ファイルの読み出しは実時間を待たずに行い、待ち行列が満杯の間は投入を待ちます。
+        """
+        segmenter = AudioSegmenter(
+            frame_duration_ms=self.frame_duration_ms,
+            segment_length=self.segment_length,
+            energy_threshold=self.energy_threshold,
+            silence_duration=self.silence_duration,
+            sample_rate=self.sample_rate,
+            noise_tracker=(NoiseFloorTracker(frame_duration_ms=self.frame_duration_ms, margin=self.noise_margin,
+                                             initial_threshold=self.energy_threshold)
+                           if self.adaptive_threshold else None),
+            vad=self.vad,
+            overlap=self.overlap,
+            cut_lookback=self.cut_lookback,
+            pre_roll=self.pre_roll,
+            hangover=self.hangover
+        )
+        completed = self._completed_segments.get(job.name, {})
+        next_sequence = 0
+        try:
+            source = open_audio_source(job.path, self.sample_rate)
+            source.open()
+        except Exception as e:
+            print(f"{job.name}: 読み込めませんでした ({e})")
+            with self._condition:
+                self.files_failed += 1
+            return
+        
+        try:
+            while True:
+                data = source.read(self.read_size)
+                segments = segmenter.feed_pcm(data) if data else []
+                if data is None:
+                    segment = segmenter.flush()
+                    segments = [segment] if segment is not None else []
+                for segment in segments:
+                    is_silent, _, _ = segmenter.analyze_silence(segment)
+                    if is_silent and self.skip_silence:
+                        continue
+                    segment.sequence = next_sequence
+                    next_sequence += 1
+                    if segment.overlap_frames:
+                        job.overlapped[segment.sequence] = segment.overlap_frames * self.frame_duration_ms / 1000
+                    key = self._segment_key(segment)
+                    if self.compactor:
+                        segment = self.compactor.compact(segment, segmenter.energy_threshold)
+                    if key in completed:
+                        # 前回の実行で転写済み（APIには送信しない）
+                        job.results[segment.sequence] = completed[key]
+                        job.reused += 1
+                        continue
+                    with self._condition:
+                        job.pending += 1
+                    self.worker_pool.submit((job, segment))
+                if data is None:
+                    break
+        except Exception as e:
+            print(f"{job.name}: 読み込み中にエラーが発生しました ({e})")
+            job.read_error = str(e)
+        finally:
+            source.close()
+        
+        with self._condition:
+            job.reading = False
+            if not job.pending:
+                self._finish_file(job)
+    
+    ########################################################################
+    # 転写
+    ########################################################################
+    def _transcribe(self, item):
+        """共有ワーカープールから呼び出され、1セグメントを転写します"""
+        job, segment = item
+        text = None
+        succeeded = False
+        try:
+            audio_data = self.codec.encode(segment.pcm, self.sample_rate)
+            transcription = self._request(audio_data, segment.audio_duration)
+            succeeded = True
+            if transcription and transcription.strip():
+                confidence = estimate_transcript_confidence(transcription)
+                if confidence >= self.confidence_threshold:
+                    text = transcription
+                else:
+                    self._debug(f"{job.name}: 低確信度の転写結果を無視 ({confidence:.2f}): {transcription}")
+        except WhisperAPIError as e:
+            self._debug(f"{job.name}: APIエラー: {e.status_code}, {e.body}")
+        except Exception as e:
+            self._debug(f"{job.name}: 転写中にエラーが発生しました: {e}")
+        finally:
+            self._complete(job, segment, text, succeeded)
+    
+    def _on_worker_error(self, item, error):
+        """結果の記録などで捕捉されなかった例外を表示します（デバッグモード時はスタックトレースも表示）"""
+        import traceback
+        job, segment = item
+        self._debug(f"{job.name}: セグメントの処理中に予期しないエラーが発生しました: {error}")
+        if self.debug_mode:
+            traceback.print_exc()
+    
+    def _request(self, audio_data, duration):
+        """API利用枠の制限に従って Whisper API を呼び出します（一時的なエラーは再試行します）"""
+        def request(read_timeout):
+            with self.rate_limiter.request(duration) if self.rate_limiter else contextlib.nullcontext():
+                return self.http_client.transcribe(
+                    self.api_url, self.api_key, audio_data,
+                    filename=self.codec.filename, mime_type=self.codec.mime_type,
+                    language=self.language, read_timeout=read_timeout
+                )
+        
+        return call_with_retry(request, self.retry_policy, self.circuit_breaker, self.read_timeout,
+                               on_retry=lambda attempt, delay, e: self._debug(f"{delay:.1f}秒後に再試行します ({attempt}回目): {e}"))
+    
+    def _complete(self, job, segment, text, succeeded):
+        """セグメントの転写完了をマニフェストに記録し、ファイルの処理が終わっていれば書き出します"""
+        with self._condition:
+            job.pending -= 1
+            if succeeded:
+                job.results[segment.sequence] = text
+                job.uploaded += 1
+                start, end = self._segment_key(segment)
+                self._write_manifest({'type': 'segment', 'file': job.name, 'sequence': segment.sequence,
+                                      'start': start, 'end': end, 'text': text})
+            else:
+                # マニフェストに記録しないため、再実行時にこのセグメントだけ送信し直す
+                job.failed += 1
+            if not job.reading and not job.pending:
+                self._finish_file(job)
+    
+    def _finish_file(self, job):
+        """転写結果をファイルに書き出します（self._condition を取得した状態で呼び出します）"""
+        elapsed = time.monotonic() - job.started_at
+        if job.read_error:
+            self.files_failed += 1
+            return
+        if job.failed:
+            self.files_failed += 1
+            print(f"{job.name}: {job.failed} 個のセグメントの転写に失敗しました（再実行すると失敗したセグメントのみ送信します）")
+            return
+        
+        # 直前のセグメントと音声が重なっている場合は、重複した部分を取り除いて連結する
+        texts = []
+        for sequence in sorted(job.results):
+            text = job.results[sequence]
+            previous = job.results.get(sequence - 1)
+            if text and previous and sequence in job.overlapped:
+                text = stitch_transcripts(previous, text, window=int(job.overlapped[sequence] * 10) + 5)
+            if text:
+                texts.append(text)
+        os.makedirs(os.path.dirname(job.transcript_path) or '.', exist_ok=True)
+        with open(job.transcript_path, 'w', encoding='utf-8') as f:
+            f.write(' '.join(texts))
+        self._write_manifest({'type': 'file', 'file': job.name, 'segments': len(job.results),
+                              'transcript': job.transcript_path})
+        self.files_done += 1
+        print(f"{job.name}: {len(job.results)} セグメント (送信 {job.uploaded}, 転写済み {job.reused}, {elapsed:.1f}秒) "
+              f"-> {job.transcript_path}")
@@ -0,0 +1,495 @@
+import io
+import sys
+import json
+import time
+import bisect
+import hashlib
+import argparse
+import platform
+import resource
+import threading
+import contextlib
+import multiprocessing
+import numpy as np
+import requests
+from WhisperLive import (
+    WhisperLiveTranscriber, AudioSource, WhisperHTTPClient, WavCodec, UPLOAD_CODECS, transcriptions_url, httpx
+)
+from mock_server import MockWhisperServer, LatencyModel
+
+# 計測する処理段階（セグメントごと）
+STAGES = ('capture_to_cut', 'queue_wait', 'encode', 'upload', 'response', 'display', 'end_to_end')
+
+# --compare で比較する指標（値が大きいほど悪い）
+COMPARED_METRICS = (
+    'end_to_end.p50', 'end_to_end.p95', 'end_to_end.p99',
+    'encode.p50', 'upload.p50', 'response.p50', 'display.p50',
+    'cpu_per_audio_second', 'peak_rss_mb',
+)
+
+########################################################################
+# 合成音声
+########################################################################
+def synthesize_speech(rng, seconds, sample_rate=16000, amplitude=6000):
+    """
+    音声に似た信号（基本周波数が揺らぐ倍音列を音節程度の周期で振幅変調したもの）を生成します
+    
+    引数:
+        rng (numpy.random.Generator): 乱数生成器
+        seconds (float): 長さ（秒）
+        sample_rate (int, optional): サンプリングレート
+        amplitude (float, optional): 最大振幅
+    
+    返値:
+        numpy.ndarray: float64 の信号
+    """
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = rng.uniform(100, 220) + 30 * np.sin(2 * np.pi * rng.uniform(0.3, 1.0) * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 9))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 6) * t + rng.uniform(0, 2 * np.pi))
+    noise = rng.normal(0, 0.05, t.size)
+    return (voiced / 2 * envelope + noise) * amplitude
+
+
+def synthesize_silence(rng, seconds, sample_rate=16000, noise_level=15):
+    """背景雑音程度の無音を生成します"""
+    return rng.normal(0, noise_level, int(seconds * sample_rate))
+
+
+def generate_pcm(duration, sample_rate=16000, seed=0, long_silence_ratio=0.1):
+    """
+    発話と無音が交互に続く合成音声を生成します
+    
+    ときどき長い無音を挟み、無音セグメントのスキップも計測対象に含めます。
+    
+    引数:
+        duration (float): 全体の長さ（秒）
+        sample_rate (int, optional): サンプリングレート
+        seed (int, optional): 乱数シード
+        long_silence_ratio (float, optional): 発話の後に長い無音を挟む割合
+    
+    返値:
+        bytes: 16bit・モノラルのPCM
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0.0
+    while total < duration:
+        speech = rng.uniform(1.5, 6.0)
+        pause = rng.uniform(8.0, 15.0) if rng.random() < long_silence_ratio else rng.uniform(0.3, 2.5)
+        parts.append(synthesize_speech(rng, speech, sample_rate))
+        parts.append(synthesize_silence(rng, pause, sample_rate))
+        total += speech + pause
+    signal = np.concatenate(parts)[:int(duration * sample_rate)]
+    return np.clip(signal, -32768, 32767).astype(np.int16).tobytes()
+
+
+class SyntheticSource(AudioSource):
+    """
+    合成音声を指定した速度で読み出す入力元
+    
+    読み出した位置ごとの時刻を記録し、セグメントの終端が届いた時刻を求められるようにします。
+    """
+    name = 'synthetic'
+    
+    def __init__(self, pcm_data, sample_rate=16000, speed=0.0):
+        """
+        引数:
+            pcm_data (bytes): 16bit・モノラルのPCM
+            sample_rate (int, optional): サンプリングレート
+            speed (float, optional): 実時間に対する速度（1で実時間, 0で制限なし）
+        """
+        super().__init__(sample_rate)
+        self.pcm_data = pcm_data
+        self.speed = speed
+        self.position = 0
+        self._started_at = None
+        self._delivered_offsets = []  # 読み出し終えた位置（秒）
+        self._delivered_times = []    # その時刻（time.monotonic）
+    
+    def open(self):
+        self.position = 0
+        self._started_at = time.monotonic()
+    
+    def read(self, max_bytes):
+        if self.position >= len(self.pcm_data):
+            return None
+        if self.speed > 0:
+            elapsed_bytes = int((time.monotonic() - self._started_at) * self.speed * self.bytes_per_second)
+            max_bytes = min(max_bytes, (elapsed_bytes - self.position) // 2 * 2)
+            if max_bytes <= 0:
+                return b''
+        data = self.pcm_data[self.position:self.position + max_bytes]
+        self.position += len(data)
+        self._delivered_offsets.append(self.position / self.bytes_per_second)
+        self._delivered_times.append(time.monotonic())
+        return data
+    
+    def delivered_at(self, offset):
+        """指定した位置（秒）までの音声が届いた時刻を返します"""
+        index = bisect.bisect_left(self._delivered_offsets, offset - 1e-9)
+        return self._delivered_times[min(index, len(self._delivered_times) - 1)]
+
+
+########################################################################
+# 計測用の転写器
+########################################################################
+class BenchmarkTranscriber(WhisperLiveTranscriber):
+    """
+    処理段階ごとの時刻を記録する WhisperLiveTranscriber
+    
+    _process_audio / _process_segment / _transcribe_segment の処理はそのまま使用し、
+    エンコード・API呼び出し・表示の前後の時刻だけを記録します。
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = {}
+        self.silent_segments = 0
+        self._current = threading.local()
+    
+    def _is_silent_segment(self, segment):
+        is_silent = super()._is_silent_segment(segment)
+        if is_silent:
+            self.silent_segments += 1
+        return is_silent
+    
+    def _transcribe_segment(self, segment):
+        record = {
+            'end_offset': segment.end_offset,
+            'duration': segment.duration,
+            'cut_at': segment.captured_at,
+            'dequeued_at': time.monotonic(),
+        }
+        self.records[segment.sequence] = record
+        self._current.record = record
+        super()._transcribe_segment(segment)
+    
+    def _encode_segment(self, pcm_data):
+        started_at = time.monotonic()
+        audio_data, codec = super()._encode_segment(pcm_data)
+        record = self._current.record
+        record['encode'] = time.monotonic() - started_at
+        record['bytes'] = len(audio_data)
+        return audio_data, codec
+    
+    def _transcribe_audio(self, audio_data, filename='segment.mp3', mime_type='audio/mpeg', duration=0.0):
+        record = self._current.record
+        record['digest'] = hashlib.sha256(audio_data).hexdigest()
+        record['request_at'] = time.monotonic()
+        text = super()._transcribe_audio(audio_data, filename, mime_type, duration)
+        record['response_at'] = time.monotonic()
+        return text
+    
+    def _emit_transcription(self, sequence, text, in_order):
+        super()._emit_transcription(sequence, text, in_order)
+        record = self.records.get(sequence)
+        if record is not None:
+            record['displayed_at'] = time.monotonic()
+
+
+########################################################################
+# 擬似APIサーバー（別プロセス）
+########################################################################
+def _run_mock_server(options, received):
+    """別プロセスで擬似APIサーバーを起動し、音声の受信時刻を received に送ります"""
+    def on_received(audio_data, received_at):
+        received.put((hashlib.sha256(audio_data).hexdigest(), received_at))
+    
+    server = MockWhisperServer(port=0, on_received=on_received, **options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.start()
+    received.put(('port', server.port))
+    while True:
+        time.sleep(1)
+
+
+def _percentiles(values):
+    """p50/p95/p99 と平均・最大（ミリ秒）を返します"""
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        'count': int(values.size),
+        'mean': round(float(values.mean()), 2),
+        'p50': round(float(np.percentile(values, 50)), 2),
+        'p95': round(float(np.percentile(values, 95)), 2),
+        'p99': round(float(np.percentile(values, 99)), 2),
+        'max': round(float(values.max()), 2),
+    }
+
+
+def _peak_rss_mb():
+    """このプロセスの最大常駐メモリ（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+########################################################################
+# 実行
+########################################################################
+def run_benchmark(duration=120.0, speed=0.0, upload_codec='wav', num_workers=4, max_queue_size=8,
+                  segment_length=10, latency='uniform:0.1,0.3', latency_per_second=0.0,
+                  rate_500=0.0, seed=0):
+    """
+    合成音声を転写処理に流し、処理段階ごとの時間とリソース使用量を計測します
+    
+    引数:
+        duration (float, optional): 合成音声の長さ（秒）
+        speed (float, optional): 音声を読み出す速度（1で実時間, 0で制限なし）
+        upload_codec (str, optional): アップロード時のコーデック
+        num_workers (int, optional): 転写ワーカー数
+        max_queue_size (int, optional): 転写待ちの上限
+        segment_length (int, optional): 1セグメントの最大長さ（秒）
+        latency (str, optional): 擬似APIの応答遅延の分布
+        latency_per_second (float, optional): 擬似APIで音声1秒あたりに加える遅延（秒）
+        rate_500 (float, optional): 擬似APIが 500 を返す割合
+        seed (int, optional): 合成音声と擬似APIの乱数シード
+    
+    返値:
+        dict: 計測結果
+    """
+    LatencyModel(latency, latency_per_second)  # 指定を先に検証する
+    pcm_data = generate_pcm(duration, seed=seed)
+    audio_seconds = len(pcm_data) / 32000
+    
+    # 擬似APIサーバーは CPU 使用量の計測に含めないよう別プロセスで起動する
+    received = multiprocessing.Queue()
+    mock_options = {'latency': latency, 'latency_per_second': latency_per_second,
+                    'rate_500': rate_500, 'seed': seed}
+    mock = multiprocessing.Process(target=_run_mock_server, args=(mock_options, received), daemon=True)
+    mock.start()
+    _, port = received.get(timeout=30)
+    api_base = f"http://127.0.0.1:{port}/v1"
+    
+    source = SyntheticSource(pcm_data, speed=speed)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            transcriber = BenchmarkTranscriber(
+                api_key='benchmark', language='en', segment_length=segment_length,
+                upload_codec=upload_codec, num_workers=num_workers, max_queue_size=max_queue_size,
+                input_source=source, api_base=api_base
+            )
+            cpu_started = time.process_time()
+            children_started = resource.getrusage(resource.RUSAGE_CHILDREN)
+            wall_started = time.monotonic()
+            transcriber.start_recording()
+            transcriber.wait_for_input()
+            transcriber.stop_recording()
+            wall_time = time.monotonic() - wall_started
+            cpu_time = time.process_time() - cpu_started
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            encoder_cpu = (children.ru_utime + children.ru_stime
+                           - children_started.ru_utime - children_started.ru_stime)
+        mock_stats = requests.get(f"http://127.0.0.1:{port}/stats", timeout=5).json()
+    finally:
+        mock.terminate()
+        mock.join()
+    
+    # 擬似APIが音声を受信し終えた時刻（アップロードと応答待ちの境目）
+    received_at = {}
+    while not received.empty():
+        digest, at = received.get()
+        received_at.setdefault(digest, at)
+    
+    stages = {stage: [] for stage in STAGES}
+    for record in transcriber.records.values():
+        delivered = source.delivered_at(record['end_offset'])
+        stages['capture_to_cut'].append(record['cut_at'] - delivered)
+        stages['queue_wait'].append(record['dequeued_at'] - record['cut_at'])
+        if 'encode' in record:
+            stages['encode'].append(record['encode'])
+        if 'response_at' in record and record.get('digest') in received_at:
+            stages['upload'].append(received_at[record['digest']] - record['request_at'])
+            stages['response'].append(record['response_at'] - received_at[record['digest']])
+        if 'displayed_at' in record:
+            stages['display'].append(record['displayed_at'] - record['response_at'])
+            stages['end_to_end'].append(record['displayed_at'] - delivered)
+    
+    return {
+        'config': {
+            'duration': duration, 'speed': speed, 'upload_codec': upload_codec,
+            'num_workers': num_workers, 'max_queue_size': max_queue_size, 'segment_length': segment_length,
+            'latency': latency, 'latency_per_second': latency_per_second, 'rate_500': rate_500, 'seed': seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'http_client': 'httpx' if httpx is not None else 'requests',
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'audio_seconds': round(audio_seconds, 2),
+        'wall_seconds': round(wall_time, 3),
+        'realtime_factor': round(audio_seconds / wall_time, 2) if wall_time > 0 else None,
+        'segments': {
+            'transcribed': len(transcriber.records),
+            'silent': transcriber.silent_segments,
+            'displayed': len(stages['end_to_end']),
+            'bytes_uploaded': sum(record.get('bytes', 0) for record in transcriber.records.values()),
+        },
+        'stages_ms': {stage: _percentiles(values) for stage, values in stages.items()},
+        'cpu_seconds': round(cpu_time, 3),
+        'encoder_cpu_seconds': round(encoder_cpu, 3),
+        'cpu_per_audio_second': round((cpu_time + encoder_cpu) / audio_seconds, 5),
+        'peak_rss_mb': _peak_rss_mb(),
+        'mock_server': mock_stats,
+    }
+
+
+def check_connection_reuse(requests_count=20, pool_size=2, http2=True):
+    """
+    1つの WhisperHTTPClient で続けて転写し、keep-alive で接続を再利用していることを確認します
+    
+    擬似APIサーバーが受け付けたTCP接続数が pool_size 以下であれば再利用できています。
+    
+    引数:
+        requests_count (int, optional): 続けて送信するリクエスト数
+        pool_size (int, optional): 接続プールの最大接続数
+        http2 (bool, optional): 利用可能であれば HTTP/2 を使用する
+    
+    返値:
+        dict: requests, connections, pool_size, http_client, reused（接続数が pool_size 以下ならTrue）
+    """
+    server = MockWhisperServer(port=0, latency='fixed:0.01')
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.start()
+    client = WhisperHTTPClient(pool_size=pool_size, http2=http2)
+    audio_data = WavCodec().encode(generate_pcm(1.0), 16000)
+    try:
+        for _ in range(requests_count):
+            client.transcribe(transcriptions_url(server.url), 'benchmark', audio_data,
+                              filename='segment.wav', mime_type='audio/wav', language='en')
+        stats = server.stats()
+    finally:
+        client.close()
+        server.stop()
+    return {
+        'requests': stats['requests'],
+        'connections': stats['connections'],
+        'pool_size': pool_size,
+        'http_client': 'httpx' if client.http2 else 'requests',
+        'reused': stats['connections'] <= pool_size,
+    }
+
+
+def _metric(result, name):
+    """'end_to_end.p50' のような名前で計測結果の値を取り出します"""
+    if '.' in name:
+        stage, key = name.split('.')
+        values = result['stages_ms'].get(stage)
+        return values[key] if values else None
+    return result.get(name)
+
+
+def compare_results(result, baseline, tolerance=0.2):
+    """
+    基準の計測結果と比較し、悪化した指標を表示します
+    
+    引数:
+        result (dict): 今回の計測結果
+        baseline (dict): 基準の計測結果
+        tolerance (float, optional): 悪化とみなす増加率
+    
+    返値:
+        list: 悪化した指標の名前
+    """
+    regressions = []
+    print(f"\n{'指標':<24}{'基準':>12}{'今回':>12}{'変化':>10}")
+    for name in COMPARED_METRICS:
+        old, new = _metric(baseline, name), _metric(result, name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        mark = ''
+        if change > tolerance:
+            regressions.append(name)
+            mark = '  <- 悪化'
+        print(f"{name:<24}{old:>12}{new:>12}{change:>+10.1%}{mark}")
+    return regressions
+
+
+def print_summary(result):
+    """計測結果の概要を表示します"""
+    print(f"音声: {result['audio_seconds']}秒, 処理時間: {result['wall_seconds']}秒 "
+          f"(実時間の {result['realtime_factor']} 倍), コーデック: {result['config']['upload_codec']}")
+    segments = result['segments']
+    print(f"セグメント: 転写 {segments['transcribed']}, 無音 {segments['silent']}, "
+          f"表示 {segments['displayed']}, 送信 {segments['bytes_uploaded']} bytes")
+    print(f"\n{'段階 (ms)':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}")
+    for stage in STAGES:
+        values = result['stages_ms'][stage]
+        if values:
+            print(f"{stage:<16}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}{values['max']:>10}")
+    print(f"\nCPU: {result['cpu_seconds']}秒 (エンコーダ {result['encoder_cpu_seconds']}秒), "
+          f"音声1秒あたり {result['cpu_per_audio_second'] * 1000:.2f}ms, 最大メモリ: {result['peak_rss_mb']}MB")
+
+
+def main():
+    """メイン関数：コマンドライン引数を解析し、ベンチマークを実行します"""
+    parser = argparse.ArgumentParser(description='WhisperLive - 転写処理のベンチマーク（擬似APIを使用）')
+    parser.add_argument('--duration', type=float, default=120, help='合成音声の長さ（秒, デフォルト: 120）')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='音声を読み出す速度 (1: 実時間, 0: 制限なし, デフォルト: 0)')
+    parser.add_argument('--upload_codec', type=str, default='wav', choices=list(UPLOAD_CODECS) + ['auto'],
+                        help='アップロード時のコーデック (デフォルト: wav)')
+    parser.add_argument('--num_workers', type=int, default=4, help='転写ワーカー数 (デフォルト: 4)')
+    parser.add_argument('--max_queue_size', type=int, default=8, help='転写待ちの上限 (デフォルト: 8)')
+    parser.add_argument('--segment_length', type=int, default=10, help='1セグメントの最大長さ（秒, デフォルト: 10）')
+    parser.add_argument('--latency', type=str, default='uniform:0.1,0.3',
+                        help='擬似APIの応答遅延の分布 (mock_server.py と同じ形式, デフォルト: uniform:0.1,0.3)')
+    parser.add_argument('--latency_per_second', type=float, default=0.0,
+                        help='擬似APIで音声1秒あたりに加える遅延（秒, デフォルト: 0.0）')
+    parser.add_argument('--rate_500', type=float, default=0.0, help='擬似APIが 500 を返す割合 (デフォルト: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード (デフォルト: 0)')
+    parser.add_argument('--output', type=str, help='計測結果を保存するJSONファイル')
+    parser.add_argument('--compare', type=str, help='比較する基準の計測結果（JSONファイル）')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='--compare で悪化とみなす増加率 (デフォルト: 0.2)')
+    parser.add_argument('--check_connections', type=int, metavar='N',
+                        help='ベンチマークの代わりに N 回続けて転写し、接続数が --num_workers 以下か確認する')
+    
+    args = parser.parse_args()
+    
+    if args.check_connections:
+        check = check_connection_reuse(args.check_connections, pool_size=args.num_workers)
+        print(f"リクエスト: {check['requests']}, 接続数: {check['connections']} "
+              f"(プール: {check['pool_size']}, {check['http_client']})")
+        if not check['reused']:
+            print("接続が再利用されていません")
+            sys.exit(1)
+        return
+    
+    result = run_benchmark(
+        duration=args.duration,
+        speed=args.speed,
+        upload_codec=args.upload_codec,
+        num_workers=args.num_workers,
+        max_queue_size=args.max_queue_size,
+        segment_length=args.segment_length,
+        latency=args.latency,
+        latency_per_second=args.latency_per_second,
+        rate_500=args.rate_500,
+        seed=args.seed
+    )
+    print_summary(result)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n計測結果を {args.output} に保存しました。")
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} 個の指標が {args.tolerance:.0%} 以上悪化しました: {', '.join(regressions)}")
+            sys.exit(1)
+
+########################################################################
+# エントリーポイント
+########################################################################
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 import json
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
 from WhisperLive import WhisperLiveTranscriber
@@ -17,6 +18,7 @@ class WhisperLiveGUI:
         root (tk.Tk): メインウィンドウ
         transcriber (WhisperLiveTranscriber): 音声文字起こしエンジン
         is_recording (bool): 録音状態のフラグ
+        is_stopping (bool): 録音を停止し、残りの転写を待っている間のフラグ
         api_key (str): OpenAI APIキー
     """
 
@@ -33,6 +35,8 @@ class WhisperLiveGUI:
         self.root.geometry("1000x700")
         self.transcriber = None
         self.is_recording = False
+        self.is_stopping = False
+        self.close_requested = False
         
         # スタイルの設定
         self.setup_styles()
@@ -238,6 +242,9 @@ class WhisperLiveGUI:
                                    textvariable=self.energy_threshold_var,
                                    width=5)
         energy_spinbox.grid(row=0, column=2, sticky=tk.W, padx=5)
+        self.adaptive_threshold_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(energy_frame, text="背景雑音に合わせて自動調整（設定値は初期値）",
+                       variable=self.adaptive_threshold_var).grid(row=1, column=1, columnspan=2, sticky=tk.W, padx=5)
         
         # 確信度閾値
         confidence_frame = ttk.Frame(settings_frame)
@@ -272,9 +279,17 @@ class WhisperLiveGUI:
         ttk.Checkbutton(checks_frame, text="無音区間をスキップ",
                        variable=self.skip_silence_var).grid(row=0, column=0, sticky=tk.W, padx=5)
         
+        self.spectral_vad_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(checks_frame, text="音声以外の音（キーボード・空調など）を無視",
+                       variable=self.spectral_vad_var).grid(row=1, column=0, sticky=tk.W, padx=5)
+        
+        self.partial_results_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(checks_frame, text="話し終わる前に暫定結果を表示（API呼び出しが増えます）",
+                       variable=self.partial_results_var).grid(row=2, column=0, sticky=tk.W, padx=5)
+        
         self.debug_mode_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(checks_frame, text="デバッグモード",
-                       variable=self.debug_mode_var).grid(row=1, column=0, sticky=tk.W, padx=5)
+                       variable=self.debug_mode_var).grid(row=3, column=0, sticky=tk.W, padx=5)
         
         # コントロールボタン
         control_buttons = ttk.Frame(control_panel)
@@ -305,6 +320,7 @@ class WhisperLiveGUI:
                                 padx=10,
                                 pady=10)
         self.text_area.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W), padx=5, pady=5)
+        self.text_area.tag_configure('partial', foreground='#888888')  # 確定前の暫定結果
         
         scrollbar = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.text_area.yview)
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
@@ -336,7 +352,7 @@ class WhisperLiveGUI:
         - 録音の開始
         
         録音停止時：
-        - 録音の停止
+        - 別スレッドで録音を停止し、残りの転写を待つ
         - 最終結果の表示
         - GUIの状態更新
         
@@ -356,54 +372,131 @@ class WhisperLiveGUI:
             self.save_api_key(api_key)
             
             try:
+                # GUIに転写結果を表示するためのコールバック
+                # （転写スレッドから呼ばれるため、表示はメインスレッドで行う）
+                def on_transcription(text):
+                    self.root.after(0, lambda: self.append_transcription(text))
+                
+                def on_partial(text):
+                    self.root.after(0, lambda: self.show_partial(text))
+                
                 self.transcriber = WhisperLiveTranscriber(
                     api_key=api_key,
                     language=self.language_var.get(),
                     segment_length=self.segment_length_var.get(),
                     energy_threshold=self.energy_threshold_var.get(),
+                    adaptive_threshold=self.adaptive_threshold_var.get(),
                     confidence_threshold=self.confidence_threshold_var.get(),  # 追加
                     skip_silence=self.skip_silence_var.get(),
-                    debug_mode=self.debug_mode_var.get()
+                    vad='spectral' if self.spectral_vad_var.get() else 'energy',
+                    debug_mode=self.debug_mode_var.get(),
+                    on_transcription=on_transcription,
+                    partial_interval=1.0 if self.partial_results_var.get() else None,
+                    on_partial=on_partial
                 )
                 
-                self.transcriber.transcriptions = []  # 転写結果をクリア
                 self.text_area.delete(1.0, tk.END)  # テキストエリアをクリア
                 
-                # GUIに転写結果を表示するためのコールバックを設定
-                def on_transcription(text):
-                    self.text_area.insert(tk.END, f"> {text}\n")
-                    self.text_area.see(tk.END)
-                
-                # WhisperLiveTranscriberのtranscriptionsリストに要素が追加されたときに
-                # コールバックを呼び出すように_transcribe_segmentメソッドを修正
-                original_transcribe_segment = self.transcriber._transcribe_segment
-                def wrapped_transcribe_segment(*args, **kwargs):
-                    result = original_transcribe_segment(*args, **kwargs)
-                    if self.transcriber.transcriptions:
-                        latest = self.transcriber.transcriptions[-1]
-                        self.root.after(0, lambda: on_transcription(latest))
-                    return result
-                self.transcriber._transcribe_segment = wrapped_transcribe_segment
-                
                 self.transcriber.start_recording()
                 self.is_recording = True
                 self.record_button.configure(text="録音停止")
                 self.status_var.set("録音中...")
+                if self.transcriber.noise_tracker:
+                    self.update_noise_status()
                 
             except Exception as e:
                 messagebox.showerror("エラー", f"録音の開始に失敗しました: {e}")
                 self.is_recording = False
                 
-        else:
-            # 録音停止
-            if self.transcriber:
+        elif not self.is_stopping:
+            # 録音停止（残りのセグメントの転写を待つ間も画面が固まらないよう別スレッドで停止する）
+            self.is_stopping = True
+            self.record_button.configure(text="停止中...", state=tk.DISABLED)
+            self.status_var.set("残りの転写を待っています...")
+            threading.Thread(target=self.stop_in_background, daemon=True).start()
+    
+    def stop_in_background(self):
+        """
+        録音を停止して残りの転写を待ち、最終転写結果の表示をメインスレッドに依頼します。
+        
+        別スレッドで実行されます。
+        """
+        final_text = ""
+        if self.transcriber:
+            try:
                 final_text = self.transcriber.stop_recording()
-                self.text_area.insert(tk.END, "\n\n=== 最終転写結果 ===\n")
-                self.text_area.insert(tk.END, final_text)
-                self.text_area.see(tk.END)
-            self.is_recording = False
-            self.record_button.configure(text="録音開始")
-            self.status_var.set("録音停止")
+            except Exception as e:
+                final_text = f"（録音の停止中にエラーが発生しました: {e}）"
+        self.root.after(0, lambda: self.show_final_result(final_text))
+    
+    def show_final_result(self, final_text):
+        """
+        最終転写結果を表示し、録音開始前の状態に戻します。
+        
+        停止中に届いた転写結果の表示はこれより前に処理されます。以降に届いた結果は表示しません。
+        
+        Args:
+            final_text (str): 最終転写結果
+        """
+        self.is_recording = False
+        self.is_stopping = False
+        self.clear_partial()
+        self.text_area.insert(tk.END, "\n\n=== 最終転写結果 ===\n")
+        self.text_area.insert(tk.END, final_text)
+        self.text_area.see(tk.END)
+        self.record_button.configure(text="録音開始", state=tk.NORMAL)
+        self.status_var.set("録音停止")
+        if self.close_requested:
+            self.root.destroy()
+    
+    def update_noise_status(self):
+        """
+        閾値の自動調整中に、推定した雑音レベルと現在の閾値をステータスバーに表示します。
+        
+        録音中は1秒ごとに更新します。
+        """
+        if not self.is_recording or self.is_stopping or not self.transcriber:
+            return
+        state = self.transcriber.noise_tracker.state()
+        if state['noise_floor'] is not None:
+            self.status_var.set(f"録音中... (雑音レベル: {state['noise_floor']:.0f}, 無音判定閾値: {state['threshold']:.0f})")
+        self.root.after(1000, self.update_noise_status)
+    
+    ########################################################################
+    # 転写結果の表示
+    ########################################################################
+    def append_transcription(self, text):
+        """
+        転写結果をテキストエリアに追加します。
+        
+        Args:
+            text (str): 表示する転写結果
+        """
+        if not self.is_recording:
+            # 最終転写結果を表示した後に届いた結果
+            return
+        self.clear_partial()
+        self.text_area.insert(tk.END, f"> {text}\n")
+        self.text_area.see(tk.END)
+    
+    def show_partial(self, text):
+        """
+        確定前の暫定結果を末尾に表示します（前の暫定結果は置き換えます）。
+        
+        Args:
+            text (str): 表示する暫定結果
+        """
+        if not self.is_recording:
+            return
+        self.clear_partial()
+        self.text_area.insert(tk.END, f"~ {text}\n", 'partial')
+        self.text_area.see(tk.END)
+    
+    def clear_partial(self):
+        """表示中の暫定結果を削除します。"""
+        ranges = self.text_area.tag_ranges('partial')
+        if ranges:
+            self.text_area.delete(ranges[0], ranges[-1])
     
     ########################################################################
     # テキストの保存
@@ -448,12 +541,14 @@ class WhisperLiveGUI:
         """
         アプリケーション終了時の処理を行います。
         
-        - 録音中の場合は録音を停止
-        - メインウィンドウを破棄
+        - 録音中の場合は録音を停止し、残りの転写を待ってからメインウィンドウを破棄
+        - それ以外の場合はすぐにメインウィンドウを破棄
         """
         if self.is_recording:
+            self.close_requested = True
             self.toggle_recording()
-        self.root.destroy()
+        else:
+            self.root.destroy()
 
 ########################################################################
 # メイン関数
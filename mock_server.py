@@ -0,0 +1,453 @@
+import io
+import json
+import math
+import time
+import wave
+import random
+import hashlib
+import argparse
+import threading
+import collections
+import http.server
+from email.parser import BytesParser
+from email.policy import HTTP
+
+# 擬似転写に使用する単語
+VOCABULARY = {
+    'ja': ['今日は', '会議', 'について', '説明', 'します', '次に', '予算', 'の', '確認', 'を', '行い',
+           'ました', '資料', 'は', '共有', 'されて', 'います', '質問', 'が', 'あれば', 'どうぞ', '進捗', '報告'],
+    'en': ['today', 'we', 'will', 'review', 'the', 'budget', 'and', 'schedule', 'for', 'next',
+           'quarter', 'please', 'share', 'your', 'questions', 'team', 'update', 'project', 'meeting', 'notes'],
+}
+
+# WAV以外の形式で音声の長さを見積もるための1秒あたりのバイト数
+ESTIMATED_BYTES_PER_SECOND = {'.flac': 20000, '.ogg': 3000, '.opus': 3000, '.mp3': 4000}
+
+########################################################################
+# 応答遅延の分布
+########################################################################
+class LatencyModel:
+    """
+    擬似APIの応答遅延の分布
+    
+    "fixed:0.2", "uniform:0.1,0.8", "normal:0.5,0.1", "lognormal:-1.0,0.5", "exponential:0.3"
+    の形式で指定します（単位は秒）。音声1秒あたりの遅延を加えることもできます。
+    """
+    DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+    
+    def __init__(self, spec='fixed:0.2', per_audio_second=0.0):
+        """
+        引数:
+            spec (str, optional): 分布の指定
+            per_audio_second (float, optional): 音声1秒あたりに加える遅延（秒）
+        
+        例外:
+            ValueError: 分布の指定が正しくない場合
+        """
+        name, _, params = spec.partition(':')
+        if name not in self.DISTRIBUTIONS:
+            raise ValueError(f"未対応の遅延分布です: {name} (選択肢: {', '.join(self.DISTRIBUTIONS)})")
+        self.name = name
+        self.params = [float(value) for value in params.split(',')] if params else [0.0]
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exponential': 1}[name]
+        if len(self.params) != expected:
+            raise ValueError(f"{name} には {expected} 個のパラメータが必要です: {spec}")
+        self.per_audio_second = per_audio_second
+    
+    def sample(self, rng, audio_seconds=0.0):
+        """
+        遅延を1つ生成します
+        
+        引数:
+            rng (random.Random): 乱数生成器
+            audio_seconds (float, optional): 音声の長さ（秒）
+        
+        返値:
+            float: 遅延（秒, 0以上）
+        """
+        if self.name == 'fixed':
+            delay = self.params[0]
+        elif self.name == 'uniform':
+            delay = rng.uniform(*self.params)
+        elif self.name == 'normal':
+            delay = rng.gauss(*self.params)
+        elif self.name == 'lognormal':
+            delay = rng.lognormvariate(*self.params)
+        else:
+            delay = rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        return max(0.0, delay + self.per_audio_second * audio_seconds)
+
+
+########################################################################
+# 擬似転写
+########################################################################
+def audio_duration(audio_data, filename):
+    """
+    アップロードされた音声の長さを求めます（WAV以外はサイズから見積もります）
+    
+    引数:
+        audio_data (bytes): 音声データ
+        filename (str): multipart に記載されたファイル名
+    
+    返値:
+        float: 音声の長さ（秒）
+    """
+    try:
+        with wave.open(io.BytesIO(audio_data), 'rb') as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError):
+        pass
+    extension = filename[filename.rfind('.'):].lower() if '.' in filename else ''
+    return len(audio_data) / ESTIMATED_BYTES_PER_SECOND.get(extension, 4000)
+
+
+def fake_transcript(audio_data, audio_seconds, language='en', words_per_second=2.5):
+    """
+    音声データから決定的な擬似転写テキストを作成します
+    
+    同じ音声データに対しては常に同じテキストを返します。
+    
+    引数:
+        audio_data (bytes): 音声データ
+        audio_seconds (float): 音声の長さ（秒）
+        language (str, optional): 言語コード（ja 以外は英単語を使用）
+        words_per_second (float, optional): 1秒あたりの単語数
+    
+    返値:
+        str: 擬似転写テキスト
+    """
+    rng = random.Random(hashlib.sha256(audio_data).digest())
+    words = VOCABULARY['ja' if language == 'ja' else 'en']
+    count = max(1, int(math.ceil(audio_seconds * words_per_second)))
+    chosen = [rng.choice(words) for _ in range(count)]
+    if language == 'ja':
+        return ''.join(chosen) + '。'
+    return ' '.join(chosen).capitalize() + '.'
+
+
+########################################################################
+# MockWhisperServer クラス
+########################################################################
+class MockWhisperServer:
+    """
+    Whisper API の /v1/audio/transcriptions を模擬するローカルサーバー
+    
+    multipart/form-data の file / model / language / response_format を受け付け、
+    指定した遅延分布で待ってから決定的な擬似転写を返します。指定した割合で
+    429（Retry-After 付き）、500、タイムアウト（応答せずに待ち続ける）を発生させます。
+    GET /stats でリクエスト数・受け付けた接続数やステータスごとの件数を返します。
+    
+    Attributes:
+        url (str): APIのベースURL（--api_base に指定する値）
+        latency (LatencyModel): 応答遅延の分布
+    """
+    TRANSCRIPTIONS_PATH = '/v1/audio/transcriptions'
+    
+    def __init__(self, host='127.0.0.1', port=8000, latency='fixed:0.2', latency_per_second=0.0,
+                 rate_429=0.0, rate_500=0.0, rate_timeout=0.0, timeout_delay=120.0,
+                 retry_after=1, words_per_second=2.5, api_key=None, seed=None, on_received=None,
+                 debug_mode=False):
+        """
+        Args:
+            host (str, optional): 待ち受けアドレス. デフォルト "127.0.0.1"
+            port (int, optional): 待ち受けポート（0で空きポート）. デフォルト 8000
+            latency (str or LatencyModel, optional): 応答遅延の分布. デフォルト "fixed:0.2"
+            latency_per_second (float, optional): 音声1秒あたりに加える遅延（秒）. デフォルト 0.0
+            rate_429 (float, optional): 429 を返す割合 (0-1). デフォルト 0.0
+            rate_500 (float, optional): 500 を返す割合 (0-1). デフォルト 0.0
+            rate_timeout (float, optional): 応答しない割合 (0-1). デフォルト 0.0
+            timeout_delay (float, optional): 応答しない場合に接続を閉じるまでの時間（秒）. デフォルト 120.0
+            retry_after (float, optional): 429 の Retry-After ヘッダの値（秒）. デフォルト 1
+            words_per_second (float, optional): 擬似転写の1秒あたりの単語数. デフォルト 2.5
+            api_key (str, optional): 指定時はこのキー以外を 401 にする. デフォルト None（任意のキーを受け付ける）
+            seed (int, optional): 遅延とエラーの乱数シード. デフォルト None
+            on_received (callable, optional): 音声データを受信し終えた時点で (音声データ, time.monotonic()) を
+                受け取る関数（計測用）. デフォルト None
+            debug_mode (bool, optional): リクエストごとにログを表示する. デフォルト False
+        """
+        if rate_429 + rate_500 + rate_timeout > 1:
+            raise ValueError("エラーの割合の合計は 1 以下にしてください")
+        self.host = host
+        self.port = port
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency, latency_per_second)
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.rate_timeout = rate_timeout
+        self.timeout_delay = timeout_delay
+        self.retry_after = retry_after
+        self.words_per_second = words_per_second
+        self.api_key = api_key
+        self.on_received = on_received
+        self.debug_mode = debug_mode
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        
+        # 統計情報
+        self.requests = 0
+        self.connections = 0  # 受け付けたTCP接続数（keep-alive で再利用されていれば増えない）
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.audio_seconds = 0.0
+        self.status_counts = collections.Counter()
+    
+    @property
+    def url(self):
+        """APIのベースURL"""
+        return f"http://{self.host}:{self.port}/v1"
+    
+    def _debug(self, message):
+        """デバッグモードが有効な場合のみメッセージを表示します"""
+        if self.debug_mode:
+            print(f"[DEBUG] {message}")
+    
+    ########################################################################
+    # 起動と停止
+    ########################################################################
+    def start(self):
+        """別スレッドでリクエストの受け付けを開始します"""
+        self._httpd = _MockHTTPServer((self.host, self.port), _MockRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='mock-whisper', daemon=True).start()
+        print(f"擬似 Whisper API を起動しました: {self.url}")
+    
+    def stop(self):
+        """受け付けを停止します"""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+    
+    def stats(self):
+        """
+        リクエストの統計情報を返します
+        
+        返値:
+            dict: リクエスト数、受け付けた接続数、実行中の数とその最大値、ステータスごとの件数、受信した音声の長さ
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections': self.connections,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'audio_seconds': round(self.audio_seconds, 3),
+                'status': {str(code): count for code, count in sorted(self.status_counts.items(), key=lambda item: str(item[0]))},
+            }
+    
+    ########################################################################
+    # リクエスト処理
+    ########################################################################
+    def _draw(self, audio_seconds):
+        """このリクエストの結果（'429' / '500' / 'timeout' / None）と遅延を決めます"""
+        with self._lock:
+            r = self._rng.random()
+            delay = self.latency.sample(self._rng, audio_seconds)
+        if r < self.rate_429:
+            return '429', delay
+        if r < self.rate_429 + self.rate_500:
+            return '500', delay
+        if r < self.rate_429 + self.rate_500 + self.rate_timeout:
+            return 'timeout', delay
+        return None, delay
+    
+    def handle_transcription(self, handler):
+        """
+        POST /v1/audio/transcriptions を処理します
+        
+        引数:
+            handler (http.server.BaseHTTPRequestHandler): リクエストハンドラ
+        
+        返値:
+            tuple: (ステータスコード, ヘッダの dict, 本文の bytes)。応答しない場合は None
+        """
+        # 接続を使い回せるよう、エラー時も本文は読み切る
+        content_type = handler.headers.get('Content-Type', '')
+        body = handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+        authorization = handler.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer ') or (self.api_key and authorization[7:] != self.api_key):
+            return _error_response(401, "Incorrect API key provided", 'invalid_request_error', 'invalid_api_key')
+        if not content_type.startswith('multipart/form-data'):
+            return _error_response(400, "Expected multipart/form-data", 'invalid_request_error')
+        fields, audio_data, filename = _parse_multipart(content_type, body)
+        if audio_data is None:
+            return _error_response(400, "Missing file", 'invalid_request_error')
+        if not fields.get('model'):
+            return _error_response(400, "Missing model", 'invalid_request_error')
+        
+        if self.on_received:
+            self.on_received(audio_data, time.monotonic())
+        audio_seconds = audio_duration(audio_data, filename)
+        outcome, delay = self._draw(audio_seconds)
+        with self._lock:
+            self.audio_seconds += audio_seconds
+        
+        if outcome == 'timeout':
+            # 応答せずに待ってから接続を閉じる（クライアントの読み取りタイムアウトを発生させる）
+            time.sleep(self.timeout_delay)
+            return None
+        time.sleep(delay)
+        if outcome == '429':
+            status, headers, payload = _error_response(
+                429, "Rate limit reached for requests", 'requests', 'rate_limit_exceeded')
+            headers['Retry-After'] = str(self.retry_after)
+            return status, headers, payload
+        if outcome == '500':
+            return _error_response(500, "The server had an error while processing your request", 'server_error')
+        
+        language = fields.get('language') or 'en'
+        text = fake_transcript(audio_data, audio_seconds, language, self.words_per_second)
+        response_format = fields.get('response_format') or 'json'
+        if response_format == 'text':
+            return 200, {'Content-Type': 'text/plain; charset=utf-8'}, text.encode('utf-8')
+        result = {'text': text}
+        if response_format == 'verbose_json':
+            result.update({'task': 'transcribe', 'language': language, 'duration': round(audio_seconds, 3)})
+        return 200, {'Content-Type': 'application/json'}, json.dumps(result, ensure_ascii=False).encode('utf-8')
+    
+    def _record(self, status, started_at):
+        """リクエストの結果を統計に記録します"""
+        with self._lock:
+            self.status_counts[status] += 1
+        self._debug(f"{status} ({time.monotonic() - started_at:.3f}秒)")
+
+
+def _error_response(status, message, error_type, code=None):
+    """OpenAI API と同じ形式のエラー応答を作成します"""
+    payload = {'error': {'message': message, 'type': error_type, 'param': None, 'code': code}}
+    return status, {'Content-Type': 'application/json'}, json.dumps(payload).encode('utf-8')
+
+
+def _parse_multipart(content_type, body):
+    """
+    multipart/form-data を解析します
+    
+    返値:
+        tuple: (ファイル以外のフィールドの dict, file の内容（無い場合はNone）, file のファイル名)
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    fields = {}
+    audio_data = None
+    filename = ''
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        payload = part.get_payload(decode=True) or b''
+        if name == 'file':
+            audio_data = payload
+            filename = part.get_filename() or ''
+        elif name:
+            fields[name] = payload.decode('utf-8', 'replace')
+    return fields, audio_data, filename
+
+
+class _MockHTTPServer(http.server.ThreadingHTTPServer):
+    """受け付けたTCP接続の数を数える HTTP サーバー"""
+    
+    def process_request(self, request, client_address):
+        with self.mock._lock:
+            self.mock.connections += 1
+        super().process_request(request, client_address)
+
+
+class _MockRequestHandler(http.server.BaseHTTPRequestHandler):
+    """MockWhisperServer のリクエストハンドラ"""
+    protocol_version = 'HTTP/1.1'
+    
+    def do_POST(self):
+        mock = self.server.mock
+        if self.path.split('?')[0] != mock.TRANSCRIPTIONS_PATH:
+            self._send(*_error_response(404, "Not found", 'invalid_request_error'))
+            return
+        
+        started_at = time.monotonic()
+        with mock._lock:
+            mock.requests += 1
+            mock.in_flight += 1
+            mock.peak_in_flight = max(mock.peak_in_flight, mock.in_flight)
+        try:
+            response = mock.handle_transcription(self)
+        finally:
+            with mock._lock:
+                mock.in_flight -= 1
+        if response is None:
+            mock._record('timeout', started_at)
+            self.close_connection = True
+            return
+        mock._record(response[0], started_at)
+        self._send(*response)
+    
+    def do_GET(self):
+        if self.path.split('?')[0] == '/stats':
+            self._send(200, {'Content-Type': 'application/json'}, json.dumps(self.server.mock.stats()).encode('utf-8'))
+        else:
+            self._send(*_error_response(404, "Not found", 'invalid_request_error'))
+    
+    def _send(self, status, headers, payload):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass  # アクセスログは表示しない（--debug でリクエストごとの結果を表示）
+
+
+def main():
+    """メイン関数：コマンドライン引数を解析し、擬似 Whisper API を起動します"""
+    parser = argparse.ArgumentParser(description='WhisperLive - 負荷試験用の擬似 Whisper API サーバー')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='待ち受けアドレス (デフォルト: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='待ち受けポート (デフォルト: 8000)')
+    parser.add_argument('--latency', type=str, default='fixed:0.2',
+                        help='応答遅延の分布 (fixed:秒, uniform:最小,最大, normal:平均,標準偏差, '
+                             'lognormal:mu,sigma, exponential:平均, デフォルト: fixed:0.2)')
+    parser.add_argument('--latency_per_second', type=float, default=0.0,
+                        help='音声1秒あたりに加える遅延（秒, デフォルト: 0.0）')
+    parser.add_argument('--rate_429', type=float, default=0.0, help='429 を返す割合 (0-1, デフォルト: 0)')
+    parser.add_argument('--rate_500', type=float, default=0.0, help='500 を返す割合 (0-1, デフォルト: 0)')
+    parser.add_argument('--rate_timeout', type=float, default=0.0, help='応答しない割合 (0-1, デフォルト: 0)')
+    parser.add_argument('--timeout_delay', type=float, default=120.0,
+                        help='応答しない場合に接続を閉じるまでの時間（秒, デフォルト: 120）')
+    parser.add_argument('--retry_after', type=float, default=1,
+                        help='429 の Retry-After ヘッダの値（秒, デフォルト: 1）')
+    parser.add_argument('--words_per_second', type=float, default=2.5,
+                        help='擬似転写の1秒あたりの単語数 (デフォルト: 2.5)')
+    parser.add_argument('--api_key', type=str, help='指定時はこのAPIキー以外を 401 にする')
+    parser.add_argument('--seed', type=int, help='遅延とエラーの乱数シード')
+    parser.add_argument('--debug', action='store_true', help='リクエストごとの結果を表示')
+    
+    args = parser.parse_args()
+    
+    server = MockWhisperServer(
+        host=args.host,
+        port=args.port,
+        latency=LatencyModel(args.latency, args.latency_per_second),
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        rate_timeout=args.rate_timeout,
+        timeout_delay=args.timeout_delay,
+        retry_after=args.retry_after,
+        words_per_second=args.words_per_second,
+        api_key=args.api_key,
+        seed=args.seed,
+        debug_mode=args.debug
+    )
+    
+    try:
+        server.start()
+        while True:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print(f"\n擬似 Whisper API を停止します: {server.stats()}")
+    finally:
+        server.stop()
+
+########################################################################
+# エントリーポイント
+########################################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,649 @@
+import os
+import json
+import time
+import struct
+import argparse
+import threading
+import itertools
+import collections
+import socketserver
+from WhisperLive import (
+    AudioSegmenter, ResultSequencer, TranscriptionWorkerPool, WhisperHTTPClient,
+    WhisperAPIError, UPLOAD_CODECS, transcriptions_url, estimate_transcript_confidence,
+    RetryPolicy, CircuitBreaker, CircuitOpenError, call_with_retry
+)
+
+try:
+    from websockets.sync.server import serve as websocket_serve  # WebSocket で受け付ける場合のみ必要（任意）
+except ImportError:
+    websocket_serve = None
+
+# TCP フレーミングのメッセージ種別（1バイト）
+MESSAGE_HELLO = b'H'  # セッション情報 (JSON, 任意)
+MESSAGE_AUDIO = b'A'  # 16kHz・モノラル・16bit リトルエンディアンのPCM
+MESSAGE_END = b'E'    # ストリームの終端
+HEADER = struct.Struct('>cI')  # 種別(1バイト) + ペイロード長(4バイト, ビッグエンディアン)
+MAX_PAYLOAD = 1 << 20
+
+########################################################################
+# StreamSession クラス
+########################################################################
+class StreamSession:
+    """
+    サーバーに接続された1本の音声ストリーム
+    
+    ストリームごとにセグメント分割と結果の並べ替えを行い、転写結果を
+    クライアントに送り返します。転写自体はサーバー全体で共有するワーカープールで実行します。
+    
+    Attributes:
+        session_id (str): セッションID
+        language (str): 文字起こし対象の言語
+        segmenter (AudioSegmenter): このストリーム用のセグメント分割器
+        sequencer (ResultSequencer): このストリーム用の結果の並べ替え
+    """
+    def __init__(self, server, session_id, send, language=None):
+        """
+        引数:
+            server (TranscriptionServer): 所属するサーバー
+            session_id (str): セッションID
+            send (callable): クライアントにJSONメッセージ(dict)を送信する関数
+            language (str, optional): 言語コード. 未指定時はサーバーの既定値
+        """
+        self.server = server
+        self.session_id = session_id
+        self.language = language or server.language
+        self._send = send
+        self._send_lock = threading.Lock()
+        self.segmenter = AudioSegmenter(
+            frame_duration_ms=server.frame_duration_ms,
+            segment_length=server.segment_length,
+            energy_threshold=server.energy_threshold,
+            silence_duration=server.silence_duration,
+            sample_rate=server.sample_rate
+        )
+        self.sequencer = ResultSequencer(self._release, max_wait=server.reorder_max_wait)
+        self.sequencer.start()
+        self._next_sequence = 0
+        self._outstanding = 0
+        self._condition = threading.Condition()
+        self.started_at = time.monotonic()
+        
+        # 統計情報
+        self.audio_seconds = 0.0
+        self.segments = 0
+        self.skipped_silent = 0
+        self.transcribed = 0
+        self.failed = 0
+        self.latencies = collections.deque(maxlen=1000)
+    
+    def feed(self, pcm_data):
+        """
+        受信したPCMデータをセグメント分割します
+        
+        引数:
+            pcm_data (bytes): PCMデータ（長さは任意）
+        """
+        for segment in self.segmenter.feed_pcm(pcm_data):
+            self._submit(segment)
+        self.audio_seconds += len(pcm_data) / (self.server.sample_rate * 2)
+    
+    def finish(self, timeout=None):
+        """
+        ストリームの終端を処理し、このセッションの転写がすべて終わるまで待機します
+        
+        引数:
+            timeout (float, optional): 最大待機時間（秒）
+        """
+        segment = self.segmenter.flush()
+        if segment is not None:
+            self._submit(segment)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._outstanding:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        self.sequencer.stop()
+    
+    def _submit(self, segment):
+        """無音でなければ連番を付けて共有ワーカープールに投入します"""
+        is_silent, _, _ = self.segmenter.analyze_silence(segment)
+        if is_silent and self.server.skip_silence:
+            self.skipped_silent += 1
+            return
+        segment.sequence = self._next_sequence
+        self._next_sequence += 1
+        self.segments += 1
+        with self._condition:
+            self._outstanding += 1
+        if not self.server.worker_pool.submit((self, segment)):
+            self.complete(segment, None)
+    
+    def complete(self, segment, text, error=None):
+        """
+        セグメントの転写完了を記録します（ワーカースレッドから呼び出されます）
+        
+        引数:
+            segment (SpeechSegment): 転写したセグメント
+            text (str): 採用した転写結果。採用しなかった場合はNone
+            error (str, optional): 転写に失敗した理由。指定時はクライアントに error メッセージを送信します
+        """
+        if error is not None:
+            self.failed += 1
+            self.send({
+                'type': 'error',
+                'session': self.session_id,
+                'sequence': segment.sequence,
+                'start': round(segment.start_offset, 3),
+                'end': round(segment.end_offset, 3),
+                'message': error,
+            })
+        if text is not None:
+            self.latencies.append(time.monotonic() - segment.captured_at)
+            self.transcribed += 1
+        self.sequencer.submit(segment.sequence, (segment, text) if text is not None else None)
+        with self._condition:
+            self._outstanding -= 1
+            self._condition.notify_all()
+    
+    def _release(self, sequence, result, in_order):
+        """取り込み順に並べ替えた転写結果をクライアントに送信します"""
+        segment, text = result
+        self.send({
+            'type': 'transcript',
+            'session': self.session_id,
+            'sequence': sequence,
+            'text': text,
+            'start': round(segment.start_offset, 3),
+            'end': round(segment.end_offset, 3),
+            'latency': round(time.monotonic() - segment.captured_at, 3),
+            'in_order': in_order,
+        })
+    
+    def send(self, message):
+        """クライアントにJSONメッセージを送信します（送信エラーは無視）"""
+        with self._send_lock:
+            try:
+                self._send(message)
+            except Exception as e:
+                self.server._debug(f"[{self.session_id}] 送信に失敗しました: {e}")
+    
+    def stats(self):
+        """
+        セッションの統計情報を返します
+        
+        返値:
+            dict: 受信した音声秒数、セグメント数、転写までの遅延（平均/p50/p95/最大）など
+        """
+        latencies = sorted(self.latencies)
+        
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+        
+        return {
+            'session': self.session_id,
+            'elapsed': round(time.monotonic() - self.started_at, 1),
+            'audio_seconds': round(self.audio_seconds, 1),
+            'segments': self.segments,
+            'skipped_silent': self.skipped_silent,
+            'transcribed': self.transcribed,
+            'failed': self.failed,
+            'in_flight': self._outstanding,
+            'latency_avg': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+            'latency_max': round(latencies[-1], 3) if latencies else None,
+        }
+
+
+########################################################################
+# TCP ハンドラ
+########################################################################
+class _TCPStreamHandler(socketserver.BaseRequestHandler):
+    """
+    TCP のフレーミングプロトコルで1本の音声ストリームを受信します
+    
+    クライアント -> サーバー: [種別 1バイト][長さ 4バイト(BE)][ペイロード] の繰り返し
+    サーバー -> クライアント: 1行1メッセージのJSON
+    """
+    def handle(self):
+        server = self.server.transcription_server
+        stream = self.request.makefile('rb')
+        lock = threading.Lock()
+        
+        def send(message):
+            data = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+            with lock:
+                self.request.sendall(data)
+        
+        session = None
+        try:
+            while True:
+                header = stream.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                kind, length = HEADER.unpack(header)
+                if length > MAX_PAYLOAD:
+                    raise ValueError(f"ペイロードが大きすぎます: {length} bytes")
+                payload = stream.read(length)
+                if len(payload) < length:
+                    break
+                
+                if kind == MESSAGE_HELLO and session is None:
+                    info = json.loads(payload.decode('utf-8') or '{}')
+                    session = server.open_session(send, info.get('session'), info.get('language'))
+                elif kind == MESSAGE_AUDIO:
+                    if session is None:
+                        session = server.open_session(send)
+                    session.feed(payload)
+                elif kind == MESSAGE_END:
+                    break
+        except (OSError, ValueError) as e:
+            server._debug(f"TCP接続でエラーが発生しました ({self.client_address}): {e}")
+        finally:
+            if session is not None:
+                server.close_session(session)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+########################################################################
+# TranscriptionServer クラス
+########################################################################
+class TranscriptionServer:
+    """
+    多数の音声ストリームを1プロセスで文字起こしするサーバー
+    
+    TCP（独自のフレーミングプロトコル）または WebSocket で複数の PCM ストリームを受け付け、
+    ストリームごとに WhisperLiveTranscriber と同じエネルギーベースの分割を行います。
+    転写は全セッションで共有する1つのワーカープールと1つの HTTP 接続プールで実行します。
+    
+    Attributes:
+        host (str): 待ち受けアドレス
+        port (int): TCP の待ち受けポート
+        ws_port (int): WebSocket の待ち受けポート（None の場合は無効）
+        worker_pool (TranscriptionWorkerPool): 全セッションで共有するワーカープール
+        http_client (WhisperHTTPClient): 全セッションで共有する接続プール
+    """
+    
+    # セッション終了時に転写待ちセグメントの処理を待つ最大時間（秒）
+    SESSION_DRAIN_TIMEOUT = 60.0
+    
+    ########################################################################
+    # コンストラクタ
+    ########################################################################
+    def __init__(self, api_key, host='127.0.0.1', port=8765, ws_port=None,
+                 language='ja', sample_rate=16000, segment_length=10,
+                 energy_threshold=70, silence_duration=1.0,
+                 confidence_threshold=0.3, skip_silence=True, upload_codec='wav',
+                 num_workers=8, max_queue_size=32, overflow_policy='block',
+                 http_pool_size=None, connect_timeout=5.0, read_timeout=60.0, http2=True,
+                 reorder_max_wait=5.0, api_url=None, stats_interval=0,
+                 max_retries=3, request_deadline=60.0, circuit_threshold=5, circuit_recovery_time=30.0,
+                 debug_mode=False):
+        """
+        TranscriptionServerのインスタンスを初期化します。
+        
+        Args:
+            api_key (str): OpenAI APIキー
+            host (str, optional): 待ち受けアドレス. デフォルト "127.0.0.1"
+            port (int, optional): TCP の待ち受けポート. デフォルト 8765
+            ws_port (int, optional): WebSocket の待ち受けポート. デフォルト None（無効）
+            language (str, optional): 既定の言語（セッションごとに上書き可能）. デフォルト "ja"
+            sample_rate (int, optional): 受信するPCMのサンプリングレート. デフォルト 16000
+            segment_length (int, optional): 1セグメントの最大長さ（秒）. デフォルト 10
+            energy_threshold (int, optional): 無音判定の閾値. デフォルト 70
+            silence_duration (float, optional): 無音とみなす最小の長さ（秒）. デフォルト 1.0
+            confidence_threshold (float, optional): 確信度の閾値. デフォルト 0.3
+            skip_silence (bool, optional): 無音区間スキップの有効/無効. デフォルト True
+            upload_codec (str, optional): アップロード時のコーデック. デフォルト "wav"（セッション数が多いため ffmpeg を起動しない）
+            num_workers (int, optional): 全セッション合計の同時転写数. デフォルト 8
+            max_queue_size (int, optional): 全セッション合計の転写待ち上限. デフォルト 32
+            overflow_policy (str, optional): 転写待ちが上限に達したときの動作 (block/drop_oldest). デフォルト "block"
+            http_pool_size (int, optional): API接続プールの最大接続数. デフォルト num_workers と同数
+            connect_timeout (float, optional): API接続タイムアウト（秒）. デフォルト 5.0
+            read_timeout (float, optional): API応答の読み取りタイムアウト（秒）. デフォルト 60.0
+            http2 (bool, optional): 利用可能であれば HTTP/2 を使用する. デフォルト True
+            reorder_max_wait (float, optional): 前のセグメントの結果を待つ最大時間（秒）. デフォルト 5.0
+            api_url (str, optional): Whisper API のエンドポイント. 未指定時は環境変数 OPENAI_BASE_URL、なければ OpenAI
+            stats_interval (float, optional): セッション統計を表示する間隔（秒, 0で無効）. デフォルト 0
+            max_retries (int, optional): 429・5xx・タイムアウト・接続エラー時の再試行回数. デフォルト 3
+            request_deadline (float, optional): 1セグメントの転写（再試行を含む）にかける最大時間（秒）. デフォルト 60.0
+            circuit_threshold (int, optional): APIの呼び出しを一時停止するまでの連続失敗回数（0 で無効）. デフォルト 5
+            circuit_recovery_time (float, optional): 呼び出しを停止してから再開を試すまでの時間（秒）. デフォルト 30.0
+            debug_mode (bool, optional): デバッグモードの有効/無効. デフォルト False
+        """
+        if upload_codec not in UPLOAD_CODECS:
+            raise ValueError(f"未対応のコーデックです: {upload_codec} (選択肢: {', '.join(UPLOAD_CODECS)})")
+        if overflow_policy == 'merge':
+            # 共有キューには複数セッションのセグメントが混在するため連結できない
+            raise ValueError("サーバーモードでは merge は使用できません (block/drop_oldest)")
+        
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.ws_port = ws_port
+        self.language = language
+        self.sample_rate = sample_rate
+        self.segment_length = segment_length
+        self.energy_threshold = energy_threshold
+        self.silence_duration = silence_duration
+        self.confidence_threshold = confidence_threshold
+        self.skip_silence = skip_silence
+        self.codec = UPLOAD_CODECS[upload_codec]()
+        self.reorder_max_wait = reorder_max_wait
+        self.api_url = api_url or transcriptions_url()
+        self.stats_interval = stats_interval
+        self.read_timeout = read_timeout
+        self.retry_policy = RetryPolicy(max_attempts=max_retries + 1, deadline=request_deadline)
+        self.circuit_breaker = CircuitBreaker(circuit_threshold, circuit_recovery_time) if circuit_threshold > 0 else None
+        self.debug_mode = debug_mode
+        
+        # フレーム設定
+        self.frame_duration_ms = 20
+        self.frames_per_buffer = int(sample_rate * self.frame_duration_ms / 1000)
+        
+        # 全セッションで共有する接続プールとワーカープール
+        self.http_client = WhisperHTTPClient(
+            pool_size=http_pool_size or num_workers,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            http2=http2
+        )
+        self.worker_pool = TranscriptionWorkerPool(
+            self._transcribe,
+            num_workers=num_workers,
+            max_queue_size=max_queue_size,
+            overflow_policy=overflow_policy,
+            on_drop=self._drop_segment,
+            on_error=self._on_worker_error,
+            name='server-transcribe'
+        )
+        
+        self.sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._session_ids = itertools.count(1)
+        self._tcp_server = None
+        self._ws_server = None
+        self._running = False
+    
+    def _debug(self, message):
+        """デバッグモードが有効な場合のみメッセージを表示します"""
+        if self.debug_mode:
+            print(f"[DEBUG] {message}")
+    
+    ########################################################################
+    # セッション管理
+    ########################################################################
+    def open_session(self, send, session_id=None, language=None):
+        """
+        新しいセッションを登録します
+        
+        引数:
+            send (callable): クライアントにJSONメッセージを送信する関数
+            session_id (str, optional): クライアントが指定したセッションID
+            language (str, optional): 言語コード
+        
+        返値:
+            StreamSession: 作成したセッション
+        """
+        with self._sessions_lock:
+            session_id = str(session_id or f"session-{next(self._session_ids)}")
+            if session_id in self.sessions:
+                session_id = f"{session_id}-{next(self._session_ids)}"
+            session = StreamSession(self, session_id, send, language)
+            self.sessions[session_id] = session
+        self._debug(f"セッション開始: {session_id}")
+        session.send({'type': 'session', 'session': session_id})
+        return session
+    
+    def close_session(self, session):
+        """
+        ストリームの終端を処理し、統計情報を送信してセッションを削除します
+        
+        引数:
+            session (StreamSession): 終了するセッション
+        """
+        session.finish(timeout=self.SESSION_DRAIN_TIMEOUT)
+        stats = session.stats()
+        session.send({'type': 'end', 'session': session.session_id, 'stats': stats})
+        with self._sessions_lock:
+            self.sessions.pop(session.session_id, None)
+        self._debug(f"セッション終了: {stats}")
+    
+    def session_stats(self):
+        """
+        すべてのセッションの統計情報を返します
+        
+        返値:
+            list: セッションごとの統計情報
+        """
+        with self._sessions_lock:
+            sessions = list(self.sessions.values())
+        return [session.stats() for session in sessions]
+    
+    ########################################################################
+    # 転写
+    ########################################################################
+    def _transcribe(self, item):
+        """共有ワーカープールから呼び出され、1セグメントを転写します"""
+        session, segment = item
+        text = None
+        error = None
+        try:
+            audio_data = self.codec.encode(segment.pcm, self.sample_rate)
+            transcription = call_with_retry(
+                lambda read_timeout: self.http_client.transcribe(
+                    self.api_url, self.api_key, audio_data,
+                    filename=self.codec.filename, mime_type=self.codec.mime_type,
+                    language=session.language, read_timeout=read_timeout
+                ),
+                self.retry_policy, self.circuit_breaker, self.read_timeout,
+                on_retry=lambda attempt, delay, e: self._debug(
+                    f"[{session.session_id}] {delay:.1f}秒後に再試行します ({attempt}回目): {e}")
+            )
+            if transcription and transcription.strip():
+                if estimate_transcript_confidence(transcription) >= self.confidence_threshold:
+                    text = transcription
+        except CircuitOpenError as e:
+            error = str(e)
+            self._debug(f"[{session.session_id}] {e}")
+        except WhisperAPIError as e:
+            error = f"APIエラー: {e.status_code}"
+            self._debug(f"[{session.session_id}] APIエラー: {e.status_code}, {e.body}")
+        except Exception as e:
+            error = f"転写中にエラーが発生しました: {e}"
+            self._debug(f"[{session.session_id}] 転写中にエラーが発生しました: {e}")
+        finally:
+            session.complete(segment, text, error)
+    
+    def _drop_segment(self, item):
+        """転写待ちから破棄されたセグメントを記録します（drop_oldest 時）"""
+        session, segment = item
+        self._debug(f"[{session.session_id}] 転写待ちが上限に達したためセグメントを破棄しました (#{segment.sequence})")
+        session.complete(segment, None)
+    
+    def _on_worker_error(self, item, error):
+        """転写処理で捕捉されなかった例外を表示します（デバッグモード時はスタックトレースも表示）"""
+        import traceback
+        session, segment = item
+        self._debug(f"[{session.session_id}] セグメント #{segment.sequence} の処理中に予期しないエラーが発生しました: {error}")
+        if self.debug_mode:
+            traceback.print_exc()
+    
+    ########################################################################
+    # WebSocket ハンドラ
+    ########################################################################
+    def _handle_websocket(self, websocket):
+        """
+        WebSocket で1本の音声ストリームを受信します
+        
+        バイナリメッセージはPCM、テキストメッセージはJSON
+        （{"type": "hello", "session": ..., "language": ...} または {"type": "end"}）として扱います。
+        """
+        def send(message):
+            websocket.send(json.dumps(message, ensure_ascii=False))
+        
+        session = None
+        try:
+            for message in websocket:
+                if isinstance(message, bytes):
+                    if session is None:
+                        session = self.open_session(send)
+                    session.feed(message)
+                    continue
+                info = json.loads(message)
+                if info.get('type') == 'hello' and session is None:
+                    session = self.open_session(send, info.get('session'), info.get('language'))
+                elif info.get('type') == 'end':
+                    break
+        except Exception as e:
+            self._debug(f"WebSocket接続でエラーが発生しました: {e}")
+        finally:
+            if session is not None:
+                self.close_session(session)
+    
+    ########################################################################
+    # 起動と停止
+    ########################################################################
+    def start(self):
+        """
+        ワーカープールを起動し、別スレッドで接続の受け付けを開始します
+        
+        Raises:
+            RuntimeError: WebSocket が指定されたが websockets がインストールされていない場合
+        """
+        if self.ws_port is not None and websocket_serve is None:
+            raise RuntimeError("WebSocket を使用するには websockets が必要です: pip install websockets")
+        
+        self.worker_pool.start()
+        self._running = True
+        
+        self._tcp_server = _ThreadingTCPServer((self.host, self.port), _TCPStreamHandler)
+        self._tcp_server.transcription_server = self
+        self.port = self._tcp_server.server_address[1]
+        threading.Thread(target=self._tcp_server.serve_forever, name='server-tcp', daemon=True).start()
+        print(f"TCP で待ち受けています: {self.host}:{self.port}")
+        
+        if self.ws_port is not None:
+            self._ws_server = websocket_serve(self._handle_websocket, self.host, self.ws_port)
+            threading.Thread(target=self._ws_server.serve_forever, name='server-ws', daemon=True).start()
+            print(f"WebSocket で待ち受けています: ws://{self.host}:{self.ws_port}")
+        
+        if self.stats_interval:
+            threading.Thread(target=self._report_stats, name='server-stats', daemon=True).start()
+    
+    def _report_stats(self):
+        """一定間隔でワーカープールとセッションごとの統計情報を表示します"""
+        while self._running:
+            time.sleep(self.stats_interval)
+            pool = self.worker_pool.stats()
+            print(f"[STATS] セッション数={len(self.sessions)}, 転写待ち={pool['queue_depth']}/{pool['max_queue_size']}, "
+                  f"実行中={pool['busy_workers']}/{pool['num_workers']}, 稼働率={pool['utilization']:.2f}")
+            for stats in self.session_stats():
+                print(f"[STATS] {stats['session']}: 音声={stats['audio_seconds']}秒, 転写={stats['transcribed']}/{stats['segments']}, "
+                      f"遅延 p50={stats['latency_p50']} p95={stats['latency_p95']} 最大={stats['latency_max']}")
+    
+    def stop(self):
+        """接続の受け付けを停止し、転写待ちのセグメントを処理し終えてから終了します"""
+        self._running = False
+        if self._tcp_server is not None:
+            self._tcp_server.shutdown()
+            self._tcp_server.server_close()
+        if self._ws_server is not None:
+            self._ws_server.shutdown()
+        self.worker_pool.stop(drain=True, timeout=self.SESSION_DRAIN_TIMEOUT)
+        self.http_client.close()
+
+
+def main():
+    """メイン関数：コマンドライン引数を解析し、サーバーを起動します"""
+    parser = argparse.ArgumentParser(description='WhisperLive - 複数ストリーム転写サーバー')
+    parser.add_argument('--api_key', type=str, help='OpenAI API Key')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='待ち受けアドレス (デフォルト: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP の待ち受けポート (デフォルト: 8765)')
+    parser.add_argument('--ws_port', type=int, help='WebSocket の待ち受けポート (websockets が必要, 既定では無効)')
+    parser.add_argument('--language', type=str, default='ja', help='既定の言語コード (デフォルト: ja)')
+    parser.add_argument('--segment_length', type=int, default=10,
+                        help='1セグメントの最大長さ（秒, デフォルト: 10）')
+    parser.add_argument('--energy_threshold', type=int, default=70,
+                        help='無音判定の閾値 0-1000 (低いほど敏感, デフォルト: 70)')
+    parser.add_argument('--silence_duration', type=float, default=1.0,
+                        help='無音とみなす最小の長さ（秒, デフォルト: 1.0）')
+    parser.add_argument('--confidence_threshold', type=float, default=0.3,
+                        help='転写結果の確信度閾値 (0-1, デフォルト: 0.3)')
+    parser.add_argument('--no_skip_silence', action='store_true',
+                        help='無音区間スキップを無効化 (すべてのセグメントをAPIに送信)')
+    parser.add_argument('--upload_codec', type=str, default='wav', choices=list(UPLOAD_CODECS),
+                        help='アップロード時のコーデック (デフォルト: wav)')
+    parser.add_argument('--num_workers', type=int, default=8,
+                        help='全セッション合計の同時転写数 (デフォルト: 8)')
+    parser.add_argument('--max_queue_size', type=int, default=32,
+                        help='全セッション合計の転写待ち上限 (デフォルト: 32)')
+    parser.add_argument('--overflow_policy', type=str, default='block', choices=['block', 'drop_oldest'],
+                        help='転写待ちが上限に達したときの動作 (デフォルト: block)')
+    parser.add_argument('--api_base', type=str,
+                        help='APIのベースURL (例: http://127.0.0.1:8000/v1, デフォルト: 環境変数 OPENAI_BASE_URL または OpenAI)')
+    parser.add_argument('--max_retries', type=int, default=3,
+                        help='429・5xx・タイムアウト・接続エラー時の再試行回数 (デフォルト: 3)')
+    parser.add_argument('--request_deadline', type=float, default=60.0,
+                        help='1セグメントの転写（再試行を含む）にかける最大時間（秒, デフォルト: 60）')
+    parser.add_argument('--circuit_threshold', type=int, default=5,
+                        help='APIの呼び出しを一時停止するまでの連続失敗回数 (0で無効, デフォルト: 5)')
+    parser.add_argument('--circuit_recovery_time', type=float, default=30.0,
+                        help='呼び出しを停止してから再開を試すまでの時間（秒, デフォルト: 30）')
+    parser.add_argument('--stats_interval', type=float, default=30,
+                        help='セッション統計を表示する間隔（秒, 0で無効, デフォルト: 30）')
+    parser.add_argument('--debug', action='store_true',
+                        help='デバッグモードを有効化 (詳細なログを表示)')
+    
+    args = parser.parse_args()
+    
+    api_key = args.api_key or os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        api_key = input("OpenAI API Keyを入力してください: ")
+    
+    server = TranscriptionServer(
+        api_key=api_key,
+        host=args.host,
+        port=args.port,
+        ws_port=args.ws_port,
+        language=args.language,
+        segment_length=args.segment_length,
+        energy_threshold=args.energy_threshold,
+        silence_duration=args.silence_duration,
+        confidence_threshold=args.confidence_threshold,
+        skip_silence=not args.no_skip_silence,
+        upload_codec=args.upload_codec,
+        num_workers=args.num_workers,
+        max_queue_size=args.max_queue_size,
+        overflow_policy=args.overflow_policy,
+        api_url=transcriptions_url(args.api_base),
+        stats_interval=args.stats_interval,
+        max_retries=args.max_retries,
+        request_deadline=args.request_deadline,
+        circuit_threshold=args.circuit_threshold,
+        circuit_recovery_time=args.circuit_recovery_time,
+        debug_mode=args.debug
+    )
+    
+    try:
+        server.start()
+        while True:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("\nサーバーを停止します...")
+    finally:
+        server.stop()
+
+########################################################################
+# エントリーポイント
+########################################################################
+if __name__ == "__main__":
+    main()